@@ -1,19 +1,30 @@
 from io import StringIO
 
 import rdf_utils
+import external_sort
+import evaluation_checkpoint
+import policy_cache
 from rdf_utils import extract_rule_list_from_policy, extract_features_list_from_policy
 import pandas as pd
+import numpy as np
 import os
-import shutil
 import json
-import math
 import operator
+import copy
+import itertools
 import re
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 # if dateutil is not install then install it using (!pip install python-dateutil)
 from dateutil import parser
-import uuid
+import hashlib
+import functools
+import bisect
+from concurrent.futures import ProcessPoolExecutor
+
+def is_any_of(values, right):
+    return not values.isdisjoint(right)
+
 
 OPS_MAP = {
     "http://www.w3.org/ns/odrl/2/eq": operator.eq,
@@ -22,21 +33,23 @@ OPS_MAP = {
     "http://www.w3.org/ns/odrl/2/lteq": operator.le,
     "http://www.w3.org/ns/odrl/2/gt": operator.gt,
     "http://www.w3.org/ns/odrl/2/gteq": operator.ge,
-    # Missing operators:
-    # odrl.isAnyOf: lambda a, b: a in b,
-    # odrl.isNoneOf: lambda a, b: a not in b,
-    # odrl.hasPart: lambda a, b: all(item in a for item in b) if isinstance(b, list) else b in a,
-    # odrl.isPartOf: lambda a, b: all(item in b for item in a) if isinstance(a, list) else a in b,
-    # odrl.isAllOf: lambda a, b: set(a) == set(b) if isinstance(a, list) and isinstance(b, list) else False,
+    # Set operators relate the set of values of a cell to the set of values of the right operand
+    # (see compile_set_comparison)
+    "http://www.w3.org/ns/odrl/2/isAnyOf": is_any_of,
+    "http://www.w3.org/ns/odrl/2/isNoneOf": frozenset.isdisjoint,
+    "http://www.w3.org/ns/odrl/2/hasPart": operator.ge,
+    "http://www.w3.org/ns/odrl/2/isPartOf": operator.le,
+    "http://www.w3.org/ns/odrl/2/isAllOf": operator.eq,
 }
 
-def evaluate_ODRL_from_files_merge_policies(policy_files, SotW_file):
+def evaluate_ODRL_from_files_merge_policies(policy_files, SotW_file, engine="rows", memory_budget_mb=None):
     graph_rules = []
     features = []
     for file in policy_files:
         graph = rdf_utils.load(file)[0]
-        graph_rules.append(extract_rule_list_from_policy(graph))
-        features.append(extract_features_list_from_policy(graph))
+        graph_policies, graph_features = rdf_utils.extract_rules_and_features_from_policy(graph)
+        graph_rules.append(graph_policies)
+        features.append(graph_features)
 
     # temporary merge code, TODO should be updated when a more stable merge function is created
     merged_permissions = []
@@ -63,9 +76,14 @@ def evaluate_ODRL_from_files_merge_policies(policy_files, SotW_file):
             if iri not in merged_feature_map:
                 merged_feature_map[iri] = f["type"]
 
+    if memory_budget_mb is not None:
+        return evaluate_ODRL_on_csv_out_of_core(
+            merged_graph_rules[0], SotW_file, merged_feature_map, memory_budget_mb=memory_budget_mb, engine=engine
+        )
+
     df = pd.read_csv(SotW_file)
 
-    return evaluate_ODRL_on_dataframe(merged_graph_rules[0], df, merged_feature_map)
+    return evaluate_ODRL_on_dataframe(merged_graph_rules[0], df, merged_feature_map, engine=engine)
 
 def eval_count(value, constraint, OPS_MAP):
     left, op_symbol, right = constraint
@@ -73,7 +91,8 @@ def eval_count(value, constraint, OPS_MAP):
     if left != "http://www.w3.org/ns/odrl/2/count":
         return False
 
-    if op_symbol not in OPS_MAP:
+    # counts are numbers, not sets
+    if op_symbol not in OPS_MAP or op_symbol in SET_OPERATORS:
         return False
 
     try:
@@ -156,7 +175,7 @@ def eval_constraint(row, rule, constraint, OPS_MAP, FEATURE_TYPE_MAP):
 
     if left == "http://www.w3.org/ns/odrl/2/count":
 
-        if op_symbol not in OPS_MAP:
+        if op_symbol not in OPS_MAP or op_symbol in SET_OPERATORS:
             return False
         try:
             current_count = rule.get("matches_count", 0)
@@ -191,6 +210,10 @@ def eval_constraint(row, rule, constraint, OPS_MAP, FEATURE_TYPE_MAP):
     if op_symbol not in OPS_MAP:
         return False
 
+    # --- Set operators ---
+    if op_symbol in SET_OPERATORS:
+        return compile_set_comparison(op_symbol, right, left, OPS_MAP, FEATURE_TYPE_MAP)["predicate"](value)
+
     column_type = FEATURE_TYPE_MAP.get(left)
 
     # TODO: fix issues with timezones.
@@ -240,15 +263,22 @@ def initialise_evaluation_state(policy):
         policy = policy[0]
 
     def init_rule(rule):
-        return {
-            "rule_id": rule.get("id", str(uuid.uuid4())),
+        # the rules may be shared by the policy cache, the state gets its own conditions
+        rule_state = {
+            "rule_id": rule.get("id"),
             "matches_count": 0,
             "earliestMatch": None,
             "latestMatch": None,
-            "conditions": rule.get("conditions", []),
+            "conditions": copy.deepcopy(rule.get("conditions", [])),
             "required": 0
         }
 
+        windows = rule_windows(rule.get("conditions", []))
+        if windows:
+            rule_state["windows"] = windows
+
+        return rule_state
+
     def init_duty(duty):
         return {
             **init_rule(duty),
@@ -282,8 +312,210 @@ def initialise_evaluation_state(policy):
     for ob in policy.get("obligations", []):
         state["obligations"].append(init_rule(ob))
 
+    for rule_id, rule_state in state_rule_ids(state):
+        if rule_state["rule_id"] is None:
+            rule_state["rule_id"] = rule_id
+
     return state
 
+# ----------------------------------------
+# RULE IDS AND COMPACT EVALUATION STATE
+# ----------------------------------------
+# A full evaluation state repeats the conditions of every rule, so its size grows with the policy
+# rather than with what was observed. The compact state only holds the counters, match times and
+# required flags of the rules, keyed by rule ids derived from the rule content, so that it can be
+# matched back to the rules of a recompiled policy (or of the full state it was taken from).
+
+CHILD_RULE_KEYS = ("duties", "consequences", "remedies")
+
+# Dynamic fields of a rule state, with their values before any match
+RULE_STATE_FIELDS = {"matches_count": 0, "earliestMatch": None, "latestMatch": None, "required": 0}
+
+
+def canonical_condition(constraint):
+    """
+    Constraint with the operands of logic constraints in a fixed order, except for andSequence
+    where the order is part of the constraint, and with set right operands sorted.
+    """
+    if is_logic_constraint(constraint):
+        subs = [canonical_condition(sub) for sub in constraint[1]]
+        if not constraint[0].endswith("andSequence"):
+            subs.sort(key=lambda sub: json.dumps(sub, default=str))
+        return [constraint[0], subs]
+    if isinstance(constraint, list) and len(constraint) == 3 and (
+            isinstance(constraint[2], (set, frozenset))
+            or (constraint[1] in SET_OPERATORS and isinstance(constraint[2], (list, tuple)))
+    ):
+        # sets print in an order that changes between processes
+        return [constraint[0], constraint[1], sorted(str(value) for value in constraint[2])]
+    return constraint
+
+
+def rule_content_hash(kind, rule):
+    """
+    Hash of the conditions of a rule (in any order) and of its nested rules. Policies extracted
+    in different processes list the same rules in different orders, the hash does not depend on it.
+    """
+    conditions = rule.get("conditions", [])
+    if isinstance(conditions, list):
+        conditions = sorted(json.dumps(canonical_condition(c), default=str) for c in conditions)
+
+    children = sorted(
+        rule_content_hash(key, child)
+        for key in CHILD_RULE_KEYS
+        for child in rule.get(key, [])
+    )
+
+    payload = json.dumps([kind, conditions, children], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def state_rule_ids(evaluation_state):
+    """
+    Content derived ids of the rule states of a policy or evaluation state, as (rule_id, rule)
+    pairs in the order of rule_states_in_order. Nested rules are identified within their parent,
+    identical sibling rules by their position among the identical ones.
+    """
+    pairs = []
+
+    def visit(kind, rules, parent_id):
+        seen = {}
+        for rule in rules:
+            base = rule_content_hash(kind, rule)
+            if parent_id is not None:
+                base = hashlib.sha256(f"{parent_id}/{base}".encode("utf-8")).hexdigest()[:16]
+
+            occurrence = seen.get(base, 0)
+            seen[base] = occurrence + 1
+            rule_id = base if occurrence == 0 else f"{base}-{occurrence}"
+
+            pairs.append((rule_id, rule))
+
+            for key in CHILD_RULE_KEYS:
+                visit(key, rule.get(key, []), rule_id)
+
+    # same order as rule_states_in_order: permissions and their duties, prohibitions, obligations
+    visit("permissions", evaluation_state.get("permissions", []), None)
+    visit("prohibitions", evaluation_state.get("prohibitions", []), None)
+    visit("obligations", evaluation_state.get("obligations", []), None)
+
+    return pairs
+
+
+def policy_hash(evaluation_state, rule_ids=None):
+    """
+    Hash of a policy (or of the policy of a full evaluation state) from its IRI and rule ids.
+    """
+    if rule_ids is None:
+        rule_ids = state_rule_ids(evaluation_state)
+    rule_ids = sorted(rule_id for rule_id, _ in rule_ids)
+    payload = json.dumps([evaluation_state.get("policy_iri"), rule_ids], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def is_compact_evaluation_state(evaluation_state):
+    return isinstance(evaluation_state, dict) and "rules" in evaluation_state and "permissions" not in evaluation_state
+
+
+def compact_evaluation_state(evaluation_state, rule_ids=None, iso_times=True):
+    """
+    Compact form of a full evaluation state: the dynamic fields of the rules that matched or are
+    required (with their sliding windows, if any), keyed by rule id, and the rows violating the
+    policy. Match times are ISO strings unless iso_times is False. rule_ids optionally gives the
+    result of state_rule_ids for the state, which does not change while the state is updated.
+    """
+    if rule_ids is None:
+        rule_ids = state_rule_ids(evaluation_state)
+
+    rules = {}
+
+    for rule_id, rule_state in rule_ids:
+        fields = {}
+        for field, initial in RULE_STATE_FIELDS.items():
+            value = rule_state.get(field, initial)
+            if iso_times and hasattr(value, "isoformat"):
+                value = value.isoformat()
+            fields[field] = value
+
+        windows = rule_state.get("windows")
+        if windows and any(window["head"] is not None for window in windows.values()):
+            fields["windows"] = {key: {**window, "counts": list(window["counts"])} for key, window in windows.items()}
+
+        if fields != RULE_STATE_FIELDS:
+            rules[rule_id] = fields
+
+    return {
+        "policy_iri": evaluation_state.get("policy_iri"),
+        "policy_hash": policy_hash(evaluation_state, rule_ids),
+        "rules": rules,
+        "rows_violating_permissions": list(evaluation_state.get("rows_violating_permissions", [])),
+        "rows_violating_prohibitions": list(evaluation_state.get("rows_violating_prohibitions", [])),
+    }
+
+
+def expand_evaluation_state(compact_state, policy):
+    """
+    Full evaluation state of a policy with the dynamic fields of a compact state. Rules are
+    matched by id, so the rules of a changed policy that are still there keep their state and
+    new rules start from scratch.
+    """
+    evaluation_state = initialise_evaluation_state(policy)
+    rules = compact_state.get("rules", {})
+
+    for rule_id, rule_state in state_rule_ids(evaluation_state):
+        if rule_id in rules:
+            for field, initial in RULE_STATE_FIELDS.items():
+                rule_state[field] = rules[rule_id].get(field, initial)
+            if "windows" in rules[rule_id]:
+                rule_state["windows"] = copy.deepcopy(rules[rule_id]["windows"])
+
+    evaluation_state["rows_violating_permissions"] = list(compact_state.get("rows_violating_permissions", []))
+    evaluation_state["rows_violating_prohibitions"] = list(compact_state.get("rows_violating_prohibitions", []))
+
+    return evaluation_state
+
+
+def read_state_file(state_file):
+    """
+    Evaluation state saved in a file, either as JSON or as a binary checkpoint (see
+    evaluation_checkpoint.py).
+    """
+    if evaluation_checkpoint.is_checkpoint_file(state_file):
+        return evaluation_checkpoint.read_checkpoint(state_file)
+
+    with open(state_file, "r") as f:
+        return json.load(f)
+
+
+def state_json_default(value):
+    """
+    default of json.dumps for full evaluation states: set right operands become sorted lists, which
+    are evaluated as the same sets, and match times become strings.
+    """
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return str(value)
+
+
+def load_evaluation_state(evaluation_state, policy):
+    """
+    Evaluation state of a policy from None (a new evaluation), a full or compact state, or its
+    JSON string.
+    """
+    if isinstance(policy, list):
+        policy = policy[0]
+
+    if isinstance(evaluation_state, str):
+        evaluation_state = json.loads(evaluation_state)
+
+    if evaluation_state is None:
+        return initialise_evaluation_state(policy)
+
+    if is_compact_evaluation_state(evaluation_state):
+        return expand_evaluation_state(evaluation_state, policy)
+
+    return evaluation_state
+
 def check_match(row, rule_state, OPS_MAP, FEATURE_TYPE_MAP):
 
     if eval_rule(row, rule_state, OPS_MAP, FEATURE_TYPE_MAP):
@@ -310,318 +542,2835 @@ def check_match(row, rule_state, OPS_MAP, FEATURE_TYPE_MAP):
 
     return False
 
-def evaluate_ODRL_on_df(ODRL_graph, df, evaluation_state=None):
-    features = (
-        extract_features_list_from_policy(
-            ODRL_graph
-        )
-    )
+# ----------------------------------------
+# COMPILED RULE PLANS
+# ----------------------------------------
+# eval_constraint interprets every [left, op, right] triple again for every row: it resolves the
+# left operand against the row, decides whether the comparison is a date, numeric or string one,
+# and parses the right operand. The functions below do this work once per policy and return
+# closures that only read the row values they need. They follow the same semantics as
+# eval_constraint / check_match.
 
-    policies = (
-        extract_rule_list_from_policy(
-            ODRL_graph
-        )
-    )
+DT_COL = "http://www.w3.org/ns/odrl/2/dateTime"
+COUNT_OPERAND = "http://www.w3.org/ns/odrl/2/count"
+XSD_DATETIME = "http://www.w3.org/2001/XMLSchema#dateTime"
+SH_IRI = "http://www.w3.org/ns/shacl#IRI"
 
-    feature_type_map = {
-        f["iri"]: f["type"]
-        for f in features
-    }
+# "deduplicated" is the row engine with a cache of the rules matched by each distinct row
+ENGINES = ("rows", "deduplicated", "vectorized")
+EQUALITY_OPERATORS = ("http://www.w3.org/ns/odrl/2/eq", "http://www.w3.org/ns/odrl/2/neq")
+SET_OPERATORS = rdf_utils.SET_OPERATORS
 
-    return evaluate_ODRL_on_dataframe(
-        policies[0],
-        df,
-        feature_type_map
+
+def _never(values):
+    return False
+
+
+def is_logic_constraint(constraint):
+    return (
+            isinstance(constraint, list)
+            and len(constraint) == 2
+            and isinstance(constraint[0], str)
+            and isinstance(constraint[1], list)
     )
 
 
-def evaluate_ODRL_on_dataframe(policy, df, FEATURE_TYPE_MAP, evaluation_state=None):
+def constraint_key(constraint):
+    """
+    Hashable key of a constraint or logic constraint, equal for constraints that always give the
+    same result. 1 and 1.0 are equal keys but compare differently as strings, so the type of a
+    right operand is part of the key. Returns None for constraints that cannot be keyed.
+    """
+    try:
+        if is_logic_constraint(constraint):
+            subkeys = tuple(constraint_key(sub) for sub in constraint[1])
+            if None in subkeys:
+                return None
+            return (constraint[0], subkeys)
+
+        left, op_symbol, right = constraint
+        key = (left, op_symbol, type(right), right)
+        hash(key)
+        return key
+    except (TypeError, ValueError):
+        return None
+
+
+def shared_key(conditions):
+    """
+    Key of a list of conditions that can be evaluated once per row for all the rules holding it:
+    None if a condition cannot be keyed or depends on the rule state (odrl:count).
+    """
+    if any(has_count_constraint(c) for c in conditions):
+        return None
+
+    keys = tuple(constraint_key(c) for c in conditions)
+    return None if None in keys else keys
+
+
+def shared_occurrences(evaluation_state):
+    """
+    Number of occurrences of each shareable logic constraint and condition list (see shared_key)
+    in the rules of an evaluation state, under the keys used by compile_shared.
+    """
+    occurrences = {}
+
+    def count(key):
+        if key is not None:
+            occurrences[key] = occurrences.get(key, 0) + 1
+
+    def visit(constraint):
+        if is_logic_constraint(constraint):
+            count(shared_key([constraint]))
+            for sub in constraint[1]:
+                visit(sub)
+
+    for rule_state in rule_states_in_order(evaluation_state):
+        if isinstance(rule_state, dict) and isinstance(rule_state.get("conditions", []), list):
+            conditions = rule_state.get("conditions", [])
+            key = shared_key(conditions)
+            count(("conditions", key) if key is not None else None)
+            for constraint in conditions:
+                visit(constraint)
+
+    return occurrences
+
+
+def resolve_left_operand(left, columns):
+    """
+    Return the column a left operand is read from, or None if the SotW has no such column.
+    Refinement operands such as "Party X" fall back to the last part found among the columns.
+    """
+    if left in columns:
+        return left
+
+    if isinstance(left, str):
+        for part in reversed(left.split()):
+            if part in columns:
+                return part
+
+    return None
+
+
+def is_aware_timestamp(value):
+    return isinstance(value, pd.Timestamp) and value.tzinfo is not None
+
+
+def is_aware_datetime(value):
+    return isinstance(value, datetime) and value.tzinfo is not None
+
+
+def parse_timestamp(value):
+    # Timezone aware cells of the dateTime column give the same result without the round trip
+    # through str and dateutil (sub-microsecond digits are truncated either way)
+    if is_aware_timestamp(value):
+        return (value.value // 1000) / 1e6
+    if is_aware_datetime(value):
+        return value.timestamp()
+    return parser.parse(str(value)).timestamp()
+
+
+def parse_match_time(value):
+    if value is None:
+        return None
+    if is_aware_timestamp(value):
+        return value.to_pydatetime(warn=False)
+    if is_aware_datetime(value):
+        return value
+    try:
+        return parser.parse(str(value))
+    except:
+        return None
+
+# ----------------------------------------
+# SLIDING WINDOW COUNTS
+# ----------------------------------------
+# A count constraint with a duration ("odrl:count PT24H", see rdf_utils.parse_duration) reads the
+# number of earlier matches of its rule within a window of that length ending at the dateTime of
+# the row. Each such rule keeps, per window, a ring of WINDOW_BUCKETS counts of matches in buckets
+# of window / WINDOW_BUCKETS microseconds since the epoch: the window of a row is made of the
+# bucket of its dateTime and the buckets before it, so matches expire one bucket at a time. Rows
+# without a dateTime do not satisfy windowed count constraints, and matches without one are not
+# counted in the windows.
+#
+# The count is therefore approximate at the trailing edge of the window (see window_count): the
+# window of a row starts at the beginning of a bucket, so the matches of the oldest part of the
+# window, up to one bucket long (1/WINDOW_BUCKETS of the window), are not counted.
+
+WINDOW_BUCKETS = 64
+
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def is_count_operand(left):
+    return isinstance(left, str) and (left == COUNT_OPERAND or left.startswith(COUNT_OPERAND + " "))
+
+
+def count_window(left):
+    """
+    Window of a windowed count left operand as (key, length in microseconds), None for a plain
+    odrl:count. The length is None if the duration cannot be read.
+    """
+    if left == COUNT_OPERAND:
+        return None
+    key = left[len(COUNT_OPERAND) + 1:]
+    return key, rdf_utils.parse_duration(key)
+
+
+def time_micros(value):
+    """
+    Microseconds since the epoch of a match time or dateTime cell, naive times taken as UTC.
+    """
+    if value is None or value is pd.NaT:
+        return None
+
+    if isinstance(value, pd.Timestamp):
+        try:
+            return value.value // 1000
+        except OverflowError:
+            value = value.to_pydatetime(warn=False)
 
-    if isinstance(policy, list):
-        policy = policy[0]
+    if not isinstance(value, datetime):
+        value = parse_match_time(value)
+        if value is None:
+            return None
 
-    # Ensure time ordering
-    DT_COL = "http://www.w3.org/ns/odrl/2/dateTime"
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
 
-    if DT_COL in df.columns:
-        df[DT_COL] = pd.to_datetime(df[DT_COL], errors="coerce", utc=True)
-        df = df.sort_values(by=DT_COL, ascending=True)
+    try:
+        return (value - EPOCH_UTC) // MICROSECOND
+    except (TypeError, OverflowError):
+        return None
+
+
+def new_window(length):
+    width = max(1, length // WINDOW_BUCKETS)
+    return {"width": width, "head": None, "total": 0, "counts": [0] * -(-length // width)}
+
+
+def rule_windows(conditions):
+    """
+    Empty windows of the windowed count constraints of a rule, by duration.
+    """
+    windows = {}
+
+    def visit(constraint):
+        if is_logic_constraint(constraint):
+            for sub in constraint[1]:
+                visit(sub)
+        elif isinstance(constraint, list) and len(constraint) == 3 and is_count_operand(constraint[0]):
+            window = count_window(constraint[0])
+            if window is not None and window[1] is not None:
+                windows.setdefault(window[0], new_window(window[1]))
+
+    if isinstance(conditions, list):
+        for constraint in conditions:
+            visit(constraint)
+
+    return windows
+
+
+def window_count(window, time):
+    """
+    Matches recorded in the window ending at the bucket of time (in microseconds), i.e. in that
+    bucket and the buckets of the ring before it. This is the sliding window of the row up to its
+    trailing edge: the matches in the part of the bucket just before the ring that still falls
+    within the window (less than one bucket) are not counted, so the count can be lower than the
+    exact one by the matches of up to 1/WINDOW_BUCKETS of the window.
+    """
+    head = window["head"]
+
+    if head is None:
+        return 0
+
+    counts = window["counts"]
+    size = len(counts)
+    bucket = time // window["width"]
+
+    if bucket >= head:
+        if bucket - head >= size:
+            return 0
+        # buckets of the ring that are older than the window of the row
+        return window["total"] - sum(counts[b % size] for b in range(head - size + 1, bucket - size + 1))
+
+    # a row older than the latest match only sees the buckets up to its own
+    return sum(counts[b % size] for b in range(max(head - size + 1, bucket - size + 1), bucket + 1))
+
+
+def record_window_match(window, time):
+    counts = window["counts"]
+    size = len(counts)
+    bucket = time // window["width"]
+    head = window["head"]
+
+    if head is None:
+        window["head"] = bucket
+    elif bucket > head:
+        # buckets that leave the ring are cleared before they are reused
+        for b in range(max(head + 1, bucket - size + 1), bucket + 1):
+            window["total"] -= counts[b % size]
+            counts[b % size] = 0
+        window["head"] = bucket
+    elif bucket <= head - size:
+        return
+
+    counts[bucket % size] += 1
+    window["total"] += 1
+
+
+def record_window_matches(rule_state, match_time):
+    windows = rule_state.get("windows")
+
+    if not windows:
+        return
+
+    time = time_micros(match_time)
+
+    if time is not None:
+        for window in windows.values():
+            record_window_match(window, time)
+
+
+# ----------------------------------------
+# SET OPERATORS
+# ----------------------------------------
+# The right operand of isAnyOf, isNoneOf, hasPart, isPartOf and isAllOf is a set of values: a
+# frozenset when it is extracted from an RDF list, although lists and single values are accepted.
+# A cell holds one value, several values separated by spaces, or a list of values. Values compare
+# as they do with eq: as numbers when both are numbers and as strings otherwise, or as instants on
+# dateTime columns. Both sides are turned into sets of keys, so checking a cell against hundreds
+# of values takes a few hash lookups.
+
+def set_member_key(value, parse=float):
+    """
+    Key of a value in a set comparison, equal for the values that eq considers equal.
+    """
+    try:
+        key = parse(value)
+    except Exception:
+        return str(value)
+    # NaN is not equal to itself
+    return key if key == key else str(value)
 
-    if evaluation_state is None:
-        evaluation_state = initialise_evaluation_state(policy)
 
-    validity = 1
+def is_missing_cell(value):
+    """
+    Whether a cell is missing (None, NaN, NaT or pd.NA) or empty, as pd.isna(value) or value == ""
+    would say for a single value, without a call into pandas: the compiled predicates run it on
+    every cell, and the Policy Decision Point on every request.
+    """
+    # pd.NA is compared by identity, as it is neither equal nor unequal to itself
+    return value is None or value is pd.NA or value != value or value == ""
+
 
-    for idx, row in df.iterrows():
+def _is_missing_member(value):
+    return not isinstance(value, (list, tuple, set, frozenset)) and (pd.isna(value) or value == "")
 
-        matched_permissions = []
-        matched_prohibitions = []
 
-        # ----------------------------------------
-        # 1) MATCH ALL RULES (INCLUDING DUTIES ETC.)
-        # ----------------------------------------
+@functools.lru_cache(maxsize=256)
+def _cached_set_operand(right, datetime_column):
+    values = list(right) if isinstance(right, (set, frozenset, list, tuple)) else [right]
+    values = [value for value in values if not _is_missing_member(value)]
 
-        # Permissions
-        for p in evaluation_state["permissions"]:
-            if check_match(row, p, OPS_MAP, FEATURE_TYPE_MAP):
-                matched_permissions.append(p)
+    datetime_values = datetime_column or (len(values) > 0 and all(is_parseable_date(value) for value in values))
+    parse = parse_timestamp if datetime_values else float
 
-            # Duties ALWAYS evaluated
-            for d in p.get("duties", []):
-                check_match(row, d, OPS_MAP, FEATURE_TYPE_MAP)
+    return frozenset(set_member_key(value, parse) for value in values), datetime_values
 
-                for c in d.get("consequences", []):
-                    check_match(row, c, OPS_MAP, FEATURE_TYPE_MAP)
 
-        # Prohibitions + remedies
-        for f in evaluation_state["prohibitions"]:
-            if check_match(row, f, OPS_MAP, FEATURE_TYPE_MAP):
-                matched_prohibitions.append(f)
+def set_operand(right, datetime_column=False):
+    """
+    Keys of the values of a right operand, and whether they compare as dateTime values. The keys of
+    a hashable operand are computed once, so eval_constraint can compile set comparisons per row.
+    """
+    try:
+        return _cached_set_operand(right, datetime_column)
+    except TypeError:
+        return _cached_set_operand.__wrapped__(right, datetime_column)
+
+
+def compile_set_comparison(op_symbol, right, column, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache=None):
+    """
+    compile_comparison of a set operator. The predicate relates the keys of the values of a cell to
+    the keys of the right operand with OPS_MAP[op_symbol]. Missing cells never satisfy it.
+    """
+    if timestamp_cache is None:
+        timestamp_cache = {}
+
+    relation = OPS_MAP[op_symbol]
+    right_keys, datetime_values = set_operand(right, FEATURE_TYPE_MAP.get(column) == XSD_DATETIME or column == DT_COL)
+
+    if datetime_values:
+        def key_of(value):
+            # shares the dateTime cells parsed by the other comparisons
+            cache_key = value if isinstance(value, (str, pd.Timestamp)) else (type(value), value)
+            if cache_key not in timestamp_cache:
+                try:
+                    timestamp_cache[cache_key] = parse_timestamp(value)
+                except Exception:
+                    timestamp_cache[cache_key] = None
+            parsed = timestamp_cache[cache_key]
+            return str(value) if parsed is None else parsed
+    else:
+        key_of = set_member_key
 
-            for r in f.get("remedies", []):
-                check_match(row, r, OPS_MAP, FEATURE_TYPE_MAP)
+    def predicate(value):
+        if isinstance(value, (list, tuple, set, frozenset)):
+            items = value
+        elif is_missing_cell(value):
+            return False
+        elif isinstance(value, str) and not datetime_values:
+            items = value.split()
+        else:
+            # dates can contain spaces
+            items = (value,)
 
-        # Obligations
-        for o in evaluation_state["obligations"]:
-            check_match(row, o, OPS_MAP, FEATURE_TYPE_MAP)
+        values = frozenset(key_of(item) for item in items if not _is_missing_member(item))
 
-        # ----------------------------------------
-        # 2) PERMISSION VIOLATION
-        # ----------------------------------------
-        if not matched_permissions:
-            evaluation_state["rows_violating_permissions"].append(idx)
-            validity = 0
+        if not values:
+            return False
+        return relation(values, right_keys)
 
-        # ----------------------------------------
-        # 3) DUTIES / CONSEQUENCES
-        # ----------------------------------------
-        for p in matched_permissions:
-            for d in p.get("duties", []):
+    return {"kind": "set", "op": relation, "right": right_keys, "predicate": predicate}
 
-                if d["matches_count"] == 0 and d.get("required", 0) == 0:
 
-                    if not d.get("consequences"):
-                        evaluation_state["rows_violating_permissions"].append(idx)
-                        validity = 0
-                    else:
-                        d["required"] = 1
-                        for c in d["consequences"]:
-                            c["required"] = 1
+def compile_comparison(op_symbol, right, column, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache=None):
+    """
+    Interpret the comparison of a SotW column with a right operand in the same way as eval_constraint.
 
-        # ----------------------------------------
-        # 4) PROHIBITIONS + REMEDIES
-        # ----------------------------------------
-        for f in matched_prohibitions:
+    Returns a dict with the kind of comparison ("datetime", "equality", "numeric" or "set"), the bound
+    operator, the converted right operand and a predicate on a single cell value. When no cell value
+    can satisfy the comparison, kind and predicate are None.
+    """
+    if timestamp_cache is None:
+        timestamp_cache = {}
 
-            remedies = f.get("remedies", [])
+    never = {"kind": None, "op": None, "right": None, "predicate": None}
 
-            if not remedies:
-                evaluation_state["rows_violating_prohibitions"].append(idx)
-                validity = 0
+    if op_symbol not in OPS_MAP:
+        return never
+
+    if op_symbol in SET_OPERATORS:
+        return compile_set_comparison(op_symbol, right, column, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache)
+
+    op = OPS_MAP[op_symbol]
+    column_type = FEATURE_TYPE_MAP.get(column)
+
+    # ----------------------------------------
+    # DATETIME
+    # ----------------------------------------
+    if column_type == XSD_DATETIME or column == DT_COL or is_parseable_date(right):
+        try:
+            right_date = parse_timestamp(right)
+        except Exception:
+            return never
+
+        def predicate(value):
+            if is_missing_cell(value):
+                return False
+
+            # equal numbers of different types print differently, so they get separate entries
+            key = value if isinstance(value, (str, pd.Timestamp)) else (type(value), value)
+            if key in timestamp_cache:
+                left_date = timestamp_cache[key]
             else:
-                for r in remedies:
-                    r["required"] = 1
+                try:
+                    left_date = parse_timestamp(value)
+                except Exception:
+                    left_date = None
+                timestamp_cache[key] = left_date
+
+            if left_date is None:
+                return False
+            return op(left_date, right_date)
+
+        return {"kind": "datetime", "op": op, "right": right_date, "predicate": predicate}
+
+    try:
+        right_number = float(right)
+    except Exception:
+        right_number = None
 
     # ----------------------------------------
-    # 5) POST PROCESSING
+    # EQUALITY / INEQUALITY
     # ----------------------------------------
+    if op_symbol in EQUALITY_OPERATORS:
+        right_text = str(right)
 
+        def predicate(value):
+            if is_missing_cell(value):
+                return False
 
-    temporary_validity = validity
-    if (
-            len(evaluation_state["rows_violating_permissions"]) > 0
-            or len(evaluation_state["rows_violating_prohibitions"]) > 0
-    ):
-        temporary_validity = 0
+            if right_number is not None:
+                try:
+                    return op(float(value), right_number)
+                except Exception:
+                    pass
+            return op(str(value), right_text)
 
-    obligations_not_satisfied = []
-    unfulfilled_duties = []
-    unfulfilled_consequences = []
-    unfulfilled_remedies = []
+        return {"kind": "equality", "op": op, "right": right_number, "right_text": right_text, "predicate": predicate}
 
-    # ---- OBLIGATIONS ----
-    for o in evaluation_state["obligations"]:
-        if o["matches_count"] < 1:
-            obligations_not_satisfied.append(o)
-            temporary_validity = 0
+    # ----------------------------------------
+    # NUMERIC COMPARISON
+    # ----------------------------------------
+    if right_number is None:
+        return never
 
-    # ---- DUTIES + CONSEQUENCES ----
-    for p in evaluation_state["permissions"]:
-        for d in p.get("duties", []):
+    def predicate(value):
+        if is_missing_cell(value):
+            return False
+        try:
+            return op(float(value), right_number)
+        except Exception:
+            return False
 
-            if d.get("required") == 1:
-                unfulfilled_duties.append(d)
-                temporary_validity = 0
+    return {"kind": "numeric", "op": op, "right": right_number, "predicate": predicate}
 
-            for c in d.get("consequences", []):
-                if c.get("required") == 1:
-                    unfulfilled_consequences.append(c)
-                    temporary_validity = 0
 
-    # ---- REMEDIES ----
-    for f in evaluation_state["prohibitions"]:
-        for r in f.get("remedies", []):
-            if r.get("required") == 1:
-                unfulfilled_remedies.append(r)
-                temporary_validity = 0
+def compile_constraint(constraint, rule_state, column_positions, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache=None,
+                       compile_simple=None, compile_shared=None):
+    """
+    Compile a constraint (or a logic constraint) of a rule into a function of the row values.
 
-    return (
-        evaluation_state,
-        temporary_validity,
-        evaluation_state["rows_violating_permissions"],
-        evaluation_state["rows_violating_prohibitions"],
-        obligations_not_satisfied,
-        unfulfilled_duties,
-        unfulfilled_consequences,
-        unfulfilled_remedies
-    )
+    column_positions maps each SotW column to its position in the row values.
+    timestamp_cache is shared between the constraints of a plan so that each distinct dateTime
+    cell is parsed at most once.
+    compile_simple(column, op_symbol, right), if given, compiles the comparisons of a column with a
+    right operand instead of compile_comparison.
+    compile_shared(key, build), if given, returns the function of a logic constraint (or of the
+    conditions of a rule) identified by key, calling build() to compile it the first time.
+    """
+    if timestamp_cache is None:
+        timestamp_cache = {}
 
-def evaluate_ODRL_from_files(policy_file, SotW_file, state_file=None, normalise=False):
-    graph = rdf_utils.load(policy_file)[0]
-    if normalise:
-        graph = rdf_utils.load_normalise(policy_file)[0]
-    policies = rdf_utils.extract_rule_list_from_policy(graph)
-    features = rdf_utils.extract_features_list_from_policy(graph)
+    # ----------------------------------------
+    # LOGIC CONSTRAINTS
+    # ----------------------------------------
+    if is_logic_constraint(constraint):
+        def compile_sub(sub):
+            return compile_constraint(
+                sub, rule_state, column_positions, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache, compile_simple, compile_shared
+            )
 
-    evaluation_state = None
+        costs = [constraint_cost(sub, column_positions, FEATURE_TYPE_MAP) for sub in constraint[1]]
 
-    if state_file and os.path.exists(state_file):
-        with open(state_file, "r") as f:
-            evaluation_state = json.load(f)
+        if compile_shared is not None:
+            key = shared_key([constraint])
+            if key is not None:
+                return compile_shared(key, lambda: compile_logic_constraint(constraint, compile_sub, costs))
 
-    FEATURE_TYPE_MAP = {f["iri"]: f["type"] for f in features}
-    df = pd.read_csv(SotW_file)
+        return compile_logic_constraint(constraint, compile_sub, costs)
 
-    return evaluate_ODRL_on_dataframe(policies[0], df, FEATURE_TYPE_MAP, evaluation_state)
+    left, op_symbol, right = constraint
 
-def evaluate_ODRL_from_strings(
-    policy_text,
-    sotw_csv,
-    evaluation_state=None
-):
-    graph, _ = rdf_utils.parse_string_to_graph(
-        policy_text
-    )
+    if op_symbol not in OPS_MAP:
+        return _never
 
-    policies = (
-        extract_rule_list_from_policy(
-            graph
-        )
-    )
+    op = OPS_MAP[op_symbol]
 
-    features = (
-        extract_features_list_from_policy(
-            graph
-        )
-    )
+    # ----------------------------------------
+    # COUNT (depends on the rule state)
+    # ----------------------------------------
+    if is_count_operand(left) and op_symbol in SET_OPERATORS:
+        return _never
 
-    feature_type_map = {
-        f["iri"]: f["type"]
-        for f in features
-    }
+    if is_count_operand(left) and left != COUNT_OPERAND:
+        return compile_window_count(left, op, right, rule_state, column_positions)
 
-    df = pd.read_csv(
-        StringIO(sotw_csv)
-    )
+    if left == COUNT_OPERAND:
+        try:
+            right_number = float(right)
+        except Exception:
+            return _never
 
-    if isinstance(evaluation_state, str):
-        evaluation_state = json.loads(evaluation_state)
+        def evaluate(values):
+            try:
+                return op(float(rule_state.get("matches_count", 0)), right_number)
+            except Exception:
+                return False
 
-    return evaluate_ODRL_on_dataframe(
-        policies[0],
-        df,
-        feature_type_map,
-        evaluation_state
-    )
+        return evaluate
 
+    column = resolve_left_operand(left, column_positions)
 
-def evaluate_ODRL_from_files_streaming(policy_file, SotW_file, max_rows_per_SotW=1, normalise=False):
+    if column is None:
+        return _never
 
-    STREAM_DIR = "stream_simulation"
+    if compile_simple is not None:
+        return compile_simple(column, op_symbol, right)
 
-    # ----------------------------------------
-    # 1) PREPARE STREAM DIRECTORY
-    # ----------------------------------------
-    if os.path.exists(STREAM_DIR):
-        shutil.rmtree(STREAM_DIR)
-    os.makedirs(STREAM_DIR)
+    position = column_positions[column]
+    predicate = compile_comparison(op_symbol, right, column, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache)["predicate"]
 
-    # ----------------------------------------
-    # 2) LOAD POLICY + FEATURES
-    # ----------------------------------------
-    graph = rdf_utils.load(policy_file)[0]
-    if normalise:
-        graph = rdf_utils.load_normalise(policy_file)[0]
+    if predicate is None:
+        return _never
 
-    policies = extract_rule_list_from_policy(graph)
-    features = extract_features_list_from_policy(graph)
+    def evaluate(values):
+        return predicate(values[position])
 
-    FEATURE_TYPE_MAP = {f["iri"]: f["type"] for f in features}
+    return evaluate
 
-    # ----------------------------------------
-    # 3) LOAD + SORT SOTW
-    # ----------------------------------------
-    df = pd.read_csv(SotW_file)
 
-    DT_COL = "http://www.w3.org/ns/odrl/2/dateTime"
+# ----------------------------------------
+# CONDITION ORDERING
+# ----------------------------------------
+# Conditions have no side effects, so the conditions of a rule (and the subconstraints of an and /
+# or) can be checked in any order. They start sorted by estimated cost. Then one call in
+# CONDITION_SAMPLE_RATE checks all of them to estimate how often each one holds, and every
+# CONDITION_REORDER_SAMPLES samples they are sorted again so that the conditions most likely to
+# decide the result for their cost come first.
 
-    if DT_COL in df.columns:
-        df[DT_COL] = pd.to_datetime(df[DT_COL], errors="coerce", utc=True)
-        df = df.sort_values(by=DT_COL, ascending=True)
+CONDITION_SAMPLE_RATE = 32
+CONDITION_REORDER_SAMPLES = 16
 
-    # ----------------------------------------
-    # 4) SPLIT INTO STREAM FILES
-    # ----------------------------------------
-    total_rows = len(df)
-    num_chunks = math.ceil(total_rows / max_rows_per_SotW)
 
-    stream_files = []
+def constraint_cost(constraint, column_positions, FEATURE_TYPE_MAP):
+    """
+    Rough relative cost of checking a constraint on a row.
+    """
+    if is_logic_constraint(constraint):
+        return 1 + sum(constraint_cost(sub, column_positions, FEATURE_TYPE_MAP) for sub in constraint[1])
 
-    for i in range(num_chunks):
-        start = i * max_rows_per_SotW
-        end = start + max_rows_per_SotW
+    try:
+        left, op_symbol, right = constraint
+    except (TypeError, ValueError):
+        return 0
+
+    if is_count_operand(left):
+        return 1
+
+    column = resolve_left_operand(left, column_positions)
+
+    # never holds
+    if column is None:
+        return 0
+
+    # hash lookups, whatever the size of the set
+    if op_symbol in SET_OPERATORS:
+        return 1
+
+    if FEATURE_TYPE_MAP.get(column) == XSD_DATETIME or column == DT_COL or is_parseable_date(right):
+        return 3
+
+    return 1 if op_symbol in EQUALITY_OPERATORS else 2
+
+
+def ordered_conditions(conditions, costs, stop_on):
+    """
+    Function of the row values that checks compiled conditions in an adaptive order and returns
+    stop_on as soon as a condition returns stop_on (False for a conjunction, True for a
+    disjunction), and not stop_on otherwise.
+    """
+    n = len(conditions)
+    ordered = [conditions[i] for i in sorted(range(n), key=lambda i: costs[i])]
+    until_sample = [CONDITION_SAMPLE_RATE]
+    samples = [0]
+    decided = [0] * n
+
+    def sample(values):
+        results = [bool(condition(values)) for condition in conditions]
+        for i, result in enumerate(results):
+            if result is stop_on:
+                decided[i] += 1
+
+        samples[0] += 1
+        if samples[0] % CONDITION_REORDER_SAMPLES == 0:
+            # expected cost of the checks until the result is decided, smallest first
+            rank = [costs[i] * (samples[0] + 1) / (decided[i] + 1) for i in range(n)]
+            ordered[:] = [conditions[i] for i in sorted(range(n), key=lambda i: rank[i])]
+
+        return stop_on if stop_on in results else not stop_on
+
+    def evaluate(values):
+        until_sample[0] -= 1
+
+        if not until_sample[0]:
+            until_sample[0] = CONDITION_SAMPLE_RATE
+            return sample(values)
+
+        if stop_on:
+            for condition in ordered:
+                if condition(values):
+                    return True
+            return False
 
-        chunk_df = df.iloc[start:end]
+        for condition in ordered:
+            if not condition(values):
+                return False
+        return True
 
-        file_path = os.path.join(STREAM_DIR, f"stream{i}.csv")
-        chunk_df.to_csv(file_path, index=False)
+    return evaluate
 
-        stream_files.append(file_path)
 
-    # ----------------------------------------
-    # 5) PROCESS STREAM FILES SEQUENTIALLY
-    # ----------------------------------------
-    evaluation_state = None
-    result = None
-
-    state_file = os.path.join(STREAM_DIR, "evaluation_state.json")
-
-    for i, stream_file in enumerate(stream_files):
-
-        # Run evaluation
-        #result = evaluate_ODRL_on_dataframe(
-        #    policies[0],
-        #    pd.read_csv(stream_file),
-        #    FEATURE_TYPE_MAP,
-        #    evaluation_state
-        #)
-        result = evaluate_ODRL_from_files(
-            policy_file,
-            stream_file,
-            state_file=state_file,
-            normalise=normalise
+def compile_logic_constraint(logic_constraint, compile_sub, costs=None):
+    """
+    Compile a logic constraint into a function of the row values, given the function compiling
+    each of its subconstraints and optionally their costs (see constraint_cost), with which the
+    subconstraints of an and / or are checked in an adaptive order.
+    """
+    logic_op = logic_constraint[0]
+    subconstraints = [compile_sub(sub) for sub in logic_constraint[1]]
+
+    if logic_op.endswith("and") or logic_op.endswith("andSequence"):
+        if costs is not None and len(subconstraints) > 1:
+            return ordered_conditions(subconstraints, costs, False)
+
+        def evaluate(values):
+            for sub in subconstraints:
+                if not sub(values):
+                    return False
+            return True
+
+    elif logic_op.endswith("or"):
+        if costs is not None and len(subconstraints) > 1:
+            return ordered_conditions(subconstraints, costs, True)
+
+        def evaluate(values):
+            for sub in subconstraints:
+                if sub(values):
+                    return True
+            return False
+
+    elif logic_op.endswith("xone"):
+        def evaluate(values):
+            return sum(1 for sub in subconstraints if sub(values)) == 1
+
+    else:
+        return _never
+
+    return evaluate
+
+
+def compile_rule(rule_state, column_positions, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache=None, compile_simple=None,
+                 compile_shared=None):
+    """
+    Compile the conditions of a rule into a single function of the row values, which checks them
+    in an adaptive order (see ordered_conditions).
+    """
+    if not isinstance(rule_state, dict):
+        return _never
+
+    conditions = rule_state.get("conditions", [])
+
+    if not isinstance(conditions, list):
+        return _never
+
+    def compile_conditions():
+        compiled_conditions = [
+            compile_constraint(
+                c, rule_state, column_positions, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache, compile_simple, compile_shared
+            )
+            for c in conditions
+        ]
+
+        if len(compiled_conditions) > 1:
+            costs = [constraint_cost(c, column_positions, FEATURE_TYPE_MAP) for c in conditions]
+            return ordered_conditions(compiled_conditions, costs, False)
+
+        def evaluate(values):
+            for condition in compiled_conditions:
+                if not condition(values):
+                    return False
+            return True
+
+        return evaluate
+
+    if compile_shared is not None:
+        # rules with the same conditions (e.g. duties cloned as permissions) share their function
+        key = shared_key(conditions)
+        if key is not None:
+            return compile_shared(("conditions", key), compile_conditions)
+
+    return compile_conditions()
+
+
+def compile_evaluation_state(evaluation_state, columns, FEATURE_TYPE_MAP, OPS_MAP=OPS_MAP, compile_simple=None,
+                             compile_shared=None):
+    """
+    Build the compiled plan of an evaluation state for a SotW with the given columns.
+
+    The plan mirrors the structure of the evaluation state: every rule state is paired with its
+    compiled match function, and nested duties, consequences and remedies are compiled as well.
+    The rule states themselves are not copied, so matches update the evaluation state directly.
+    """
+    column_positions = {column: i for i, column in enumerate(columns)}
+    timestamp_cache = {}
+
+    def compile_node(rule_state, nested=()):
+        node = {
+            "state": rule_state,
+            "match": compile_rule(
+                rule_state, column_positions, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache, compile_simple, compile_shared
+            )
+        }
+        if nested:
+            key = nested[0]
+            node[key] = [compile_node(c, nested[1:]) for c in rule_state.get(key, [])]
+        return node
+
+    return {
+        "column_positions": column_positions,
+        "permissions": [compile_node(p, ("duties", "consequences")) for p in evaluation_state["permissions"]],
+        "prohibitions": [compile_node(f, ("remedies",)) for f in evaluation_state["prohibitions"]],
+        "obligations": [compile_node(o) for o in evaluation_state["obligations"]],
+    }
+
+
+def compile_window_count(left, op, right, rule_state, column_positions):
+    """
+    Predicate of a windowed count constraint ("odrl:count PT24H"), comparing the matches of the
+    rule in the window of the row (see window_count) with the right operand. The count leaves out
+    the matches of up to the oldest bucket of the window, so a limit may admit a few more matches
+    than the exact sliding window would.
+    """
+    key, length = count_window(left)
+    dt_position = column_positions.get(DT_COL)
+
+    try:
+        right_number = float(right)
+    except Exception:
+        return _never
+
+    if length is None or dt_position is None:
+        return _never
+
+    # states saved before windowed counts existed get their windows here
+    rule_state.setdefault("windows", {}).setdefault(key, new_window(length))
+
+    def evaluate(values):
+        time = time_micros(values[dt_position])
+        if time is None:
+            return False
+        # the window is looked up on every row, the state may be restored between rows
+        return op(float(window_count(rule_state["windows"][key], time)), right_number)
+
+    return evaluate
+
+
+def record_match(rule_state, match_time):
+    rule_state["matches_count"] += 1
+
+    if "windows" in rule_state:
+        record_window_matches(rule_state, match_time)
+
+    if rule_state["earliestMatch"] is None:
+        rule_state["earliestMatch"] = match_time
+
+    rule_state["latestMatch"] = match_time
+
+    if rule_state.get("required", 0) == 1:
+        rule_state["required"] = 0
+
+
+def check_compiled_match(compiled_rule, values, dt_position, row_match_time):
+    """
+    Compiled counterpart of check_match. row_match_time is an empty list for a new row and caches
+    the parsed dateTime of the row once the first rule matches it.
+    """
+    if compiled_rule["match"](values):
+        record_row_match(compiled_rule, values, dt_position, row_match_time)
+        return True
+
+    return False
+
+
+def record_row_match(compiled_rule, values, dt_position, row_match_time):
+    if not row_match_time:
+        row_match_time.append(
+            parse_match_time(values[dt_position]) if dt_position is not None else None
         )
 
-        # Save updated state
-        evaluation_state = result[0]
+    record_match(compiled_rule["state"], row_match_time[0])
+
+# ----------------------------------------
+# RULE DISCRIMINATION INDEX
+# ----------------------------------------
+# Most rules carry odrl:eq conditions on the Action, Party and Asset of a row. Such a condition is a
+# plain string comparison when its right operand is neither a number nor a date, so the rules can be
+# hashed on the value they require. A row is then only checked against the rules found under its
+# own values, plus the rules that have no such condition (the wildcard bucket).
+
+def identity_conditions(rule_state, column_positions, OPS_MAP, FEATURE_TYPE_MAP):
+    """
+    Return the (column, value) pairs of the top level odrl:eq conditions of a rule that only match
+    cells whose string form is value.
+    """
+    pairs = []
+
+    if not isinstance(rule_state, dict) or not isinstance(rule_state.get("conditions", []), list):
+        return pairs
+
+    for c in rule_state.get("conditions", []):
+        if is_logic_constraint(c) or not isinstance(c, list) or len(c) != 3:
+            continue
+
+        left, op_symbol, right = c
+
+        if op_symbol != "http://www.w3.org/ns/odrl/2/eq" or is_count_operand(left):
+            continue
+
+        column = resolve_left_operand(left, column_positions)
+
+        if column is None:
+            continue
+
+        comparison = compile_comparison(op_symbol, right, column, OPS_MAP, FEATURE_TYPE_MAP)
+
+        if comparison["kind"] == "equality" and comparison["right"] is None:
+            pairs.append((column, comparison["right_text"]))
+
+    return pairs
+
+
+def build_rule_index(plan, FEATURE_TYPE_MAP, OPS_MAP=OPS_MAP, timestamp_cache=None):
+    """
+    Hash index from (column, value) to the compiled rules of a plan that can match a row with that
+    value. Each rule is indexed on its identity condition with the most selective column, i.e. the
+    column with the most distinct values required across the policy.
+
+    The rules are listed in the order in which the row loop visits them, with their kind
+    ("permission", "duty", "consequence", "prohibition", "remedy" or "obligation"). The rules with
+    range comparisons on the dateTime column are also indexed by time (see build_time_index).
+    """
+    nodes = []
+
+    for p in plan["permissions"]:
+        nodes.append(("permission", p))
+        for d in p["duties"]:
+            nodes.append(("duty", d))
+            for c in d["consequences"]:
+                nodes.append(("consequence", c))
+
+    for f in plan["prohibitions"]:
+        nodes.append(("prohibition", f))
+        for r in f["remedies"]:
+            nodes.append(("remedy", r))
+
+    for o in plan["obligations"]:
+        nodes.append(("obligation", o))
+
+    column_positions = plan["column_positions"]
+    conditions = [identity_conditions(node["state"], column_positions, OPS_MAP, FEATURE_TYPE_MAP) for _, node in nodes]
+
+    distinct_values = {}
+    for pairs in conditions:
+        for column, value in pairs:
+            distinct_values.setdefault(column, set()).add(value)
+
+    buckets = {}
+    wildcard = []
+
+    for i, pairs in enumerate(conditions):
+        if not pairs:
+            wildcard.append(i)
+            continue
+
+        column, value = max(pairs, key=lambda pair: len(distinct_values[pair[0]]))
+        buckets.setdefault(column, {}).setdefault(value, []).append(i)
+
+    rule_index = {
+        "nodes": nodes,
+        "columns": [(column, column_positions[column]) for column in buckets],
+        "buckets": buckets,
+        "wildcard": wildcard,
+        "candidates": {},
+    }
+    rule_index["time_index"] = build_time_index(rule_index, column_positions, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache)
+
+    return rule_index
+
+
+def indexed_candidates(rule_index, values):
+    """
+    Key of a row in the index, with the positions in rule_index["nodes"] of the rules that can match
+    it and the rules themselves, in row loop order.
+    """
+    key = tuple(str(values[position]) for _, position in rule_index["columns"])
+    entry = rule_index["candidates"].get(key)
+
+    if entry is None:
+        positions = set(rule_index["wildcard"])
+        for (column, _), value in zip(rule_index["columns"], key):
+            positions.update(rule_index["buckets"][column].get(value, ()))
+
+        positions = sorted(positions)
+        entry = rule_index["candidates"][key] = (positions, [rule_index["nodes"][i] for i in positions])
+
+    return key, entry[0], entry[1]
+
+
+def candidate_rules(rule_index, values):
+    """
+    Compiled rules of the index that can match a row, in row loop order.
+    """
+    return indexed_candidates(rule_index, values)[2]
+
+
+# ----------------------------------------
+# SORTED TIME INDEX
+# ----------------------------------------
+# Rows are evaluated in dateTime order, and a lt, lteq, gt, gteq or eq comparison of the dateTime
+# with a bound holds on a contiguous range of them. The bounds of all the rules split the time line
+# into regions (each bound, and the intervals between bounds) in which the same rules have their
+# time conditions satisfied. A row is only checked against the rules active in its region, found by
+# binary search, and the active rules are worked out again only when the rows enter a new region.
+# The vectorized engine selects the rows of each comparison by binary search on the sorted column.
+
+# Sides of the binary searches that find the first and the last row satisfying a range comparison
+# on a sorted column (None for the start or the end of the column)
+TIME_RANGE_SIDES = {
+    operator.lt: (None, "left"),
+    operator.le: (None, "right"),
+    operator.gt: ("right", None),
+    operator.ge: ("left", None),
+    operator.eq: ("left", "right"),
+}
+
+
+def time_bounds(rule_state, column_positions, OPS_MAP, FEATURE_TYPE_MAP):
+    """
+    Return the (op, seconds) pairs of the top level range comparisons of a rule on the dateTime
+    column, which hold on every row the rule matches.
+    """
+    bounds = []
+
+    if DT_COL not in column_positions:
+        return bounds
+
+    if not isinstance(rule_state, dict) or not isinstance(rule_state.get("conditions", []), list):
+        return bounds
+
+    for c in rule_state.get("conditions", []):
+        if is_logic_constraint(c) or not isinstance(c, list) or len(c) != 3:
+            continue
+
+        left, op_symbol, right = c
+
+        if is_count_operand(left) or resolve_left_operand(left, column_positions) != DT_COL:
+            continue
+
+        comparison = compile_comparison(op_symbol, right, DT_COL, OPS_MAP, FEATURE_TYPE_MAP)
+
+        if comparison["kind"] == "datetime" and comparison["op"] in TIME_RANGE_SIDES:
+            bounds.append((comparison["op"], comparison["right"]))
+
+    return bounds
+
+
+def build_time_index(rule_index, column_positions, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache=None):
+    """
+    Time regions of the rules of a rule index, or None if no rule has a range comparison on the
+    dateTime column.
+    """
+    bounds = [time_bounds(node["state"], column_positions, OPS_MAP, FEATURE_TYPE_MAP) for _, node in rule_index["nodes"]]
+
+    if not any(bounds):
+        return None
+
+    return {
+        "position": column_positions[DT_COL],
+        "points": sorted({seconds for rule_bounds in bounds for _, seconds in rule_bounds}),
+        "bounds": bounds,
+        "timestamp_cache": {} if timestamp_cache is None else timestamp_cache,
+        # the region of the previous row, with its active rules and its candidates by index key
+        "region": None,
+        "active": None,
+        "candidates": {},
+    }
+
+
+def row_seconds(time_index, values):
+    """
+    dateTime of a row in seconds, converted as the dateTime comparisons do, or None.
+    """
+    value = values[time_index["position"]]
+
+    if is_missing_cell(value):
+        return None
+
+    timestamp_cache = time_index["timestamp_cache"]
+    key = value if isinstance(value, (str, pd.Timestamp)) else (type(value), value)
+
+    if key not in timestamp_cache:
+        try:
+            timestamp_cache[key] = parse_timestamp(value)
+        except Exception:
+            timestamp_cache[key] = None
+
+    return timestamp_cache[key]
+
+
+def time_region(points, seconds):
+    """
+    Region of a time among the sorted bounds: 2 * i + 1 at the bound i, 2 * i just before it,
+    -1 for rows without a dateTime.
+    """
+    if seconds is None:
+        return -1
+
+    i = bisect.bisect_left(points, seconds)
+
+    if i < len(points) and points[i] == seconds:
+        return 2 * i + 1
+    return 2 * i
+
+
+def active_rules(time_index, region):
+    """
+    Whether the time conditions of each rule hold in a region, checked on one time of the region.
+    """
+    bounds = time_index["bounds"]
+
+    if region < 0:
+        return [not rule_bounds for rule_bounds in bounds]
+
+    points = time_index["points"]
+    i, at_bound = divmod(region, 2)
+
+    if at_bound:
+        seconds = points[i]
+    elif i == 0:
+        seconds = points[0] - 1.0
+    elif i == len(points):
+        seconds = points[-1] + 1.0
+    else:
+        seconds = (points[i - 1] + points[i]) / 2
+
+    return [all(op(seconds, bound) for op, bound in rule_bounds) for rule_bounds in bounds]
+
+
+def timed_candidate_rules(rule_index, values):
+    """
+    candidate_rules without the rules whose time conditions do not hold at the dateTime of the row.
+    """
+    key, positions, candidates = indexed_candidates(rule_index, values)
+    time_index = rule_index["time_index"]
+
+    if time_index is None:
+        return candidates
+
+    region = time_region(time_index["points"], row_seconds(time_index, values))
+
+    if region != time_index["region"]:
+        time_index["region"] = region
+        time_index["active"] = active_rules(time_index, region)
+        time_index["candidates"] = {}
+
+    timed = time_index["candidates"].get(key)
+
+    if timed is None:
+        active = time_index["active"]
+        timed = time_index["candidates"][key] = [rule_index["nodes"][i] for i in positions if active[i]]
+
+    return timed
+
+
+# ----------------------------------------
+# INCREMENTAL MATCHING NETWORK
+# ----------------------------------------
+
+def new_alpha_table():
+    """
+    Alpha nodes of one or more matching networks, with the memory of their results for the
+    current event.
+    """
+    return {"nodes": {}, "memory": {}, "ids": itertools.count(), "timestamp_cache": {}}
+
+
+def build_matching_network(evaluation_state, columns, FEATURE_TYPE_MAP, OPS_MAP=OPS_MAP, alphas=None,
+                           deduplicate=False):
+    """
+    Long lived matching network of an evaluation state, in the spirit of Rete.
+
+    Every distinct comparison (column, operator, right operand) of the policy is an alpha node that
+    is shared by all the rules using it and evaluated at most once per event. Identical logic
+    constraints and identical condition lists of different rules are shared in the same way, so
+    the constraints form a DAG in which each distinct node is evaluated at most once per event.
+    The compiled match function of each rule joins its alpha nodes with its count and logic
+    constraints, and the rule index only hands an event to the rules that can match it.
+
+    The network refers to the rule states of evaluation_state, so it stays valid while the state is
+    updated and can process one event at a time with match_event. Networks built on the same
+    columns can share their alpha nodes through an alpha table (see new_alpha_table).
+
+    With deduplicate=True the network also caches, for each distinct projection of a row on the
+    columns read by the policy, the rules matched by the row (see match_event).
+    """
+    if alphas is None:
+        alphas = new_alpha_table()
+
+    column_positions = {column: i for i, column in enumerate(columns)}
+    timestamp_cache = alphas["timestamp_cache"]
+    alpha_nodes = alphas["nodes"]
+    alpha_memory = alphas["memory"]
+    alpha_ids = alphas["ids"]
+
+    def compile_alpha(column, op_symbol, right):
+        predicate = compile_comparison(op_symbol, right, column, OPS_MAP, FEATURE_TYPE_MAP, timestamp_cache)["predicate"]
+
+        if predicate is None:
+            return _never
+
+        position = column_positions[column]
+        alpha_id = next(alpha_ids)
+
+        def evaluate(values):
+            result = alpha_memory.get(alpha_id)
+            if result is None:
+                result = alpha_memory[alpha_id] = predicate(values[position])
+            return result
+
+        return evaluate
+
+    def compile_simple(column, op_symbol, right):
+        # 1 and 1.0 are equal keys but compare differently as strings
+        key = (column, op_symbol, type(right), right)
+
+        try:
+            if key not in alpha_nodes:
+                alpha_nodes[key] = compile_alpha(column, op_symbol, right)
+            return alpha_nodes[key]
+        except TypeError:
+            # unhashable right operand, not shared
+            return compile_alpha(column, op_symbol, right)
+
+    # how many times each logic constraint and condition list occurs, only repeated ones are shared
+    occurrences = shared_occurrences(evaluation_state)
+
+    def compile_shared(key, build):
+        # logic constraints and rule conditions without odrl:count, keyed on their operands
+        if occurrences.get(key, 0) < 2:
+            return build()
+
+        key = ("shared", key)
+
+        if key not in alpha_nodes:
+            shared = build()
+            node_id = next(alpha_ids)
+
+            def evaluate(values):
+                result = alpha_memory.get(node_id)
+                if result is None:
+                    result = alpha_memory[node_id] = shared(values)
+                return result
+
+            alpha_nodes[key] = evaluate
+
+        return alpha_nodes[key]
+
+    plan = compile_evaluation_state(evaluation_state, columns, FEATURE_TYPE_MAP, OPS_MAP, compile_simple, compile_shared)
+
+    rule_index = build_rule_index(plan, FEATURE_TYPE_MAP, OPS_MAP, timestamp_cache)
+
+    return {
+        "columns": list(columns),
+        "plan": plan,
+        "rule_index": rule_index,
+        "dt_position": plan["column_positions"].get(DT_COL),
+        "alphas": alphas,
+        "projection": policy_projection(rule_index, column_positions) if deduplicate else None,
+        "match_cache": {} if deduplicate else None,
+    }
+
+
+# ----------------------------------------
+# ROW DEDUPLICATION
+# ----------------------------------------
+# Access logs repeat the same values on the columns read by the policy, often with only the
+# dateTime changing. A rule that reads neither the dateTime nor the rule state (odrl:count)
+# matches a row as a function of the other values alone, so it is matched once per distinct
+# projection of the rows on the columns read by the policy, and the result is replayed for the
+# repeats. The other rules are still matched row by row, as is the duty, remedy and match
+# bookkeeping.
+
+# Number of distinct row projections kept in the match cache of a network
+MATCH_CACHE_SIZE = 100000
+
+
+def policy_projection(rule_index, column_positions):
+    """
+    Positions of the columns other than the dateTime read by the rules of a rule index, and the
+    rules that have to be matched row by row (by id of their compiled node).
+    """
+    def read_columns(constraint):
+        if is_logic_constraint(constraint):
+            return set().union(*(read_columns(sub) for sub in constraint[1]))
+        try:
+            column = resolve_left_operand(constraint[0], column_positions)
+        except (TypeError, IndexError):
+            return set()
+        return {column} if column is not None else set()
+
+    # the candidate rules depend on the columns of the rule index
+    positions = {position for _, position in rule_index["columns"]}
+    live = set()
+
+    for _, node in rule_index["nodes"]:
+        conditions = node["state"].get("conditions", []) if isinstance(node["state"], dict) else []
+        if not isinstance(conditions, list):
+            continue
+
+        columns = set().union(*(read_columns(c) for c in conditions))
+
+        if DT_COL in columns or any(has_count_constraint(c) for c in conditions):
+            live.add(id(node))
+        else:
+            positions.update(column_positions[column] for column in columns)
+
+    return {"positions": sorted(positions), "live": live}
+
+
+def projection_key(projection, values):
+    # equal values of different types, or printing differently, can compare differently
+    return tuple(
+        value if type(value) is str else (type(value), repr(value))
+        for value in (values[position] for position in projection["positions"])
+    )
+
+
+def cached_matches(network, values):
+    """
+    Rules of the network that can match a row: (kind, node, matched) for the rules that match the
+    projection of the row (matched=True) and for the rules that read its dateTime or the rule
+    state (matched=False, to be checked on the row).
+    """
+    projection = network["projection"]
+    match_cache = network["match_cache"]
+    key = projection_key(projection, values)
+    matches = match_cache.get(key)
+
+    if matches is None:
+        matches = []
+        for kind, node in candidate_rules(network["rule_index"], values):
+            if id(node) in projection["live"]:
+                matches.append((kind, node, False))
+            elif node["match"](values):
+                matches.append((kind, node, True))
+
+        if len(match_cache) >= MATCH_CACHE_SIZE:
+            match_cache.clear()
+        match_cache[key] = matches
+
+    return matches
+
+
+def to_utc_timestamp(value):
+    """
+    Convert the dateTime of a single event as evaluate_ODRL_on_dataframe converts the column.
+    """
+    if value is None:
+        return pd.NaT
+    return pd.to_datetime(value, errors="coerce", utc=True)
+
+
+def event_values(network, event):
+    """
+    Row values of an event given as a dict from SotW column to value. Columns missing from the
+    event are treated as empty cells.
+    """
+    values = [event.get(column) for column in network["columns"]]
+
+    dt_position = network["dt_position"]
+    if dt_position is not None:
+        values[dt_position] = to_utc_timestamp(values[dt_position])
+
+    return values
+
+
+def match_event(network, evaluation_state, idx, values, new_event=True, violations=None):
+    """
+    Process a single event (row values in the column order of the network) and update the
+    evaluation state. Returns 0 if the event violates the policy, 1 otherwise.
+
+    new_event=False keeps the alpha node results computed for the same event by another network
+    sharing the alpha table. violations, if given, is a list to which the violations of the event
+    are appended as (kind, rule state) pairs: ("permission", None) when no permission matches,
+    ("duty", duty) and ("prohibition", prohibition).
+    """
+    if new_event:
+        network["alphas"]["memory"].clear()
+
+    matched_permissions = []
+    matched_prohibitions = []
+    row_match_time = []
+
+    # ----------------------------------------
+    # 1) MATCH ALL RULES (INCLUDING DUTIES ETC.)
+    # ----------------------------------------
+
+    # Rules that cannot match the Action, Party, Asset or dateTime of the row are skipped
+    if network["match_cache"] is None:
+        for kind, node in timed_candidate_rules(network["rule_index"], values):
+            if check_compiled_match(node, values, network["dt_position"], row_match_time):
+                if kind == "permission":
+                    matched_permissions.append(node["state"])
+                elif kind == "prohibition":
+                    matched_prohibitions.append(node["state"])
+    else:
+        for kind, node, matched in cached_matches(network, values):
+            if matched:
+                record_row_match(node, values, network["dt_position"], row_match_time)
+            elif not check_compiled_match(node, values, network["dt_position"], row_match_time):
+                continue
+
+            if kind == "permission":
+                matched_permissions.append(node["state"])
+            elif kind == "prohibition":
+                matched_prohibitions.append(node["state"])
+
+    validity = 1
+
+    # ----------------------------------------
+    # 2) PERMISSION VIOLATION
+    # ----------------------------------------
+    if not matched_permissions:
+        evaluation_state["rows_violating_permissions"].append(idx)
+        validity = 0
+        if violations is not None:
+            violations.append(("permission", None))
+
+    # ----------------------------------------
+    # 3) DUTIES / CONSEQUENCES
+    # ----------------------------------------
+    for p in matched_permissions:
+        for d in p.get("duties", []):
+
+            if d["matches_count"] == 0 and d.get("required", 0) == 0:
+
+                if not d.get("consequences"):
+                    evaluation_state["rows_violating_permissions"].append(idx)
+                    validity = 0
+                    if violations is not None:
+                        violations.append(("duty", d))
+                else:
+                    d["required"] = 1
+                    for c in d["consequences"]:
+                        c["required"] = 1
+
+    # ----------------------------------------
+    # 4) PROHIBITIONS + REMEDIES
+    # ----------------------------------------
+    for f in matched_prohibitions:
+
+        remedies = f.get("remedies", [])
+
+        if not remedies:
+            evaluation_state["rows_violating_prohibitions"].append(idx)
+            validity = 0
+            if violations is not None:
+                violations.append(("prohibition", f))
+        else:
+            for r in remedies:
+                r["required"] = 1
+
+    return validity
+
+
+def evaluate_rows(evaluation_state, df, FEATURE_TYPE_MAP, OPS_MAP=OPS_MAP, deduplicate=False):
+    """
+    Row by row evaluation of a time ordered SotW. Updates the evaluation state and returns the
+    validity flag of this batch. deduplicate=True matches the rules once per distinct projection
+    of the rows on the columns read by the policy.
+    """
+    validity = 1
+
+    # Build the matching network once, the loop below only feeds it the rows
+    network = build_matching_network(evaluation_state, df.columns, FEATURE_TYPE_MAP, OPS_MAP, deduplicate=deduplicate)
+
+    for idx, values in zip(df.index, df.to_numpy()):
+        if not match_event(network, evaluation_state, idx, values):
+            validity = 0
+
+    return validity
+
+
+# ----------------------------------------
+# VECTORIZED ENGINE
+# ----------------------------------------
+# Whether a rule matches a row only depends on that row, except for odrl:count constraints, which
+# read the number of earlier matches of the same rule. The vectorized engine computes one boolean
+# mask per rule over whole columns, runs rules with count constraints through a sequential pass over
+# their candidate rows, and then derives the stateful bookkeeping (counters, required flags and
+# violating rows) from the masks in row order. Results are identical to the row loop.
+
+def has_count_constraint(constraint):
+    if is_logic_constraint(constraint):
+        return any(has_count_constraint(sub) for sub in constraint[1])
+    return isinstance(constraint, list) and len(constraint) == 3 and is_count_operand(constraint[0])
+
+
+def _column_context(df, FEATURE_TYPE_MAP, OPS_MAP):
+    """
+    Per-evaluation cache of the column views used to compute the masks.
+    """
+    return {
+        "df": df,
+        "n": len(df),
+        "columns": {column: i for i, column in enumerate(df.columns)},
+        "FEATURE_TYPE_MAP": FEATURE_TYPE_MAP,
+        "OPS_MAP": OPS_MAP,
+        "timestamp_cache": {},
+        "missing": {},
+        "cells": {},
+        "typed": {},
+        "time_index": {},
+        "vocabularies": {},
+        "categories": {},
+        "comparisons": {},
+        "logic": {},
+        "rule_masks": {},
+        "rows": None,
+    }
+
+
+def _missing_mask(context, column):
+    """
+    Mask of the cells for which eval_constraint returns False straight away (null or empty string).
+    """
+    if column not in context["missing"]:
+        series = context["df"][column]
+        mask = series.isna().to_numpy(dtype=bool)
+        if (pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)
+                or isinstance(series.dtype, pd.CategoricalDtype)):
+            mask = mask | (series == "").to_numpy(dtype=bool, na_value=False)
+        context["missing"][column] = mask
+    return context["missing"][column]
+
+
+def _cell_codes(context, column):
+    """
+    Factorize a column into codes and one representative value per code, so that a predicate can be
+    evaluated once per distinct cell. Null cells get the code -1.
+
+    Values of different types can compare equal and still print differently (1, 1.0 and True), and
+    eval_constraint looks at str(value). For mixed object columns the codes therefore also take the
+    string form of the cells into account.
+    """
+    if column not in context["cells"]:
+        series = context["df"][column]
+        codes, _ = pd.factorize(series, use_na_sentinel=True)
+
+        if pd.api.types.is_object_dtype(series.dtype) and pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+            text_codes, _ = pd.factorize(series.astype(str))
+            combined = codes.astype(np.int64) * (int(text_codes.max(initial=0)) + 1) + text_codes
+            combined[codes < 0] = -1
+            codes = combined
+
+        present = codes >= 0
+        _, first_positions, dense_codes = np.unique(codes[present], return_index=True, return_inverse=True)
+        codes = np.full(len(series), -1, dtype=np.int64)
+        codes[present] = dense_codes
+        representatives = series.to_numpy()[np.flatnonzero(present)[first_positions]]
+        context["cells"][column] = (codes, representatives)
+    return context["cells"][column]
+
+
+def _epoch_seconds(series):
+    """
+    Seconds since the epoch of a timezone aware datetime column, computed from whole microseconds
+    exactly as datetime.timestamp() does. NaT becomes NaN.
+    """
+    unit = series.dt.unit
+    raw = series.array.asi8
+    micros = raw // 1000 if unit == "ns" else raw * {"us": 1, "ms": 1000, "s": 1000000}[unit]
+    seconds = micros / 1e6
+    seconds[series.isna().to_numpy()] = np.nan
+    return seconds
+
+
+def _is_plain_numeric(dtype):
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def encode_iri_columns(df, FEATURE_TYPE_MAP):
+    """
+    Dictionary encode the IRI columns of a SotW (sh:IRI in FEATURE_TYPE_MAP, i.e. Party, Action and
+    Asset): each column becomes a categorical column whose integer codes index one vocabulary
+    shared by all of them, so that every IRI is stored once and identity comparisons are integer
+    comparisons. Columns that do not only hold strings are left as they are.
+    """
+    columns = [
+        column for column in df.columns
+        if FEATURE_TYPE_MAP.get(column) == SH_IRI and pd.api.types.infer_dtype(df[column], skipna=True) == "string"
+    ]
+
+    if not columns:
+        return df
+
+    vocabulary = pd.unique(np.concatenate([df[column].dropna().unique().astype(object) for column in columns]))
+    dtype = pd.CategoricalDtype(pd.Index(vocabulary, dtype=object))
+
+    return df.assign(**{column: df[column].astype(dtype) for column in columns})
+
+
+def _is_text_categorical(dtype):
+    return isinstance(dtype, pd.CategoricalDtype) and dtype.categories.inferred_type == "string"
+
+
+# Column views needed by each kind of comparison
+TYPED_VIEWS = {
+    "datetime": ("datetime",),
+    "numeric": ("number",),
+    "equality": ("text", "number"),
+}
+
+
+def _typed_column(context, column, view):
+    """
+    A column converted once for all the comparisons that use it. Returns (values, valid), where
+    valid marks the cells that are not missing and could be converted:
+      "number"   float64 values of float(cell)
+      "datetime" float64 seconds since the epoch of the parsed cell
+      "text"     integer codes of str(cell), the code of a string is in context["vocabularies"][column]
+    Conversions run once per distinct cell, or on the native array when the dtype allows it.
+    """
+    key = (column, view)
+
+    if key in context["typed"]:
+        return context["typed"][key]
+
+    series = context["df"][column]
+    present = ~_missing_mask(context, column)
+
+    if view == "text" and _is_text_categorical(series.dtype):
+        # dictionary encoded column, the codes of its vocabulary are used as they are
+        if series.dtype not in context["categories"]:
+            context["categories"][series.dtype] = {text: code for code, text in enumerate(series.dtype.categories)}
+        context["vocabularies"][column] = context["categories"][series.dtype]
+        typed = (series.cat.codes.to_numpy(), present)
+    elif view == "number" and _is_plain_numeric(series.dtype):
+        typed = (series.to_numpy(dtype=float, na_value=np.nan), present)
+    elif view == "datetime" and isinstance(series.dtype, pd.DatetimeTZDtype):
+        typed = (_epoch_seconds(series), present)
+    else:
+        codes, representatives = _cell_codes(context, column)
+
+        # one extra entry at the end for the code -1 of null cells
+        if view == "text":
+            texts = [str(value) for value in representatives]
+            text_codes, vocabulary = pd.factorize(pd.Index(texts, dtype=object))
+            context["vocabularies"][column] = {text: code for code, text in enumerate(vocabulary)}
+            table = np.append(text_codes.astype(np.int64), -1)
+            converted = np.append(np.ones(len(representatives), dtype=bool), False)
+        else:
+            convert = float if view == "number" else parse_timestamp
+            table = np.full(len(representatives) + 1, np.nan)
+            converted = np.zeros(len(representatives) + 1, dtype=bool)
+            for i, value in enumerate(representatives):
+                try:
+                    table[i] = convert(value)
+                    converted[i] = True
+                except Exception:
+                    pass
+
+        typed = (table[codes], converted[codes] & present)
+
+    context["typed"][key] = typed
+    return typed
+
+
+def prepare_columns(evaluation_state, context):
+    """
+    Convert every column referenced by the rules of an evaluation state to the views required by
+    the operators that are applied to it, so that the masks are computed on native arrays.
+    """
+    def prepare(constraint):
+        if is_logic_constraint(constraint):
+            for sub in constraint[1]:
+                prepare(sub)
+            return
+
+        if has_count_constraint(constraint):
+            return
+
+        left, op_symbol, right = constraint
+        column = resolve_left_operand(left, context["columns"])
+
+        if column is None:
+            return
+
+        comparison = compile_comparison(
+            op_symbol, right, column, context["OPS_MAP"], context["FEATURE_TYPE_MAP"], context["timestamp_cache"]
+        )
+        for view in TYPED_VIEWS.get(comparison["kind"], ()):
+            if view == "number" and comparison["right"] is None:
+                continue
+            _typed_column(context, column, view)
+
+    for rule_state in rule_states_in_order(evaluation_state):
+        if isinstance(rule_state, dict) and isinstance(rule_state.get("conditions"), list):
+            for constraint in rule_state["conditions"]:
+                prepare(constraint)
+
+
+def _time_index(context, column):
+    """
+    Seconds since the epoch of the dateTime cells of a column, if the rows are in time order with
+    the rows without a dateTime last (as sort_by_time leaves them), otherwise None. Checked once
+    per evaluation.
+    """
+    if column not in context["time_index"]:
+        values, valid = _typed_column(context, column, "datetime")
+        timed = int(valid.sum())
+        head = values[:timed]
+
+        if valid[:timed].all() and bool(np.all(head[1:] >= head[:-1])):
+            context["time_index"][column] = head
+        else:
+            context["time_index"][column] = None
+
+    return context["time_index"][column]
+
+
+def time_range_mask(comparison, context, column):
+    """
+    Mask of a range comparison (lt, lteq, gt, gteq or eq) on the sorted dateTime column: the rows
+    that satisfy it are a contiguous range, found by binary search in O(log n). Returns None when
+    the index does not apply.
+    """
+    if comparison["op"] not in TIME_RANGE_SIDES:
+        return None
+
+    times = _time_index(context, column)
+
+    if times is None:
+        return None
+
+    start_side, stop_side = TIME_RANGE_SIDES[comparison["op"]]
+    start = 0 if start_side is None else int(np.searchsorted(times, comparison["right"], side=start_side))
+    stop = len(times) if stop_side is None else int(np.searchsorted(times, comparison["right"], side=stop_side))
+
+    mask = np.zeros(context["n"], dtype=bool)
+    mask[start:stop] = True
+    return mask
+
+
+def comparison_mask(comparison, context, column):
+    """
+    Evaluate a compiled comparison over a whole column, on its typed views.
+    """
+    kind = comparison["kind"]
+
+    if kind is None:
+        return np.zeros(context["n"], dtype=bool)
+
+    if kind == "set":
+        # membership of each distinct cell, looked up by the codes of the rows
+        codes, representatives = _cell_codes(context, column)
+        predicate = comparison["predicate"]
+        hits = np.fromiter((predicate(value) for value in representatives), dtype=bool, count=len(representatives))
+        return np.append(hits, False)[codes]
+
+    op = comparison["op"]
+    right = comparison["right"]
+
+    if kind == "datetime" and column == DT_COL:
+        mask = time_range_mask(comparison, context, column)
+        if mask is not None:
+            return mask
+
+    with np.errstate(invalid="ignore"):
+        if kind in ("datetime", "numeric"):
+            values, valid = _typed_column(context, column, TYPED_VIEWS[kind][0])
+            return valid & op(values, right)
+
+        # equality: numbers compare as floats, anything else as strings
+        codes, present = _typed_column(context, column, "text")
+        right_code = context["vocabularies"][column].get(comparison["right_text"], -1)
+        text_mask = present & op(codes, right_code)
+
+        if right is None:
+            return text_mask
+
+        values, numeric = _typed_column(context, column, "number")
+        return np.where(numeric, op(values, right), text_mask)
+
+
+def logic_constraint_mask(logic_constraint, context):
+    n = context["n"]
+    logic_op = logic_constraint[0]
+    subconstraints = logic_constraint[1]
+
+    if logic_op.endswith("and") or logic_op.endswith("andSequence"):
+        mask = np.ones(n, dtype=bool)
+        for sub in subconstraints:
+            mask &= constraint_mask(sub, context)
+            if not mask.any():
+                break
+        return mask
+
+    if logic_op.endswith("or"):
+        mask = np.zeros(n, dtype=bool)
+        for sub in subconstraints:
+            mask |= constraint_mask(sub, context)
+            if mask.all():
+                break
+        return mask
+
+    if logic_op.endswith("xone"):
+        matches = np.zeros(n, dtype=np.int64)
+        for sub in subconstraints:
+            matches += constraint_mask(sub, context)
+        return matches == 1
+
+    return np.zeros(n, dtype=bool)
+
+
+def constraint_mask(constraint, context):
+    """
+    Vectorized counterpart of eval_constraint for constraints that do not depend on the rule state.
+    The masks of simple comparisons and logic constraints are cached in the context, so identical
+    constraints of different rules are evaluated once. Cached masks must not be modified.
+    """
+    n = context["n"]
+
+    if is_logic_constraint(constraint):
+        key = constraint_key(constraint)
+
+        if key is not None and key in context["logic"]:
+            return context["logic"][key]
+
+        mask = logic_constraint_mask(constraint, context)
+
+        if key is not None:
+            context["logic"][key] = mask
+
+        return mask
+
+    left, op_symbol, right = constraint
+    column = resolve_left_operand(left, context["columns"])
+
+    if column is None:
+        return np.zeros(n, dtype=bool)
+
+    # 1 and 1.0 are equal keys but compare differently as strings
+    key = (column, op_symbol, type(right), right)
+
+    try:
+        if key in context["comparisons"]:
+            return context["comparisons"][key]
+    except TypeError:
+        key = None
+
+    comparison = compile_comparison(
+        op_symbol, right, column, context["OPS_MAP"], context["FEATURE_TYPE_MAP"], context["timestamp_cache"]
+    )
+    mask = comparison_mask(comparison, context, column)
+
+    if key is not None:
+        context["comparisons"][key] = mask
+
+    return mask
+
+
+def static_rule_mask(rule_state, context):
+    """
+    Rows that satisfy the conditions of a rule other than its odrl:count constraints. These do
+    not depend on the rule state, so the mask of a SotW is the concatenation of the masks of its
+    parts. Returns None for rules with count constraints nested in logic constraints, which can
+    only be evaluated row by row.
+    """
+    n = context["n"]
+
+    if not isinstance(rule_state, dict):
+        return np.zeros(n, dtype=bool)
+
+    conditions = rule_state.get("conditions", [])
+
+    if not isinstance(conditions, list):
+        return np.zeros(n, dtype=bool)
+
+    if any(is_logic_constraint(c) and has_count_constraint(c) for c in conditions):
+        return None
+
+    # rules with the same conditions share their mask, which must not be modified
+    static_conditions = [c for c in conditions if not has_count_constraint(c)]
+    key = shared_key(static_conditions)
+
+    if key is not None and key in context["rule_masks"]:
+        return context["rule_masks"][key]
+
+    mask = np.ones(n, dtype=bool)
+    for c in static_conditions:
+        mask &= constraint_mask(c, context)
+        if not mask.any():
+            break
+
+    if key is not None:
+        context["rule_masks"][key] = mask
+
+    return mask
+
+
+def finish_rule_mask(rule_state, mask, context):
+    """
+    Rows matched by a rule given its static mask and the rule state at the start of the
+    evaluation.
+
+    Count constraints are evaluated in row order with a running counter, only on the rows of the
+    static mask. Count constraints nested in logic constraints fall back to the compiled row
+    closure.
+    """
+    if mask is None:
+        return _sequential_rule_mask(rule_state, context)
+
+    if not isinstance(rule_state, dict) or not isinstance(rule_state.get("conditions", []), list):
+        return mask
+
+    count_conditions = [c for c in rule_state.get("conditions", []) if has_count_constraint(c)]
+
+    if not count_conditions or not mask.any():
+        return mask
+
+    # windowed counts depend on the dateTime of the row, they are replayed on the rows of the mask
+    if any(c[0] != COUNT_OPERAND for c in count_conditions):
+        return _sequential_rule_mask(rule_state, context, mask)
+
+    OPS_MAP = context["OPS_MAP"]
+    count_checks = []
+    for _, op_symbol, right in count_conditions:
+        if op_symbol in SET_OPERATORS:
+            return np.zeros(context["n"], dtype=bool)
+        try:
+            count_checks.append((OPS_MAP[op_symbol], float(right)))
+        except Exception:
+            return np.zeros(context["n"], dtype=bool)
+
+    try:
+        count = float(rule_state.get("matches_count", 0))
+    except Exception:
+        return np.zeros(context["n"], dtype=bool)
+
+    mask = mask.copy()
+
+    for position in np.flatnonzero(mask):
+        if all(op(count, right) for op, right in count_checks):
+            count += 1
+        else:
+            mask[position] = False
+
+    return mask
+
+
+def rule_mask(rule_state, context):
+    """
+    Rows matched by a rule, given the rule state at the start of the evaluation.
+    """
+    return finish_rule_mask(rule_state, static_rule_mask(rule_state, context), context)
+
+
+def rule_states_in_order(evaluation_state):
+    """
+    All the rule states of an evaluation state, in the order in which the row loop visits them.
+    """
+    states = []
+
+    for p in evaluation_state["permissions"]:
+        states.append(p)
+        for d in p.get("duties", []):
+            states.append(d)
+            states.extend(d.get("consequences", []))
+
+    for f in evaluation_state["prohibitions"]:
+        states.append(f)
+        states.extend(f.get("remedies", []))
+
+    states.extend(evaluation_state["obligations"])
+
+    return states
+
+
+def _sequential_rule_mask(rule_state, context, candidates=None):
+    """
+    Rows matched by a rule, replaying its counters row by row. Only the rows of the candidates
+    mask are checked when it is given.
+    """
+    if context["rows"] is None:
+        context["rows"] = context["df"].to_numpy()
+
+    match = compile_rule(
+        rule_state, context["columns"], context["OPS_MAP"], context["FEATURE_TYPE_MAP"], context["timestamp_cache"]
+    )
+
+    rows = context["rows"]
+    positions = range(context["n"]) if candidates is None else np.flatnonzero(candidates)
+    dt_position = context["columns"].get(DT_COL)
+
+    mask = np.zeros(context["n"], dtype=bool)
+    initial_count = rule_state["matches_count"]
+    initial_windows = copy.deepcopy(rule_state.get("windows"))
+
+    for position in positions:
+        values = rows[position]
+        if match(values):
+            mask[position] = True
+            rule_state["matches_count"] += 1
+            if initial_windows and dt_position is not None:
+                record_window_matches(rule_state, values[dt_position])
+
+    rule_state["matches_count"] = initial_count
+    if initial_windows is not None:
+        rule_state["windows"] = initial_windows
+    return mask
+
+
+def _record_mask_matches(rule_state, mask, match_times):
+    """
+    Apply record_match for every matched row of a mask, in row order.
+    """
+    positions = np.flatnonzero(mask)
+
+    if positions.size == 0:
+        return positions
+
+    rule_state["matches_count"] += int(positions.size)
+
+    if rule_state.get("windows"):
+        for position in positions:
+            record_window_matches(rule_state, match_times["at"](position))
+
+    if rule_state["earliestMatch"] is None:
+        # record_match keeps replacing a missing earliestMatch, so the first match with a time wins
+        with_time = positions[match_times["valid"][positions]]
+        rule_state["earliestMatch"] = match_times["at"](with_time[0]) if with_time.size else None
+
+    rule_state["latestMatch"] = match_times["at"](positions[-1])
+
+    return positions
+
+
+def _final_required(rule_state, positions, last_set):
+    """
+    Replay the required flag of a rule: matches reset it, duties and prohibitions set it after the
+    matches of the same row. last_set is the last row where it was set, or -1.
+    """
+    last_match = int(positions[-1]) if positions.size else -1
+
+    if last_set >= 0 and last_set >= last_match:
+        rule_state["required"] = 1
+    elif last_match >= 0:
+        if last_set >= 0 or rule_state.get("required", 0) == 1:
+            rule_state["required"] = 0
+
+
+def evaluate_columns(evaluation_state, df, FEATURE_TYPE_MAP, OPS_MAP=OPS_MAP, static_masks=None, context=None):
+    """
+    Vectorized evaluation of a time ordered SotW. Updates the evaluation state like the row loop of
+    evaluate_ODRL_on_dataframe and returns the validity flag of this batch.
+
+    static_masks optionally gives the static_rule_mask of every rule of rule_states_in_order,
+    e.g. computed in parallel by sharded_static_masks. context optionally gives a column context
+    of df shared with the evaluation of other policies.
+    """
+    n = len(df)
+
+    if context is None:
+        context = _column_context(df, FEATURE_TYPE_MAP, OPS_MAP)
+
+    if DT_COL in context["columns"]:
+        # index the array when a match time is needed, instead of converting every cell to an object
+        dt_values = df[DT_COL].array
+        match_times = {
+            "valid": ~df[DT_COL].isna().to_numpy(dtype=bool),
+            "at": lambda position: parse_match_time(dt_values[position]),
+        }
+    else:
+        match_times = {"valid": np.zeros(n, dtype=bool), "at": lambda position: None}
+
+    # ----------------------------------------
+    # 1) MASKS OF ALL RULES
+    # ----------------------------------------
+    states = rule_states_in_order(evaluation_state)
+
+    if static_masks is None:
+        prepare_columns(evaluation_state, context)
+        static_masks = [static_rule_mask(rule_state, context) for rule_state in states]
+
+    masks = [
+        (rule_state, finish_rule_mask(rule_state, mask, context))
+        for rule_state, mask in zip(states, static_masks)
+    ]
+    mask_of = {id(rule_state): mask for rule_state, mask in masks}
+
+    permission_masks = []
+    for p in evaluation_state["permissions"]:
+        duty_masks = []
+        for d in p.get("duties", []):
+            duty_masks.append((d, mask_of[id(d)], [(c, mask_of[id(c)]) for c in d.get("consequences", [])]))
+        permission_masks.append((p, mask_of[id(p)], duty_masks))
+
+    prohibition_masks = []
+    for f in evaluation_state["prohibitions"]:
+        prohibition_masks.append((f, mask_of[id(f)], [(r, mask_of[id(r)]) for r in f.get("remedies", [])]))
+
+    # ----------------------------------------
+    # 2) PERMISSION VIOLATIONS + DUTIES / CONSEQUENCES
+    # ----------------------------------------
+    last_set = {}
+    permission_violations = np.zeros(n, dtype=np.int64)
+    any_permission = np.zeros(n, dtype=bool)
+
+    for p, pmask, duty_masks in permission_masks:
+        any_permission |= pmask
+
+        for d, dmask, consequence_masks in duty_masks:
+            if d["matches_count"] != 0 or d.get("required", 0) != 0:
+                continue
+
+            # rows where the permission matched before the duty was ever fulfilled
+            triggered = pmask & (np.cumsum(dmask) == 0)
+
+            if not triggered.any():
+                continue
+
+            if not d.get("consequences"):
+                permission_violations += triggered
+            else:
+                first = int(np.argmax(triggered))
+                last_set[id(d)] = first
+                for c, _ in consequence_masks:
+                    last_set[id(c)] = max(last_set.get(id(c), -1), first)
+
+    permission_violations += ~any_permission
+
+    # ----------------------------------------
+    # 3) PROHIBITIONS + REMEDIES
+    # ----------------------------------------
+    prohibition_violations = np.zeros(n, dtype=np.int64)
+
+    for f, fmask, remedy_masks in prohibition_masks:
+        if not f.get("remedies", []):
+            prohibition_violations += fmask
+        elif fmask.any():
+            last = int(np.flatnonzero(fmask)[-1])
+            for r, _ in remedy_masks:
+                last_set[id(r)] = max(last_set.get(id(r), -1), last)
+
+    # ----------------------------------------
+    # 4) STATE UPDATES IN ROW ORDER
+    # ----------------------------------------
+    for rule_state, mask in masks:
+        positions = _record_mask_matches(rule_state, mask, match_times)
+        _final_required(rule_state, positions, last_set.get(id(rule_state), -1))
+
+    positions = np.arange(n)
+    evaluation_state["rows_violating_permissions"].extend(
+        df.index[np.repeat(positions, permission_violations)].tolist()
+    )
+    evaluation_state["rows_violating_prohibitions"].extend(
+        df.index[np.repeat(positions, prohibition_violations)].tolist()
+    )
+
+    if permission_violations.any() or prohibition_violations.any():
+        return 0
+    return 1
+
+
+# ----------------------------------------
+# MULTI-PROCESS EVALUATION
+# ----------------------------------------
+# The static masks of the rules are the expensive part of the vectorized engine and do not depend
+# on the rule state, so they are computed on time ordered shards of the SotW in a process pool.
+# Counters, odrl:count constraints and the duty, consequence and remedy bookkeeping are then
+# reduced in row order by evaluate_columns, which gives the single process result.
+
+# Below this number of rows per shard, the work is not worth the cost of a process
+PARALLEL_MIN_ROWS_PER_SHARD = 5000
+
+
+def _shard_static_masks(args):
+    rules, shard, FEATURE_TYPE_MAP, OPS_MAP = args
+    context = _column_context(shard, FEATURE_TYPE_MAP, OPS_MAP)
+    return [static_rule_mask(rule, context) for rule in rules]
+
+
+def sharded_static_masks(evaluation_state, df, FEATURE_TYPE_MAP, processes, OPS_MAP=OPS_MAP):
+    """
+    static_rule_mask of every rule of rule_states_in_order over df, computed on up to processes
+    contiguous shards of the rows in a process pool.
+    """
+    states = rule_states_in_order(evaluation_state)
+    shards = max(1, min(processes, len(df) // PARALLEL_MIN_ROWS_PER_SHARD))
+
+    # Only the conditions are needed by the workers
+    rules = [
+        {"conditions": rule_state.get("conditions", [])} if isinstance(rule_state, dict) else rule_state
+        for rule_state in states
+    ]
+
+    if shards == 1:
+        return _shard_static_masks((rules, df, FEATURE_TYPE_MAP, OPS_MAP))
+
+    bounds = np.linspace(0, len(df), shards + 1).astype(int)
+    tasks = [
+        (rules, df.iloc[start:end], FEATURE_TYPE_MAP, OPS_MAP)
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
+
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        shard_masks = list(pool.map(_shard_static_masks, tasks))
+
+    masks = []
+    for i in range(len(states)):
+        parts = [part[i] for part in shard_masks]
+        masks.append(None if any(part is None for part in parts) else np.concatenate(parts))
+
+    return masks
+
+
+def evaluation_result(evaluation_state, validity=1):
+    """
+    Build the result tuple of an evaluation from its state and the validity flag of the rows
+    evaluated last.
+    """
+    temporary_validity = validity
+    if (
+            len(evaluation_state["rows_violating_permissions"]) > 0
+            or len(evaluation_state["rows_violating_prohibitions"]) > 0
+    ):
+        temporary_validity = 0
+
+    obligations_not_satisfied = []
+    unfulfilled_duties = []
+    unfulfilled_consequences = []
+    unfulfilled_remedies = []
+
+    # ---- OBLIGATIONS ----
+    for o in evaluation_state["obligations"]:
+        if o["matches_count"] < 1:
+            obligations_not_satisfied.append(o)
+            temporary_validity = 0
+
+    # ---- DUTIES + CONSEQUENCES ----
+    for p in evaluation_state["permissions"]:
+        for d in p.get("duties", []):
+
+            if d.get("required") == 1:
+                unfulfilled_duties.append(d)
+                temporary_validity = 0
+
+            for c in d.get("consequences", []):
+                if c.get("required") == 1:
+                    unfulfilled_consequences.append(c)
+                    temporary_validity = 0
+
+    # ---- REMEDIES ----
+    for f in evaluation_state["prohibitions"]:
+        for r in f.get("remedies", []):
+            if r.get("required") == 1:
+                unfulfilled_remedies.append(r)
+                temporary_validity = 0
+
+    return (
+        evaluation_state,
+        temporary_validity,
+        evaluation_state["rows_violating_permissions"],
+        evaluation_state["rows_violating_prohibitions"],
+        obligations_not_satisfied,
+        unfulfilled_duties,
+        unfulfilled_consequences,
+        unfulfilled_remedies
+    )
+
+
+def evaluate_ODRL_on_df(ODRL_graph, df, evaluation_state=None, engine="rows"):
+    policies, features = rdf_utils.extract_rules_and_features_from_policy(
+        ODRL_graph
+    )
+
+    feature_type_map = {
+        f["iri"]: f["type"]
+        for f in features
+    }
+
+    return evaluate_ODRL_on_dataframe(
+        policies[0],
+        df,
+        feature_type_map,
+        engine=engine
+    )
+
+
+def sort_by_time(df):
+    """
+    Rows of a SotW, whose dateTime column is already converted to timestamps, in time order with
+    the rows without a dateTime last. Event logs usually arrive in time order, so a SotW that is
+    already sorted is returned as it is instead of being sorted again. Rows with the same dateTime
+    keep their order, as in the external sort of evaluate_ODRL_on_csv_out_of_core.
+    """
+    times = df[DT_COL]
+    present = times.notna().to_numpy()
+    timed = int(present.sum())
+
+    if present[:timed].all() and times.iloc[:timed].is_monotonic_increasing:
+        return df
+
+    return df.sort_values(by=DT_COL, ascending=True, kind="mergesort")
+
+
+def evaluate_ODRL_on_dataframe(policy, df, FEATURE_TYPE_MAP, evaluation_state=None, engine="rows", processes=None):
+    """
+    Evaluate a policy on a SotW with one of the ENGINES. With processes > 1, the rules are
+    matched on shards of the rows in a process pool and the shards are always reduced by the
+    vectorized engine, whatever the engine: the engines give the same result.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown evaluation engine: {engine}")
+
+    if isinstance(policy, list):
+        policy = policy[0]
+
+    # Ensure time ordering
+    DT_COL = "http://www.w3.org/ns/odrl/2/dateTime"
+
+    if DT_COL in df.columns:
+        df[DT_COL] = external_sort.parse_times(df[DT_COL])
+        df = sort_by_time(df)
+
+    evaluation_state = load_evaluation_state(evaluation_state, policy)
+
+    if (processes is not None and processes > 1) or engine == "vectorized":
+        df = encode_iri_columns(df, FEATURE_TYPE_MAP)
+
+    if processes is not None and processes > 1:
+        # Rules are matched in a process pool, the vectorized engine reduces the shards
+        static_masks = sharded_static_masks(evaluation_state, df, FEATURE_TYPE_MAP, processes)
+        validity = evaluate_columns(evaluation_state, df, FEATURE_TYPE_MAP, static_masks=static_masks)
+    elif engine == "vectorized":
+        validity = evaluate_columns(evaluation_state, df, FEATURE_TYPE_MAP)
+    else:
+        validity = evaluate_rows(evaluation_state, df, FEATURE_TYPE_MAP, deduplicate=(engine == "deduplicated"))
+
+    return evaluation_result(evaluation_state, validity)
+
+# Rows converted from the SotW at a time by the fail-fast validity check
+FAIL_FAST_BLOCK_ROWS = 1024
+
+
+def evaluate_ODRL_validity_on_dataframe(policy, df, FEATURE_TYPE_MAP, evaluation_state=None, engine="rows"):
+    """
+    Fail-fast check of the validity of a SotW, for callers that only need the validity flag of
+    evaluate_ODRL_on_dataframe.
+
+    The rows are matched in time order until the first one that violates the policy (it matches
+    no permission, a duty without consequences or a prohibition without remedies), which decides
+    the outcome. Obligations, duties, consequences and remedies still required are only looked at
+    once all rows are processed. The evaluation state is left as it is at the point where the
+    check stops.
+
+    Returns (validity, witness). witness is None for a valid SotW, otherwise a dict with the kind
+    of "violation" ("permission", "duty", "prohibition", "obligation", "consequence" or
+    "remedy"), the index of the violating "row" (None for rules that are not fulfilled at the end)
+    and the state of the violated "rule" (None when no permission matches).
+    """
+    if isinstance(policy, list):
+        policy = policy[0]
+
+    if engine not in ("rows", "deduplicated"):
+        raise ValueError(f"Unknown evaluation engine for a validity check: {engine}")
+
+    evaluation_state = load_evaluation_state(evaluation_state, policy)
+
+    # violations of earlier evaluations decide the outcome straight away
+    if evaluation_state["rows_violating_permissions"]:
+        return 0, {"violation": "permission", "row": evaluation_state["rows_violating_permissions"][0], "rule": None}
+
+    if evaluation_state["rows_violating_prohibitions"]:
+        return 0, {"violation": "prohibition", "row": evaluation_state["rows_violating_prohibitions"][0], "rule": None}
+
+    if DT_COL in df.columns:
+        df = df.assign(**{DT_COL: external_sort.parse_times(df[DT_COL])})
+        df = sort_by_time(df)
+
+    network = build_matching_network(evaluation_state, df.columns, FEATURE_TYPE_MAP, deduplicate=(engine == "deduplicated"))
+    violations = []
+
+    # rows are converted block by block, so that an early violation does not convert the whole SotW
+    for start in range(0, len(df), FAIL_FAST_BLOCK_ROWS):
+        block = df.iloc[start:start + FAIL_FAST_BLOCK_ROWS]
+
+        for idx, values in zip(block.index, block.to_numpy()):
+            if not match_event(network, evaluation_state, idx, values, violations=violations):
+                kind, rule = violations[0]
+                return 0, {"violation": kind, "row": idx, "rule": rule}
+
+    result = evaluation_result(evaluation_state)
+
+    for kind, rules in zip(("obligation", "duty", "consequence", "remedy"), result[4:]):
+        if rules:
+            return 0, {"violation": kind, "row": None, "rule": rules[0]}
+
+    return 1, None
+
+
+def evaluate_policies_on_dataframe(policies, df, FEATURE_TYPE_MAP, evaluation_states=None, engine="rows"):
+    """
+    Evaluate every policy of a list (as returned by extract_rule_list_from_policy) on the same SotW
+    in a single pass over its rows.
+
+    The dateTime column is converted and sorted once. The row engine feeds each row to the
+    matching networks of all the policies, which share their alpha nodes, so a comparison used
+    by several policies is evaluated once per row. The vectorized engine shares the column
+    context, so the mask of a comparison is computed once for all policies.
+
+    evaluation_states optionally maps policy IRIs to previous evaluation states. Returns a dict
+    from policy IRI to the result tuple of evaluate_ODRL_on_dataframe.
+    """
+    if DT_COL in df.columns:
+        df[DT_COL] = external_sort.parse_times(df[DT_COL])
+        df = sort_by_time(df)
+
+    evaluation_states = evaluation_states or {}
+    states = {}
+
+    for policy in policies:
+        iri = policy.get("policy_iri")
+        states[iri] = load_evaluation_state(evaluation_states.get(iri), policy)
+
+    validity = {iri: 1 for iri in states}
+
+    if engine == "vectorized":
+        df = encode_iri_columns(df, FEATURE_TYPE_MAP)
+        context = _column_context(df, FEATURE_TYPE_MAP, OPS_MAP)
+        for iri, evaluation_state in states.items():
+            validity[iri] = evaluate_columns(evaluation_state, df, FEATURE_TYPE_MAP, context=context)
+
+    elif engine in ("rows", "deduplicated"):
+        alphas = new_alpha_table()
+        networks = [
+            (iri, evaluation_state, build_matching_network(
+                evaluation_state, df.columns, FEATURE_TYPE_MAP, alphas=alphas, deduplicate=(engine == "deduplicated")
+            ))
+            for iri, evaluation_state in states.items()
+        ]
+
+        for idx, values in zip(df.index, df.to_numpy()):
+            for i, (iri, evaluation_state, network) in enumerate(networks):
+                if not match_event(network, evaluation_state, idx, values, new_event=(i == 0)):
+                    validity[iri] = 0
+
+    else:
+        raise ValueError(f"Unknown evaluation engine: {engine}")
+
+    return {iri: evaluation_result(evaluation_state, validity[iri]) for iri, evaluation_state in states.items()}
+
+
+def evaluate_ODRL_on_csv_out_of_core(policy, SotW_file, FEATURE_TYPE_MAP, evaluation_state=None, memory_budget_mb=256,
+                                     engine="rows"):
+    """
+    Evaluate a policy on a SotW CSV file that does not fit in memory.
+
+    The file is sorted by dateTime with an external merge sort (see external_sort.py) and the
+    time ordered chunks are evaluated one after the other, carrying the evaluation state. Only
+    about memory_budget_mb of SotW rows are held in memory at any time. Rows are identified by
+    their row number in the file; rows with the same dateTime are evaluated in file order.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown evaluation engine: {engine}")
+
+    if isinstance(policy, list):
+        policy = policy[0]
+
+    evaluation_state = load_evaluation_state(evaluation_state, policy)
+
+    validity = 1
+
+    for chunk in external_sort.iter_csv_by_time(SotW_file, DT_COL, memory_budget_mb):
+        if engine == "vectorized":
+            # as in evaluate_ODRL_on_dataframe, each chunk with its own IRI vocabulary
+            chunk = encode_iri_columns(chunk, FEATURE_TYPE_MAP)
+            chunk_validity = evaluate_columns(evaluation_state, chunk, FEATURE_TYPE_MAP)
+        else:
+            chunk_validity = evaluate_rows(evaluation_state, chunk, FEATURE_TYPE_MAP, deduplicate=(engine == "deduplicated"))
+
+        if not chunk_validity:
+            validity = 0
+
+    return evaluation_result(evaluation_state, validity)
+
+
+def evaluate_ODRL_from_files(policy_file, SotW_file, state_file=None, normalise=False, engine="rows",
+                             memory_budget_mb=None):
+    cached = policy_cache.cached_policy_from_file(policy_file, normalise)
+    policies = cached["policies"]
+
+    evaluation_state = None
+
+    if state_file and os.path.exists(state_file):
+        evaluation_state = read_state_file(state_file)
+
+    FEATURE_TYPE_MAP = cached["FEATURE_TYPE_MAP"]
+
+    # SotW files larger than memory are sorted on disk and evaluated chunk by chunk
+    if memory_budget_mb is not None:
+        return evaluate_ODRL_on_csv_out_of_core(
+            policies[0], SotW_file, FEATURE_TYPE_MAP, evaluation_state, memory_budget_mb=memory_budget_mb, engine=engine
+        )
+
+    df = pd.read_csv(SotW_file)
+
+    return evaluate_ODRL_on_dataframe(policies[0], df, FEATURE_TYPE_MAP, evaluation_state, engine=engine)
+
+def evaluate_ODRL_from_files_all_policies(policy_file, SotW_file, normalise=False, engine="rows"):
+    """
+    Evaluate every policy of a policy file on a SotW file in a single pass, see
+    evaluate_policies_on_dataframe. Returns a dict from policy IRI to result tuple.
+    """
+    cached = policy_cache.cached_policy_from_file(policy_file, normalise)
+
+    df = pd.read_csv(SotW_file)
+
+    return evaluate_policies_on_dataframe(cached["policies"], df, cached["FEATURE_TYPE_MAP"], engine=engine)
+
+def evaluate_ODRL_from_strings(
+    policy_text,
+    sotw_csv,
+    evaluation_state=None,
+    engine="rows"
+):
+    # the same policies are sent again and again, they are parsed and extracted once
+    cached = policy_cache.cached_policy_from_string(
+        policy_text
+    )
+
+    policies = cached["policies"]
+
+    feature_type_map = cached["FEATURE_TYPE_MAP"]
+
+    df = pd.read_csv(
+        StringIO(sotw_csv)
+    )
+
+    return evaluate_ODRL_on_dataframe(
+        policies[0],
+        df,
+        feature_type_map,
+        evaluation_state,
+        engine=engine
+    )
+
+
+class EvaluationSession:
+    """
+    In-memory streaming evaluation of a policy.
+
+    The policy is extracted and compiled once, the evaluation state is kept in memory between
+    batches and only written to disk when checkpoint is called. Events can be given as
+    DataFrames (each batch is ordered by dateTime, as in evaluate_ODRL_on_dataframe), as dicts
+    from SotW column to value (processed in arrival order), or as iterables of either.
+    """
+
+    def __init__(self, policy, FEATURE_TYPE_MAP, evaluation_state=None, engine="rows", OPS_MAP=OPS_MAP):
+        if isinstance(policy, list):
+            policy = policy[0]
+
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown evaluation engine: {engine}")
+
+        self.policy = policy
+        self.FEATURE_TYPE_MAP = FEATURE_TYPE_MAP
+        self.OPS_MAP = OPS_MAP
+        self.engine = engine
+        self.evaluation_state = load_evaluation_state(evaluation_state, policy)
+        self.validity = 1
+        self.events_seen = 0
+        self.network = None
+        self.rule_ids = None
+        self.checkpoint_writer = None
+
+    @classmethod
+    def from_file(cls, policy_file, state_file=None, normalise=False, engine="rows"):
+        cached = policy_cache.cached_policy_from_file(policy_file, normalise)
+
+        evaluation_state = None
+
+        if state_file and os.path.exists(state_file):
+            evaluation_state = read_state_file(state_file)
+
+        return cls(cached["policies"][0], cached["FEATURE_TYPE_MAP"], evaluation_state, engine=engine)
+
+    def _network_for(self, columns):
+        # The network is rebuilt only when the SotW columns change, the rule states are kept
+        if self.network is None or self.network["columns"] != list(columns):
+            self.network = build_matching_network(
+                self.evaluation_state, columns, self.FEATURE_TYPE_MAP, self.OPS_MAP,
+                deduplicate=(self.engine == "deduplicated")
+            )
+        return self.network
+
+    def _evaluate_dataframe(self, df):
+        if DT_COL in df.columns:
+            df = df.assign(**{DT_COL: external_sort.parse_times(df[DT_COL])})
+            df = sort_by_time(df)
+
+        self.events_seen += len(df)
+
+        if self.engine == "vectorized":
+            return evaluate_columns(self.evaluation_state, df, self.FEATURE_TYPE_MAP, self.OPS_MAP)
+
+        network = self._network_for(df.columns)
+        validity = 1
+
+        for idx, values in zip(df.index, df.to_numpy()):
+            if not match_event(network, self.evaluation_state, idx, values):
+                validity = 0
+
+        return validity
+
+    def _evaluate_event(self, event):
+        columns = self.network["columns"] if self.network is not None else []
+        new_columns = [column for column in event if column not in columns]
+
+        network = self._network_for(columns + new_columns)
+
+        idx = self.events_seen
+        self.events_seen += 1
+
+        return match_event(network, self.evaluation_state, idx, event_values(network, event))
+
+    def evaluate(self, events):
+        """
+        Evaluate a batch of events and update the session state. Returns 0 if the batch violates
+        the policy, 1 otherwise. Rows of DataFrames are identified by their index, dict events by
+        their position in the stream.
+        """
+        if isinstance(events, pd.DataFrame):
+            validity = self._evaluate_dataframe(events)
+        elif isinstance(events, dict):
+            validity = self._evaluate_event(events)
+        else:
+            validity = 1
+            for batch in events:
+                if not self.evaluate(batch):
+                    validity = 0
+
+        if not validity:
+            self.validity = 0
+
+        return validity
+
+    def result(self):
+        """
+        Result tuple of the evaluation so far, as returned by evaluate_ODRL_on_dataframe.
+        """
+        return evaluation_result(self.evaluation_state, self.validity)
+
+    def checkpoint(self, state_file):
+        """
+        Save the compact evaluation state (see compact_evaluation_state) to a file: as JSON if
+        its name ends with .json, otherwise as a binary checkpoint. Successive checkpoints of a
+        session to the same binary file only append the changes since the previous one.
+        """
+        if self.rule_ids is None:
+            self.rule_ids = state_rule_ids(self.evaluation_state)
+
+        if state_file.endswith(".json"):
+            with open(state_file, "w") as f:
+                json.dump(compact_evaluation_state(self.evaluation_state, self.rule_ids), f, default=str)
+            return
+
+        # match times are stored as typed timestamps
+        compact_state = compact_evaluation_state(self.evaluation_state, self.rule_ids, iso_times=False)
+
+        if self.checkpoint_writer is None or self.checkpoint_writer.path != state_file:
+            self.checkpoint_writer = evaluation_checkpoint.CheckpointWriter(state_file)
+
+        self.checkpoint_writer.write(compact_state)
+
+
+# ----------------------------------------
+# POLICY DECISION POINT
+# ----------------------------------------
+
+def to_utc_datetime(value):
+    """
+    Convert the dateTime of a single request as to_utc_timestamp does, without pandas for
+    datetimes and ISO 8601 strings. Naive dates are taken as UTC.
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, datetime):
+        date = value
+    else:
+        try:
+            date = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return to_utc_timestamp(value)
+
+    if date.tzinfo is None:
+        return date.replace(tzinfo=timezone.utc)
+    return date.astimezone(timezone.utc)
+
+
+def policy_columns(evaluation_state, FEATURE_TYPE_MAP):
+    """
+    The features of a policy followed by the other left operands of its rules, other than
+    odrl:count.
+    """
+    columns = list(FEATURE_TYPE_MAP)
+
+    def visit(constraint):
+        if is_logic_constraint(constraint):
+            for sub in constraint[1]:
+                visit(sub)
+        elif isinstance(constraint, list) and constraint and isinstance(constraint[0], str):
+            if not is_count_operand(constraint[0]) and constraint[0] not in columns:
+                columns.append(constraint[0])
+
+    for rule_state in rule_states_in_order(evaluation_state):
+        if isinstance(rule_state, dict) and isinstance(rule_state.get("conditions", []), list):
+            for constraint in rule_state.get("conditions", []):
+                visit(constraint)
+
+    return columns
+
+
+def event_decision(network, evaluation_state, values):
+    """
+    Validity that match_event would return for an event, without updating the evaluation state.
+    Like match_event, only the rules that can match the Action, Party, Asset and dateTime of the
+    event are checked.
+    """
+    network["alphas"]["memory"].clear()
+
+    matched = set()
+    matched_permissions = []
+    matched_prohibitions = []
+
+    for kind, node in timed_candidate_rules(network["rule_index"], values):
+        if node["match"](values):
+            matched.add(id(node["state"]))
+            if kind == "permission":
+                matched_permissions.append(node["state"])
+            elif kind == "prohibition":
+                matched_prohibitions.append(node["state"])
+
+    if not matched_permissions:
+        return 0
+
+    # a duty matched by the event itself counts as fulfilled, as match_event records it first
+    for p in matched_permissions:
+        for d in p.get("duties", []):
+            matches_count = d["matches_count"] + (1 if id(d) in matched else 0)
+            if matches_count == 0 and d.get("required", 0) == 0 and not d.get("consequences"):
+                return 0
+
+    for f in matched_prohibitions:
+        if not f.get("remedies"):
+            return 0
+
+    return 1
+
+
+class PolicyDecisionPoint:
+    """
+    Online Policy Decision Point: single access requests in, "permit" or "deny" out.
+
+    The policy is extracted and compiled once. A request is a dict from SotW column to value and
+    is permitted when match_event would find it valid: it matches a permission, and neither a
+    duty without consequences nor a prohibition without remedies is violated. By default the
+    decision leaves the evaluation state untouched. With update_state=True the request is also
+    recorded in the state, as an event of an EvaluationSession would be.
+    """
+
+    PERMIT = "permit"
+    DENY = "deny"
+
+    def __init__(self, policy, FEATURE_TYPE_MAP, evaluation_state=None, columns=None, OPS_MAP=OPS_MAP):
+        if isinstance(policy, list):
+            policy = policy[0]
+
+        self.policy = policy
+        self.evaluation_state = load_evaluation_state(evaluation_state, policy)
+        self.requests_seen = 0
+
+        # requests are read on the features and left operands of the policy unless other columns are given
+        if columns is None:
+            columns = policy_columns(self.evaluation_state, FEATURE_TYPE_MAP)
+
+        self.network = build_matching_network(self.evaluation_state, list(columns), FEATURE_TYPE_MAP, OPS_MAP)
+
+    @classmethod
+    def from_file(cls, policy_file, state_file=None, normalise=False):
+        cached = policy_cache.cached_policy_from_file(policy_file, normalise)
+
+        evaluation_state = None
+
+        if state_file and os.path.exists(state_file):
+            evaluation_state = read_state_file(state_file)
+
+        return cls(cached["policies"][0], cached["FEATURE_TYPE_MAP"], evaluation_state)
+
+    @classmethod
+    def from_string(cls, policy_text, evaluation_state=None):
+        cached = policy_cache.cached_policy_from_string(policy_text)
+        return cls(cached["policies"][0], cached["FEATURE_TYPE_MAP"], evaluation_state)
+
+    @classmethod
+    def from_graph(cls, graph, evaluation_state=None):
+        policies, features = rdf_utils.extract_rules_and_features_from_policy(graph)
+        return cls(policies[0], {f["iri"]: f["type"] for f in features}, evaluation_state)
+
+    def request_values(self, request):
+        values = [request.get(column) for column in self.network["columns"]]
+
+        dt_position = self.network["dt_position"]
+        if dt_position is not None:
+            values[dt_position] = to_utc_datetime(values[dt_position])
+
+        return values
+
+    def decide(self, request, update_state=False):
+        """
+        Decision on a single access request.
+        """
+        values = self.request_values(request)
+
+        if update_state:
+            validity = match_event(self.network, self.evaluation_state, self.requests_seen, values)
+            self.requests_seen += 1
+        else:
+            validity = event_decision(self.network, self.evaluation_state, values)
+
+        return self.PERMIT if validity else self.DENY
+
+
+def evaluate_ODRL_from_files_streaming(policy_file, SotW_file, max_rows_per_SotW=1, normalise=False, engine="rows"):
+    """
+    Simulate the streaming of a SotW by splitting it into time ordered batches of at most
+    max_rows_per_SotW rows, evaluated one after the other by an EvaluationSession.
+    """
+
+    # ----------------------------------------
+    # 1) LOAD POLICY + FEATURES (ONCE)
+    # ----------------------------------------
+    session = EvaluationSession.from_file(policy_file, normalise=normalise, engine=engine)
+
+    # ----------------------------------------
+    # 2) LOAD + SORT SOTW
+    # ----------------------------------------
+    df = pd.read_csv(SotW_file)
+
+    if DT_COL in df.columns:
+        df[DT_COL] = external_sort.parse_times(df[DT_COL])
+        df = sort_by_time(df)
+
+    # ----------------------------------------
+    # 3) PROCESS BATCHES SEQUENTIALLY
+    # ----------------------------------------
+    if len(df) == 0:
+        return None
 
-        with open(state_file, "w") as f:
-            json.dump(evaluation_state, f, default=str, indent=2)
+    for start in range(0, len(df), max_rows_per_SotW):
+        session.evaluate(df.iloc[start:start + max_rows_per_SotW])
 
     # ----------------------------------------
-    # 6) RETURN FINAL RESULT
+    # 4) RETURN FINAL RESULT
     # ----------------------------------------
-    return result
+    return session.result()
 
 
 #result = evaluate_ODRL_from_files("example_policies/GATE_Test/GATE_Policy_Test_Edited.jsonld",
@@ -110,8 +110,7 @@ def generate_pd_state_of_the_world_from_policies(
     chance_feature_empty=0.5,
     attempts_for_chosen_validity = 10
 ):
-    features = rdf_utils.extract_features_list_from_policy(odrl_graph)
-    policy_list = rdf_utils.extract_rule_list_from_policy(odrl_graph)
+    policy_list, features = rdf_utils.extract_rules_and_features_from_policy(odrl_graph)
 
     feature_iris = [f["iri"] for f in features]
 
@@ -2,7 +2,7 @@ import os
 from fastapi import FastAPI, HTTPException
 
 
-import rdf_utils
+import policy_cache
 import ODRL_Evaluator as Evaluator
 import validate as Validator
 
@@ -26,7 +26,7 @@ app = FastAPI(
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "policy_cache": policy_cache.cache_stats()}
 
 
 @app.post(
@@ -53,7 +53,7 @@ def evaluate_policy_on_sotw(request: EvaluateRequest):
     ) = result
 
     return EvaluateResponse(
-        evaluation_state=evaluation_state,
+        evaluation_state=Evaluator.compact_evaluation_state(evaluation_state),
         valid=bool(validity),
         rows_violating_permissions=permission_rows,
         rows_violating_prohibitions=prohibition_rows,
@@ -69,9 +69,9 @@ def evaluate_policy_on_sotw(request: EvaluateRequest):
 )
 def get_policy_features(request: PolicyFeaturesRequest):
     try:
-        features = rdf_utils.extract_features_list_from_string(
+        features = policy_cache.cached_policy_from_string(
             request.policy
-        )
+        )["features"]
         return PolicyFeaturesResponse(features=features)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -93,7 +93,9 @@ class EvaluateResponse(BaseModel):
         description=(
             "The Evaluation State object in JSON format. "
             "It contains information that can be used to restart evaluation on newer States of the World if "
-            "the evaluation is done in batches or streaming."
+            "the evaluation is done in batches or streaming. "
+            "Only the match counters, match times and required flags of the rules are returned, "
+            "keyed by rule ids derived from the content of the rules."
         )
     )
     valid: bool = Field(
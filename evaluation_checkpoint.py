@@ -0,0 +1,384 @@
+import os
+import json
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Binary checkpoints of compact evaluation states (see compact_evaluation_state in
+# ODRL_Evaluator.py). A checkpoint file is a header followed by records: a snapshot of the whole
+# state, then delta records holding only the rules that changed and the rows appended to the
+# lists of violating rows since the previous record. Every record carries its length and a
+# CRC32, so a record torn by a crash while it was appended is detected and ignored.
+
+MAGIC = b"ODRLCKP1"
+
+SNAPSHOT = b"S"
+DELTA = b"D"
+
+# Delta records appended before the file is rewritten as a single snapshot
+COMPACT_EVERY = 64
+
+RECORD_HEADER = struct.Struct("<cI")
+CRC = struct.Struct("<I")
+LENGTH = struct.Struct("<I")
+INT64 = struct.Struct("<q")
+
+NO_STRING = 0xFFFFFFFF
+
+EPOCH = pd.Timestamp(0, tz="UTC")
+MICROSECOND = pd.Timedelta(microseconds=1)
+
+# Tags of the match times of a rule
+TIME_NONE = 0
+TIME_MICROS = 1
+TIME_STRING = 2
+
+# Tags of a rule entry of a delta record
+RULE_SET = 0
+RULE_REMOVED = 1
+
+# Tags of a list of violating rows
+ROWS_INT = b"i"
+ROWS_JSON = b"j"
+
+
+def is_checkpoint_file(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+# Sliding windows of odrl:count constraints (see ODRL_Evaluator.py) follow the rows of a record,
+# as JSON strings keyed by rule id. Records written before windows existed end with the rows.
+
+# ----------------------------------------
+# ENCODING
+# ----------------------------------------
+
+def _pack_string(value):
+    if value is None:
+        return LENGTH.pack(NO_STRING)
+    data = str(value).encode("utf-8")
+    return LENGTH.pack(len(data)) + data
+
+
+def _pack_time(value):
+    """
+    Match times are stored as microseconds since the epoch in UTC, or as strings when they cannot
+    be read as dates.
+    """
+    if value is None:
+        return bytes([TIME_NONE])
+
+    try:
+        time = value if isinstance(value, pd.Timestamp) else pd.Timestamp(value)
+        if time.tzinfo is None:
+            time = time.tz_localize("UTC")
+        if pd.isna(time):
+            raise ValueError(value)
+        try:
+            micros = time.value // 1000
+        except OverflowError:
+            # outside the nanosecond range of pandas
+            micros = (time - EPOCH) // MICROSECOND
+        return bytes([TIME_MICROS]) + INT64.pack(micros)
+    except (TypeError, ValueError, OverflowError):
+        return bytes([TIME_STRING]) + _pack_string(value)
+
+
+def _pack_rule(rule_id, fields):
+    return (
+        _pack_string(rule_id)
+        + INT64.pack(int(fields.get("matches_count", 0)))
+        + _pack_time(fields.get("earliestMatch"))
+        + _pack_time(fields.get("latestMatch"))
+        + INT64.pack(int(fields.get("required", 0)))
+    )
+
+
+def _pack_rows(rows):
+    if all(isinstance(row, (int, np.integer)) and not isinstance(row, bool) for row in rows):
+        return ROWS_INT + LENGTH.pack(len(rows)) + np.asarray(rows, dtype="<i8").tobytes()
+    return ROWS_JSON + _pack_string(json.dumps(list(rows), default=str))
+
+
+def _pack_windows(rules):
+    windows = [(rule_id, fields["windows"]) for rule_id, fields in rules.items() if fields.get("windows")]
+    return LENGTH.pack(len(windows)) + b"".join(
+        _pack_string(rule_id) + _pack_string(json.dumps(rule_windows)) for rule_id, rule_windows in windows
+    )
+
+
+def encode_snapshot(compact_state):
+    parts = [
+        _pack_string(compact_state.get("policy_iri")),
+        _pack_string(compact_state.get("policy_hash")),
+        LENGTH.pack(len(compact_state["rules"])),
+    ]
+    parts.extend(_pack_rule(rule_id, fields) for rule_id, fields in compact_state["rules"].items())
+    parts.append(_pack_rows(compact_state["rows_violating_permissions"]))
+    parts.append(_pack_rows(compact_state["rows_violating_prohibitions"]))
+    parts.append(_pack_windows(compact_state["rules"]))
+    return b"".join(parts)
+
+
+def encode_delta(changed_rules, removed_rules, new_permission_rows, new_prohibition_rows):
+    parts = [LENGTH.pack(len(changed_rules) + len(removed_rules))]
+    parts.extend(bytes([RULE_SET]) + _pack_rule(rule_id, fields) for rule_id, fields in changed_rules.items())
+    parts.extend(bytes([RULE_REMOVED]) + _pack_string(rule_id) for rule_id in removed_rules)
+    parts.append(_pack_rows(new_permission_rows))
+    parts.append(_pack_rows(new_prohibition_rows))
+    parts.append(_pack_windows(changed_rules))
+    return b"".join(parts)
+
+
+def encode_record(kind, payload):
+    return RECORD_HEADER.pack(kind, len(payload)) + payload + CRC.pack(zlib.crc32(kind + payload))
+
+
+# ----------------------------------------
+# DECODING
+# ----------------------------------------
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def take(self, size):
+        if self.offset + size > len(self.data):
+            raise ValueError("Truncated checkpoint record")
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return chunk
+
+    def byte(self):
+        return self.take(1)[0]
+
+    def length(self):
+        return LENGTH.unpack(self.take(LENGTH.size))[0]
+
+    def int64(self):
+        return INT64.unpack(self.take(INT64.size))[0]
+
+    def string(self):
+        size = self.length()
+        if size == NO_STRING:
+            return None
+        return self.take(size).decode("utf-8")
+
+    def time(self):
+        tag = self.byte()
+        if tag == TIME_NONE:
+            return None
+        if tag == TIME_MICROS:
+            return pd.Timestamp(self.int64(), unit="us", tz="UTC")
+        return self.string()
+
+    def rule(self):
+        rule_id = self.string()
+        return rule_id, {
+            "matches_count": self.int64(),
+            "earliestMatch": self.time(),
+            "latestMatch": self.time(),
+            "required": self.int64(),
+        }
+
+    def windows(self, rules):
+        if self.offset == len(self.data):
+            return
+        for _ in range(self.length()):
+            rule_id = self.string()
+            rules[rule_id]["windows"] = json.loads(self.string())
+
+    def rows(self):
+        if self.take(1) == ROWS_INT:
+            size = self.length()
+            return np.frombuffer(self.take(8 * size), dtype="<i8").tolist()
+        return json.loads(self.string())
+
+
+def decode_snapshot(payload):
+    reader = _Reader(payload)
+    compact_state = {
+        "policy_iri": reader.string(),
+        "policy_hash": reader.string(),
+        "rules": dict(reader.rule() for _ in range(reader.length())),
+    }
+    compact_state["rows_violating_permissions"] = reader.rows()
+    compact_state["rows_violating_prohibitions"] = reader.rows()
+    reader.windows(compact_state["rules"])
+    return compact_state
+
+
+def apply_delta(compact_state, payload):
+    reader = _Reader(payload)
+
+    for _ in range(reader.length()):
+        if reader.byte() == RULE_SET:
+            rule_id, fields = reader.rule()
+            compact_state["rules"][rule_id] = fields
+        else:
+            compact_state["rules"].pop(reader.string(), None)
+
+    compact_state["rows_violating_permissions"].extend(reader.rows())
+    compact_state["rows_violating_prohibitions"].extend(reader.rows())
+    reader.windows(compact_state["rules"])
+
+
+def iter_records(data):
+    """
+    Records of a checkpoint file as (kind, payload) pairs. Stops at the first record that is
+    truncated or fails its CRC, as left by a crash during an append.
+    """
+    offset = len(MAGIC)
+
+    while offset + RECORD_HEADER.size <= len(data):
+        kind, size = RECORD_HEADER.unpack_from(data, offset)
+        end = offset + RECORD_HEADER.size + size
+
+        if end + CRC.size > len(data):
+            return
+
+        payload = data[offset + RECORD_HEADER.size:end]
+        if CRC.unpack_from(data, end)[0] != zlib.crc32(kind + payload):
+            return
+
+        yield kind, payload
+        offset = end + CRC.size
+
+
+def read_checkpoint(path):
+    """
+    Compact evaluation state of a checkpoint file: its snapshot with the delta records applied.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not an evaluation checkpoint")
+
+    compact_state = None
+
+    for kind, payload in iter_records(data):
+        if kind == SNAPSHOT:
+            compact_state = decode_snapshot(payload)
+        elif kind == DELTA and compact_state is not None:
+            apply_delta(compact_state, payload)
+
+    if compact_state is None:
+        raise ValueError(f"{path} has no complete checkpoint snapshot")
+
+    return compact_state
+
+
+# ----------------------------------------
+# WRITING
+# ----------------------------------------
+
+def _fsync_directory(path):
+    # Makes the rename of a snapshot durable; not available on every platform
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_checkpoint(path, compact_state):
+    """
+    Write a checkpoint file holding a single snapshot. The file is written next to its final
+    path and renamed over it, so a crash leaves either the old or the new checkpoint.
+    """
+    temporary_path = path + ".tmp"
+
+    with open(temporary_path, "wb") as f:
+        f.write(MAGIC + encode_record(SNAPSHOT, encode_snapshot(compact_state)))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temporary_path, path)
+    _fsync_directory(path)
+
+
+class CheckpointWriter:
+    """
+    Incremental checkpoints of an evaluation to a file.
+
+    The first write and every compact_every-th write after it rewrite the file as a snapshot.
+    The writes in between append a delta record with the rules that changed since the previous
+    write and the new violating rows, so their cost grows with the changes, not with the policy.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.compact_every = compact_every
+        self.deltas = 0
+        self.rules = None
+        self.policy_hash = None
+        self.rows_written = (0, 0)
+
+    def _remember(self, compact_state):
+        self.rules = {rule_id: dict(fields) for rule_id, fields in compact_state["rules"].items()}
+        self.policy_hash = compact_state.get("policy_hash")
+        self.rows_written = (
+            len(compact_state["rows_violating_permissions"]),
+            len(compact_state["rows_violating_prohibitions"]),
+        )
+
+    def write(self, compact_state):
+        permission_rows = compact_state["rows_violating_permissions"]
+        prohibition_rows = compact_state["rows_violating_prohibitions"]
+
+        # Lists of violating rows only grow during an evaluation, anything else is a new one
+        needs_snapshot = (
+            self.rules is None
+            or self.deltas >= self.compact_every
+            or compact_state.get("policy_hash") != self.policy_hash
+            or len(permission_rows) < self.rows_written[0]
+            or len(prohibition_rows) < self.rows_written[1]
+            or not os.path.exists(self.path)
+        )
+
+        if needs_snapshot:
+            write_checkpoint(self.path, compact_state)
+            self.deltas = 0
+            self._remember(compact_state)
+            return
+
+        changed = {
+            rule_id: fields
+            for rule_id, fields in compact_state["rules"].items()
+            if self.rules.get(rule_id) != fields
+        }
+        removed = [rule_id for rule_id in self.rules if rule_id not in compact_state["rules"]]
+
+        payload = encode_delta(
+            changed, removed, permission_rows[self.rows_written[0]:], prohibition_rows[self.rows_written[1]:]
+        )
+
+        try:
+            with open(self.path, "ab") as f:
+                f.write(encode_record(DELTA, payload))
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            # a torn record would hide the records appended after it, start again from a snapshot
+            self.rules = None
+            raise
+
+        self.deltas += 1
+        for rule_id, fields in changed.items():
+            self.rules[rule_id] = dict(fields)
+        for rule_id in removed:
+            del self.rules[rule_id]
+        self.rows_written = (len(permission_rows), len(prohibition_rows))
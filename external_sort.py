@@ -0,0 +1,292 @@
+import os
+import math
+import heapq
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Sort key columns added to the rows while they are sorted and merged
+TIME_KEY = "__sort_time"
+ROW_KEY = "__sort_row"
+
+NAT_KEY = np.iinfo(np.int64).max
+
+# Resolutions of datetime columns, from the coarsest
+TIME_UNITS = ("s", "ms", "us", "ns")
+
+# Smallest block of rows read from a run at a time during the merge
+MIN_BLOCK_ROWS = 256
+
+
+def estimate_run_size(csv_file, memory_budget_mb, sample_rows=1000):
+    """
+    Estimate how many rows of a CSV file can be sorted in memory within the budget, and how many
+    sorted runs the file will be split into.
+
+    Returns (rows_per_run, number_of_runs).
+    """
+    sample = pd.read_csv(csv_file, nrows=sample_rows)
+
+    if len(sample) == 0:
+        return 1, 1
+
+    # Sorting needs a copy of the rows next to the original
+    bytes_per_row = 2 * sample.memory_usage(deep=True, index=True).sum() / len(sample)
+    rows_per_run = max(1, int(memory_budget_mb * 1024 * 1024 / bytes_per_row))
+
+    with open(csv_file, "rb") as f:
+        header = f.readline()
+        sample_bytes = sum(len(f.readline()) for _ in range(len(sample)))
+
+    file_rows = (os.path.getsize(csv_file) - len(header)) * len(sample) / max(1, sample_bytes)
+
+    return rows_per_run, max(1, math.ceil(file_rows / rows_per_run))
+
+
+def parse_times(values):
+    """
+    UTC datetimes of a dateTime column, NaT where a value is missing or unparseable.
+
+    Every value is parsed on its own, as ISO 8601 or else in any format dateutil reads. Without
+    an explicit format, pandas infers one from the first value and coerces the values of other
+    shapes to NaT, so the time of a row would depend on the chunk or batch it is read in.
+    """
+    values = pd.Series(values)
+    times = pd.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+
+    retry = times.isna() & values.notna()
+    if retry.any():
+        retried = pd.to_datetime(values[retry], errors="coerce", utc=True, format="mixed")
+        unit = max(times.dt.unit, retried.dt.unit, key=TIME_UNITS.index)
+        times = times.dt.as_unit(unit)
+        times[retry] = retried.dt.as_unit(unit)
+
+    return times
+
+
+def time_key(series):
+    """
+    Integer sort key of a dateTime column: microseconds since the epoch, with missing or
+    unparseable dates last as in DataFrame.sort_values.
+    """
+    times = parse_times(series)
+    key = times.array.as_unit("us").asi8.copy()
+    key[times.isna().to_numpy()] = NAT_KEY
+    return times, key
+
+
+def common_dtype(first, second):
+    """
+    dtype pandas infers for a CSV column that has values of two dtypes.
+    """
+    if first == second:
+        return first
+    for dtype in (first, second):
+        if isinstance(dtype, pd.StringDtype):
+            return dtype
+    if pd.api.types.is_any_real_numeric_dtype(first) and pd.api.types.is_any_real_numeric_dtype(second):
+        return np.dtype("float64")
+    return np.dtype(object)
+
+
+def csv_dtypes(csv_file, rows_per_run):
+    """
+    dtypes of the columns of a CSV file read in one piece, from the dtypes pandas infers for each
+    chunk of rows_per_run rows: ints and floats make floats, anything else mixed makes text. The
+    chunks are then all read with these dtypes, so that a column is not numbers in one chunk and
+    text in another.
+    """
+    dtypes = {}
+    for chunk in pd.read_csv(csv_file, chunksize=rows_per_run):
+        for column, dtype in chunk.dtypes.items():
+            dtypes[column] = common_dtype(dtypes[column], dtype) if column in dtypes else dtype
+    return dtypes
+
+
+def read_csv_chunks(csv_file, rows_per_run, dtypes):
+    """
+    Chunks of rows_per_run rows of a CSV file, with the column dtypes of csv_dtypes. Columns of
+    mixed values (e.g. booleans and missing values) are read as pandas infers them in each chunk
+    and made object columns, rather than read as text.
+    """
+    mixed = [column for column, dtype in dtypes.items() if dtype == object]
+    pinned = {column: dtype for column, dtype in dtypes.items() if dtype != object}
+
+    for chunk in pd.read_csv(csv_file, chunksize=rows_per_run, dtype=pinned):
+        if mixed:
+            chunk[mixed] = chunk[mixed].astype(object)
+        yield chunk
+
+
+def write_sorted_runs(csv_file, time_column, rows_per_run, block_rows, run_dir, dtypes):
+    """
+    Read a CSV file in chunks of rows_per_run rows (with the column dtypes of csv_dtypes), sort every chunk
+    on the time column and write it to run_dir as a sequence of pickled blocks of block_rows rows.
+
+    Returns the paths of the run files.
+    """
+    runs = []
+    first_row = 0
+
+    for chunk in read_csv_chunks(csv_file, rows_per_run, dtypes):
+        times, key = time_key(chunk[time_column])
+
+        chunk[time_column] = times
+        chunk[TIME_KEY] = key
+        chunk[ROW_KEY] = np.arange(first_row, first_row + len(chunk), dtype=np.int64)
+        first_row += len(chunk)
+
+        # The row number makes every key unique, so the sort is stable
+        chunk = chunk.sort_values(by=[TIME_KEY, ROW_KEY], kind="mergesort")
+
+        path = os.path.join(run_dir, f"run{len(runs)}.pkl")
+        write_run([chunk], path, block_rows)
+        runs.append(path)
+
+    return runs
+
+
+def read_blocks(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield block, block[TIME_KEY].to_numpy(), block[ROW_KEY].to_numpy()
+
+
+def merge_sorted_runs(runs, chunk_rows):
+    """
+    k-way merge of sorted runs, with one block of each run in memory at a time. Yields sorted
+    chunks of about chunk_rows rows.
+
+    The sort key (time, row number) is unique. At every step, the rows of all current blocks up
+    to the smallest last key of the blocks (the bound) are taken: every row not read yet is
+    greater than the last key of its own block, hence greater than the bound. The block holding
+    the bound is used up, so every step reads at least one new block. Two heaps keep track of
+    the first and last keys of the current blocks, so that a step only touches the runs that
+    have rows up to the bound.
+    """
+    readers = [read_blocks(path) for path in runs]
+    blocks = [None] * len(runs)
+    versions = [0] * len(runs)
+    first_keys = []
+    last_keys = []
+
+    def load(i, block=None):
+        if block is None:
+            block = next(readers[i], None)
+        blocks[i] = block
+        versions[i] += 1
+
+        if block is not None:
+            _, times, rows = block
+            heapq.heappush(first_keys, (int(times[0]), int(rows[0]), i, versions[i]))
+            heapq.heappush(last_keys, (int(times[-1]), int(rows[-1]), i, versions[i]))
+
+    def sorted_chunk(pieces):
+        chunk = pd.concat(pieces) if len(pieces) > 1 else pieces[0]
+        return chunk.sort_values(by=[TIME_KEY, ROW_KEY], kind="mergesort")
+
+    for i in range(len(runs)):
+        load(i)
+
+    buffer = []
+    buffered_rows = 0
+
+    while last_keys:
+        bound_time, bound_row, i, version = last_keys[0]
+
+        if version != versions[i]:
+            heapq.heappop(last_keys)
+            continue
+
+        while first_keys and first_keys[0][:2] <= (bound_time, bound_row):
+            _, _, j, version = heapq.heappop(first_keys)
+
+            if version != versions[j]:
+                continue
+
+            block, times, rows = blocks[j]
+
+            # rows of the block up to the bound
+            lower = int(np.searchsorted(times, bound_time, side="left"))
+            upper = int(np.searchsorted(times, bound_time, side="right"))
+            cut = lower + int(np.searchsorted(rows[lower:upper], bound_row, side="right"))
+
+            buffer.append(block.iloc[:cut])
+            buffered_rows += cut
+
+            if cut == len(block):
+                load(j)
+            else:
+                load(j, (block.iloc[cut:], times[cut:], rows[cut:]))
+
+        if buffered_rows >= chunk_rows:
+            yield sorted_chunk(buffer)
+            buffer = []
+            buffered_rows = 0
+
+    if buffer:
+        yield sorted_chunk(buffer)
+
+
+def write_run(chunks, path, block_rows):
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            for start in range(0, len(chunk), block_rows):
+                pickle.dump(chunk.iloc[start:start + block_rows], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def iter_csv_by_time(csv_file, time_column, memory_budget_mb=256):
+    """
+    Yield the rows of a CSV file in chunks ordered by time_column, using an external merge sort
+    so that only about memory_budget_mb of rows are held in memory at any time.
+
+    The time column is converted to UTC datetimes (see parse_times), missing or unparseable
+    dates come last and rows with the same time keep their order in the file. Columns have the
+    same dtype in every chunk (see csv_dtypes). Chunks are indexed by the row number in the
+    file. If the file has no time column, the rows are yielded in file order.
+    """
+    rows_per_run, number_of_runs = estimate_run_size(csv_file, memory_budget_mb)
+
+    dtypes = csv_dtypes(csv_file, rows_per_run)
+
+    if time_column not in dtypes:
+        first_row = 0
+        for chunk in read_csv_chunks(csv_file, rows_per_run, dtypes):
+            chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+            first_row += len(chunk)
+            yield chunk
+        return
+
+    # One block of every merged run plus the merged chunk should fit in the budget. Blocks are
+    # not made smaller than MIN_BLOCK_ROWS, runs are merged in several passes instead.
+    block_rows = max(MIN_BLOCK_ROWS, rows_per_run // (2 * number_of_runs))
+    fan_in = max(2, rows_per_run // (2 * block_rows))
+    chunk_rows = max(block_rows, rows_per_run // 2)
+
+    with tempfile.TemporaryDirectory(prefix="sotw_runs_") as run_dir:
+        runs = write_sorted_runs(csv_file, time_column, rows_per_run, block_rows, run_dir, dtypes)
+        merge_pass = 0
+
+        while len(runs) > fan_in:
+            merged_runs = []
+            for start in range(0, len(runs), fan_in):
+                path = os.path.join(run_dir, f"merge{merge_pass}_{len(merged_runs)}.pkl")
+                write_run(merge_sorted_runs(runs[start:start + fan_in], chunk_rows), path, block_rows)
+                merged_runs.append(path)
+
+            for path in runs:
+                os.remove(path)
+
+            runs = merged_runs
+            merge_pass += 1
+
+        for chunk in merge_sorted_runs(runs, chunk_rows):
+            chunk = chunk.set_index(ROW_KEY, drop=True).drop(columns=[TIME_KEY])
+            chunk.index.name = None
+            yield chunk
@@ -0,0 +1,181 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import rdf_utils
+
+# Process-wide cache of parsed policies. Clients send the same policies over and over, and every
+# evaluation would otherwise parse the policy with rdflib and extract its rules and features
+# again. Entries are keyed by a hash of the policy text, or by the path, modification time and
+# size of a policy file, so a changed policy is never served from the cache.
+#
+# Entries are shared by all the callers that ask for the same policy and must not be modified.
+# Evaluation states built from their rules (initialise_evaluation_state) copy the conditions, so
+# evaluations never write to the cached rules.
+
+# Memory held by the cache before the least recently used entries are evicted
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Rough memory of a parsed triple in an rdflib graph, with its share of the extracted rules and
+# features (measured on the policies of the test cases)
+BYTES_PER_TRIPLE = 1300
+
+# Rough memory of the rules and features of a JSON-LD policy read without rdflib, per byte of the
+# document (measured on the JSON-LD policies of the test cases)
+BYTES_PER_JSONLD_BYTE = 20
+
+
+class PolicyCache:
+    """
+    LRU cache of parsed policies, bounded by the estimated memory of its entries.
+
+    An entry is a dict with the rdflib "graph", its serialization "format", the "policies" and
+    "features" returned by extract_rules_and_features_from_policy and the "FEATURE_TYPE_MAP"
+    built from them. The graph is None for the JSON-LD policies read without rdflib (see
+    extract_jsonld).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    def get(self, key, load):
+        """
+        Entry of a key, built from the (graph, format, source size, extracted rules and features
+        or None) returned by load() on a miss. Errors of load are raised and nothing is cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # policies are parsed outside the lock, so that a slow parse does not block the hits
+        entry = build_entry(*load())
+
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+
+            self.entries[key] = entry
+            self.size += entry["size"]
+
+            # the newest entry stays even when it is larger than the whole budget
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted["size"]
+                self.evictions += 1
+
+        return entry
+
+    def from_string(self, policy_text):
+        data = policy_text.encode("utf-8") if isinstance(policy_text, str) else policy_text
+        key = ("text", hashlib.sha256(data).hexdigest())
+
+        def load():
+            extracted = extract_jsonld(data)
+            if extracted is not None:
+                return None, "json-ld", len(data), extracted
+
+            parsed = rdf_utils.parse_string_to_graph(data)
+            if parsed is None:
+                raise ValueError("The policy is not in a known RDF serialization")
+            return parsed[0], parsed[1], len(data), None
+
+        return self.get(key, load)
+
+    def from_file(self, policy_file, normalise=False):
+        stat = os.stat(policy_file)
+        key = ("file", os.path.abspath(policy_file), stat.st_mtime_ns, stat.st_size, normalise)
+
+        def load():
+            if not normalise:
+                with open(policy_file, "rb") as f:
+                    head = f.read(rdf_utils.SNIFF_BYTES)
+                    if rdf_utils.detect_rdf_format(head, policy_file) == "json-ld":
+                        extracted = extract_jsonld(head + f.read())
+                        if extracted is not None:
+                            return None, "json-ld", stat.st_size, extracted
+
+            loaded = rdf_utils.load_normalise(policy_file) if normalise else rdf_utils.load(policy_file)
+            if loaded is None:
+                raise ValueError(f"{policy_file} is not in a known RDF serialization")
+            return loaded[0], loaded[1], stat.st_size, None
+
+        return self.get(key, load)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+def extract_jsonld(data):
+    """
+    Rules and features of a JSON-LD policy in the standard ODRL shape, read without rdflib (see
+    rdf_utils.extract_rules_and_features_from_jsonld), or None when it has to be parsed with
+    rdflib. Documents without policies are left to rdflib too, which tells an empty graph apart.
+    """
+    if rdf_utils.detect_rdf_format(data[:rdf_utils.SNIFF_BYTES]) != "json-ld":
+        return None
+
+    extracted = rdf_utils.extract_rules_and_features_from_jsonld(data)
+    if extracted is None or not extracted[0]:
+        return None
+    return extracted
+
+
+def build_entry(graph, rdf_format, source_bytes, extracted=None):
+    if extracted is None:
+        policies, features = rdf_utils.extract_rules_and_features_from_policy(graph)
+        size = source_bytes + BYTES_PER_TRIPLE * len(graph)
+    else:
+        policies, features = extracted
+        size = source_bytes * (1 + BYTES_PER_JSONLD_BYTE)
+
+    return {
+        "graph": graph,
+        "format": rdf_format,
+        "policies": policies,
+        "features": features,
+        "FEATURE_TYPE_MAP": {f["iri"]: f["type"] for f in features},
+        "size": size,
+    }
+
+
+# ----------------------------------------
+# PROCESS-WIDE CACHE
+# ----------------------------------------
+
+policy_cache = PolicyCache(int(os.environ.get("ODRL_POLICY_CACHE_BYTES", DEFAULT_MAX_BYTES)))
+
+
+def cached_policy_from_string(policy_text):
+    return policy_cache.from_string(policy_text)
+
+
+def cached_policy_from_file(policy_file, normalise=False):
+    return policy_cache.from_file(policy_file, normalise)
+
+
+def cache_stats():
+    return policy_cache.stats()
@@ -1,16 +1,138 @@
 import rdflib
 from rdflib import Graph
-from rdflib.namespace import RDF
-from rdflib.collection import Collection
+from rdflib.namespace import RDF, RDFS, XSD
 from typing import Union
 import json
 import pyshacl
 import os, sys
+import re
+import codecs
+import email.message
+import io
+import urllib.request
+import urllib.response
+from concurrent.futures import ProcessPoolExecutor
 
 import policy_normalisation_comparison.GraphParser
 
 ODRL = rdflib.Namespace("http://www.w3.org/ns/odrl/2/")
 
+# xsd:duration without years and months, whose length in seconds is not fixed
+DURATION_PATTERN = re.compile(
+    r"^P(?:(\d+(?:\.\d+)?)W)?(?:(\d+(?:\.\d+)?)D)?"
+    r"(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?$"
+)
+DURATION_MICROSECONDS = (7 * 86400 * 10**6, 86400 * 10**6, 3600 * 10**6, 60 * 10**6, 10**6)
+
+# Operators whose right operand is a set of values
+SET_OPERATORS = frozenset(
+    str(ODRL[name]) for name in ("isAnyOf", "isNoneOf", "hasPart", "isPartOf", "isAllOf")
+)
+
+
+def parse_duration(text):
+    """
+    Length in microseconds of an xsd:duration such as "PT24H" or "P1DT12H", or None if the text is
+    not a duration of fixed length.
+    """
+    match = DURATION_PATTERN.match(str(text).strip())
+
+    if match is None or not any(match.groups()) or str(text).strip().endswith("T"):
+        return None
+
+    micros = sum(
+        round(float(value) * scale)
+        for value, scale in zip(match.groups(), DURATION_MICROSECONDS)
+        if value is not None
+    )
+    return micros if micros > 0 else None
+
+
+# ----------------------------------------
+# FORMAT DETECTION
+# ----------------------------------------
+# rdflib needs to be told the serialization of a document, and a failed parse of a large document
+# costs as much as a successful one. The format is therefore guessed from the first bytes of the
+# document and the extension of its file, and the other formats are only tried when the guess is
+# ambiguous or turns out to be wrong.
+
+# Bytes of a document looked at to detect its format
+SNIFF_BYTES = 4096
+
+RDF_FORMATS_BY_EXTENSION = {
+    ".ttl": "turtle",
+    ".turtle": "turtle",
+    ".nt": "nt",
+    ".n3": "n3",
+    ".trig": "trig",
+    ".nq": "nquads",
+    ".jsonld": "json-ld",
+    ".json": "json-ld",
+    ".rdf": "xml",
+    ".owl": "xml",
+    ".xml": "xml",
+    ".trix": "trix",
+}
+
+# Serializations whose documents can start with an IRI, a blank node or a prefix declaration
+TURTLE_FAMILY = ("turtle", "nt", "n3", "trig", "nquads")
+
+# UTF-32 before UTF-16, whose little endian BOM is a prefix of the UTF-32 one
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+XML_START = re.compile(r"<(\?xml|!--|!DOCTYPE|[A-Za-z_][\w.-]*(:[A-Za-z_][\w.-]*)?[\s>/])")
+TURTLE_START = re.compile(r"(@prefix|@base|PREFIX\s|BASE\s|_:)", re.IGNORECASE)
+
+
+def detect_encoding(head: bytes):
+    """
+    Encoding given by the byte order mark at the start of a document, or None.
+    """
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if head.startswith(mark):
+            return encoding
+    return None
+
+
+def detect_rdf_format(head: bytes, file_path=None):
+    """
+    Guess the RDF serialization of a document from its first bytes and, for the serializations that
+    look alike, from the extension of its file. Returns the rdflib format name, or None when the
+    start of the document does not tell.
+    """
+    text = head.decode(detect_encoding(head) or "utf-8", errors="ignore").lstrip("\ufeff")
+
+    # skip blank lines and the comments of Turtle-like documents
+    start = ""
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            start = line
+            break
+
+    extension = os.path.splitext(str(file_path))[1].lower() if file_path else ""
+    extension_format = RDF_FORMATS_BY_EXTENSION.get(extension)
+    turtle_format = extension_format if extension_format in TURTLE_FAMILY else "turtle"
+
+    if start.startswith(("{", "[")):
+        return "json-ld"
+
+    if XML_START.match(start):
+        return "trix" if "<TriX" in text else "xml"
+
+    # an IRI, as in the first triple of an N-Triples document
+    if start.startswith("<") or TURTLE_START.match(start):
+        return turtle_format
+
+    return extension_format
+
+
 def parse_string_to_graph(data: Union[str, bytes]) -> tuple[Graph, str] | None:
     """
     Detect the RDF serialization of a given string or bytes and return both
@@ -45,7 +167,24 @@ def parse_string_to_graph(data: Union[str, bytes]) -> tuple[Graph, str] | None:
     else:
         data_bytes = data
 
+    # The detected format first, the others only if it fails
+    detected = detect_rdf_format(data_bytes[:SNIFF_BYTES])
+    encoding = detect_encoding(data_bytes)
+
+    if detected is not None:
+        g = Graph()
+        try:
+            if encoding is None:
+                g.parse(data=data_bytes, format=detected)
+            else:
+                g.parse(data=data_bytes.decode(encoding), format=detected)
+            return g, detected
+        except Exception:
+            pass
+
     for fmt in formats:
+        if fmt == detected:
+            continue
         g = Graph()
         try:
             g.parse(data=data_bytes, format=fmt)
@@ -54,12 +193,48 @@ def parse_string_to_graph(data: Union[str, bytes]) -> tuple[Graph, str] | None:
             continue
     return None
 
+def parse_detected_format(file_path):
+    """
+    Parse a file in the serialization found by detect_rdf_format. Returns (graph, format), where
+    graph is None when the file does not parse in that format and format is None when it cannot
+    be detected.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    except OSError:
+        return None, None
+
+    detected = detect_rdf_format(head, file_path)
+
+    if detected is None:
+        return None, None
+
+    encoding = detect_encoding(head)
+
+    try:
+        g = Graph()
+        if encoding is None:
+            g.parse(file_path, format=detected)
+        else:
+            with open(file_path, "r", encoding=encoding) as f:
+                g.parse(data=f.read(), format=detected)
+        return g, detected
+    except Exception:
+        return None, detected
+
+
 def load(file_path):
     """
     Loads an RDF graph from the specified file path.
-    Tries multiple RDF serializations and encodings until one succeeds, or
-    all are exhausted.
+    The serialization is detected first (see detect_rdf_format). If it cannot
+    be detected, or the file does not parse in it, tries multiple RDF
+    serializations and encodings until one succeeds, or all are exhausted.
     """
+    g, detected = parse_detected_format(file_path)
+
+    if g is not None:
+        return (g, detected) if len(g) > 0 else None
 
     rdf_formats = [
         "xml",       # RDF/XML
@@ -71,9 +246,11 @@ def load(file_path):
         "trix",      # TriX
     ]
 
-    # Try parsing with each format
+    # Try parsing with each other format
     last_exception = None
     for rdf_format in rdf_formats:
+        if rdf_format == detected:
+            continue
         try:
             g = Graph()
             g.parse(file_path, format=rdf_format)
@@ -113,9 +290,21 @@ def load(file_path):
 def load_normalise(file_path):
     """
     Loads an RDF graph from the specified file path.
-    Tries multiple RDF serializations and encodings until one succeeds, or
-    all are exhausted.
+    The serialization is detected first (see detect_rdf_format). If it cannot
+    be detected, or the file does not parse in it, tries multiple RDF
+    serializations and encodings until one succeeds, or all are exhausted.
     """
+    g, detected = parse_detected_format(file_path)
+
+    if g is not None:
+        if len(g) == 0:
+            return None
+        try:
+            graph_parser = policy_normalisation_comparison.GraphParser.GraphParser(g)
+            return graph_parser.parse().normalise().to_rdflib_graph(), detected
+        except Exception:
+            # the graph parses but is not a policy that can be normalised
+            return None
 
     rdf_formats = [
         "xml",       # RDF/XML
@@ -127,9 +316,11 @@ def load_normalise(file_path):
         "trix",      # TriX
     ]
 
-    # Try parsing with each format
+    # Try parsing with each other format
     last_exception = None
     for rdf_format in rdf_formats:
+        if rdf_format == detected:
+            continue
         try:
             g = Graph()
             g.parse(file_path, format=rdf_format)
@@ -184,12 +375,143 @@ refinement_contexts_incoming = {
     "http://www.w3.org/ns/odrl/2/Asset": ODRL.target,  # Asset if something has a :target -> node
 }
 
+# ----------------------------------------
+# POLICY INDEX
+# ----------------------------------------
+# The extraction follows rules, components, constraints and RDF lists through a handful of
+# predicates. Looking up every edge in the graph costs a store query each, so the edges of those
+# predicates are read once into dicts and the rules and features are extracted from them.
+
+# Rules of a policy, by the local name of their predicate
+POLICY_RULE_PREDICATES = ("permission", "prohibition", "obligation")
+
+# Rule components (as in refinement_contexts_incoming), by the local name of their predicate
+COMPONENT_PREDICATES = {component: str(predicate)[len(ODRL):] for component, predicate in refinement_contexts_incoming.items()}
+
+# Logic constraints, by the local name of their predicate
+LOGIC_PREDICATES = {name: str(ODRL[name]) for name in ("and", "or", "xone", "andSequence")}
+
+# Predicates read by the extraction, by local name
+INDEXED_PREDICATES = {
+    **{name: ODRL[name] for name in (
+        *POLICY_RULE_PREDICATES, "duty", "consequence", "remedy", "constraint", "refinement",
+        *COMPONENT_PREDICATES.values(), "leftOperand", "operator", "rightOperand", "unit", "source",
+        *LOGIC_PREDICATES,
+    )},
+    "value": RDF.value,
+    "first": RDF.first,
+    "rest": RDF.rest,
+}
+
+# Predicates also followed backwards, from the object to the subjects
+INVERSE_PREDICATES = ("refinement", *COMPONENT_PREDICATES.values())
+
+COUNT_OPERAND = str(ODRL["count"])
+
+
+def build_policy_index(odrl_graph: rdflib.Graph):
+    """
+    Edges of the predicates read by the extraction, as {"objects": {name: {subject: [objects]}},
+    "subjects": {name: {object: [subjects]}}} with the local names of the predicates, in one pass
+    over the triples of each predicate.
+    """
+    objects = {name: {} for name in INDEXED_PREDICATES}
+    subjects = {name: {} for name in INVERSE_PREDICATES}
+
+    for name, predicate in INDEXED_PREDICATES.items():
+        edges = objects[name]
+        inverse = subjects.get(name)
+        for s, o in odrl_graph.subject_objects(predicate):
+            edges.setdefault(s, []).append(o)
+            if inverse is not None:
+                inverse.setdefault(o, []).append(s)
+
+    return {"objects": objects, "subjects": subjects}
+
+
+class GraphEdges:
+    """
+    Edges of one predicate of a policy index, read from the graph when a node is first looked up
+    (see graph_policy_index).
+    """
+
+    def __init__(self, odrl_graph, predicate, inverse=False):
+        self.graph = odrl_graph
+        self.predicate = predicate
+        self.inverse = inverse
+        self.edges = {}
+
+    def get(self, node, default=None):
+        if node not in self.edges:
+            if self.inverse:
+                self.edges[node] = list(self.graph.subjects(self.predicate, node))
+            else:
+                self.edges[node] = list(self.graph.objects(node, self.predicate))
+        return self.edges[node] or default
+
+    def __contains__(self, node):
+        return bool(self.get(node))
+
+    def __getitem__(self, node):
+        values = self.get(node)
+        if values is None:
+            raise KeyError(node)
+        return values
+
+    def __iter__(self):
+        if self.inverse:
+            return iter(dict.fromkeys(self.graph.objects(None, self.predicate)))
+        return iter(dict.fromkeys(self.graph.subjects(self.predicate)))
+
+
+def graph_policy_index(odrl_graph: rdflib.Graph):
+    """
+    Policy index with the interface of build_policy_index, whose edges are looked up in the graph
+    node by node. The extract_* functions use it when they are not given an index, so that
+    extracting a single rule only reads the part of the graph reachable from it instead of
+    indexing the whole graph.
+    """
+    return {
+        "objects": {name: GraphEdges(odrl_graph, predicate) for name, predicate in INDEXED_PREDICATES.items()},
+        "subjects": {name: GraphEdges(odrl_graph, INDEXED_PREDICATES[name], inverse=True)
+                     for name in INVERSE_PREDICATES},
+    }
+
+
+def objects_of_policy_predicates(objects):
+    """
+    Subjects of the rules of a policy index, i.e. its policies.
+    """
+    return set(s for name in POLICY_RULE_PREDICATES for s in objects[name])
+
+
+def list_items(index, node):
+    """
+    Members of an RDF list, as Graph.items, read from a policy index.
+    """
+    firsts = index["objects"]["first"]
+    rests = index["objects"]["rest"]
+
+    chain = {node}
+    while node:
+        if node in firsts:
+            yield firsts[node][0]
+        node = rests[node][0] if node in rests else None
+        if node in chain:
+            raise ValueError("List contains a recursive rdf:rest reference")
+        chain.add(node)
+
+
 # LIMITATIONS
 # returns an alphabetically ordered list of unique features (left operands) from the policies
 # refinements of assignee/action/target have Party/Action/Asset prepended to the IRI and space separated, to distinguish them
 # from constraints.
 # all lists contain datetime, party, action and asset by default
-def extract_features_list_from_policy(odrl_graph: rdflib.Graph):
+def extract_features_list_from_policy(odrl_graph: rdflib.Graph, index=None, policies=None):
+
+    if index is None:
+        index = graph_policy_index(odrl_graph)
+    objects = index["objects"]
 
     features = list(base_features)
     seen_iris = {f["iri"] for f in base_features}
@@ -210,10 +532,10 @@ def extract_features_list_from_policy(odrl_graph: rdflib.Graph):
         # -------------------------
         # Simple constraint
         # -------------------------
-        left = next(odrl_graph.objects(constraint, ODRL.leftOperand), None)
+        lefts = objects["leftOperand"].get(constraint)
 
-        if left is not None:
-            iri = str(left)
+        if lefts:
+            iri = str(lefts[0])
             if prefix:
                 iri = f"{prefix} {iri}"
             add_feature(iri)
@@ -222,26 +544,14 @@ def extract_features_list_from_policy(odrl_graph: rdflib.Graph):
         # -------------------------
         # Logic constraint
         # -------------------------
-#       for logic_pred in LOGIC_PREDICATES:
-#           for list_node in odrl_graph.objects(constraint, logic_pred):
-#
-#                try:
-#                    members = Collection(odrl_graph, list_node)
-#                except Exception:
-#                    continue#
-#
-#                for member in members:
-#                    process_constraint(member, prefix)
-        for logic_pred in LOGIC_PREDICATES:
+        for logic_name in LOGIC_PREDICATES:
 
-            children = list(odrl_graph.objects(constraint, logic_pred))
-
-            for child in children:
+            for child in objects[logic_name].get(constraint, []):
 
                 # RDF Collection?
-                if (child, RDF.first, None) in odrl_graph:
+                if child in objects["first"]:
                     try:
-                        for member in Collection(odrl_graph, child):
+                        for member in list_items(index, child):
                             process_constraint(member, prefix)
                     except Exception:
                         pass
@@ -250,40 +560,30 @@ def extract_features_list_from_policy(odrl_graph: rdflib.Graph):
                 else:
                     process_constraint(child, prefix)
 
-    # Predicates used to decide top-level policy-like nodes
-    policy_predicates = {ODRL.permission, ODRL.prohibition, ODRL.obligation}
-
-    LOGIC_PREDICATES = (
-        rdflib.URIRef("http://www.w3.org/ns/odrl/2/and"),
-        rdflib.URIRef("http://www.w3.org/ns/odrl/2/or"),
-        rdflib.URIRef("http://www.w3.org/ns/odrl/2/xone"),
-        rdflib.URIRef("http://www.w3.org/ns/odrl/2/andSequence"),
-    )
-
-    # Mapping for refinement context detection:
-    # key = label to use as Y, value = tuple(incoming predicate to detect that context)
-
     # -------------------------
     # Traverse every policy rule
     # -------------------------
 
+    if policies is None:
+        policies = objects_of_policy_predicates(objects)
+
     for rule in set(
             r
-            for pred in policy_predicates
-            for policy in odrl_graph.subjects(pred)
-            for r in odrl_graph.objects(policy, pred)
+            for name in POLICY_RULE_PREDICATES
+            for policy in policies
+            for r in objects[name].get(policy, [])
     ):
 
         # Direct constraints
-        for constraint in odrl_graph.objects(rule, ODRL.constraint):
+        for constraint in objects["constraint"].get(rule, []):
             process_constraint(constraint)
 
         # Refinements on Party/Action/Asset
-        for prefix, incoming_pred in refinement_contexts_incoming.items():
+        for prefix, incoming_name in COMPONENT_PREDICATES.items():
 
-            for component in odrl_graph.objects(rule, incoming_pred):
+            for component in objects[incoming_name].get(rule, []):
 
-                for refinement in odrl_graph.objects(component, ODRL.refinement):
+                for refinement in objects["refinement"].get(component, []):
                     process_constraint(refinement, prefix)
 
     features = sorted(features, key=lambda f: f["iri"])
@@ -305,32 +605,26 @@ def extract_rule_list(
     rule_node,
     policy_target=None,
     policy_assignee=None,
-    policy_action=None
+    policy_action=None,
+    index=None
 ):
     """
     Extract all components (action, target, assignee) and constraints/refinements
     of a rule, returning triplets <A, B, C>.
     Handles nested refinements inside components.
     """
-    triplets = []
+    if index is None:
+        index = graph_policy_index(odrl_graph)
+    objects = index["objects"]
+    subjects = index["subjects"]
 
-    # Map ODRL operators to standard symbols
-    # This may be unnecessary. We could keep the original IRIs and handle them in the evaluator.
-    operator_map = {
-        ODRL.eq: "=",
-        ODRL.neq: "!=",
-        ODRL.lt: "<",
-        ODRL.gt: ">",
-        ODRL.lteq: "<=",
-        ODRL.gteq: ">=",
-        # We need to extract set operators, membership operators, etc.
-    }
+    triplets = []
 
     # Helper to extract values from a node (URI, literal, or complex node with rdf:value/odrl:source)
     def extract_values(node):
         if isinstance(node, rdflib.term.URIRef) or isinstance(node, rdflib.term.Literal):
             return [str(node)]
-        values = list(odrl_graph.objects(node, RDF.value)) + list(odrl_graph.objects(node, ODRL.source))
+        values = objects["value"].get(node, []) + objects["source"].get(node, [])
         return [str(v) for v in values] if values else [str(node)]
 
     def append_triplet(node, prefix=None):
@@ -342,30 +636,37 @@ def extract_rule_list(
         """
 
         # --- 1. SIMPLE CONSTRAINT ---
-        lefts = list(odrl_graph.objects(node, ODRL.leftOperand))
+        lefts = objects["leftOperand"].get(node)
         if lefts:
-            rights = list(odrl_graph.objects(node, ODRL.rightOperand))
-            operators = list(odrl_graph.objects(node, ODRL.operator))
+            rights = objects["rightOperand"].get(node, [])
+            operators = objects["operator"].get(node, [])
 
             left = f"{prefix} {str(lefts[0])}" if prefix else str(lefts[0])
             op = str(operators[0]) if operators else ""
             right = str(rights[0]) if rights else ""
 
+            # An RDF list as right operand, or the right operands of a set operator, become a
+            # frozenset of their values
+            if len(rights) == 1 and (rights[0] == RDF.nil or rights[0] in objects["first"]):
+                right = frozenset(str(item) for item in list_items(index, rights[0]))
+            elif op in SET_OPERATORS:
+                right = frozenset(str(item) for item in rights)
+
+            # A count with a duration as unit counts the matches within a sliding window of that
+            # length, e.g. odrl:count odrl:lteq 100 with odrl:unit "PT24H"^^xsd:duration
+            if left == COUNT_OPERAND:
+                units = [str(u) for u in objects["unit"].get(node, [])]
+                if units and parse_duration(units[0]) is not None:
+                    left = f"{left} {units[0]}"
+
             return [left, op, right]
 
         # --- 2. LOGIC CONSTRAINT ---
-        logic_predicates = [
-            rdflib.URIRef("http://www.w3.org/ns/odrl/2/and"),
-            rdflib.URIRef("http://www.w3.org/ns/odrl/2/or"),
-            rdflib.URIRef("http://www.w3.org/ns/odrl/2/xone"),
-            rdflib.URIRef("http://www.w3.org/ns/odrl/2/andSequence"),
-        ]
-
-        for logic_op in logic_predicates:
-            for collection_node in odrl_graph.objects(node, logic_op):
+        for logic_name, logic_op in LOGIC_PREDICATES.items():
+            for collection_node in objects[logic_name].get(node, []):
                 # RDF list → Python list
                 try:
-                    items = list(Collection(odrl_graph, collection_node))
+                    items = list(list_items(index, collection_node))
                 except Exception:
                     items = []
 
@@ -376,7 +677,7 @@ def extract_rule_list(
                     if result:
                         sub_constraints.append(result)
 
-                return [str(logic_op), sub_constraints]
+                return [logic_op, sub_constraints]
 
         return None
 
@@ -392,9 +693,9 @@ def extract_rule_list(
         "http://www.w3.org/ns/odrl/2/Party": policy_assignee,
     }
 
-    for component_type, predicate in refinement_contexts_incoming.items():
+    for component_type, component_name in COMPONENT_PREDICATES.items():
 
-        rule_components = list(odrl_graph.objects(rule_node, predicate))
+        rule_components = objects[component_name].get(rule_node, [])
 
         if rule_components:
             # Rule-level component exists: use it.
@@ -407,7 +708,7 @@ def extract_rule_list(
                     ])
 
                 # Nested refinements inside component
-                for refinement in odrl_graph.objects(comp_node, ODRL.refinement):
+                for refinement in objects["refinement"].get(comp_node, []):
                     result = append_triplet(
                         refinement,
                         prefix=component_type
@@ -427,16 +728,16 @@ def extract_rule_list(
                 ])
 
     # --- 2. Extract constraints directly attached to the rule ---
-    for constraint in odrl_graph.objects(rule_node, ODRL.constraint):
+    for constraint in objects["constraint"].get(rule_node, []):
         #append_triplet(constraint)
         result = append_triplet(constraint)
         if result:
             triplets.append(result)
 
         # --- 3. Handle refinements attached to this constraint --- TODO: this part might not be needed
-        for refinement in odrl_graph.subjects(predicate=ODRL.refinement, object=constraint):
-            for iri_prefix, incoming_pred in refinement_contexts_incoming.items():
-                if any(odrl_graph.subjects(predicate=incoming_pred, object=refinement)):
+        for refinement in subjects["refinement"].get(constraint, []):
+            for iri_prefix, incoming_name in COMPONENT_PREDICATES.items():
+                if refinement in subjects[incoming_name]:
                     #append_triplet(constraint, prefix=iri_prefix)
                     result = append_triplet(constraint, prefix=iri_prefix)
                     if result:
@@ -444,7 +745,7 @@ def extract_rule_list(
 
     def make_hashable(x):
         if isinstance(x, list):
-            return tuple(make_hashable(i) for i in x)
+            return tuple(map(make_hashable, x))
         return x
 
     # Deduplicate triplets by all three fields
@@ -458,7 +759,11 @@ def extract_rule_list(
 
     return unique_triplets
 
-def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
+def extract_rule_list_from_policy(odrl_graph: rdflib.Graph, index=None, policies=None):
+    if index is None:
+        index = graph_policy_index(odrl_graph)
+    objects = index["objects"]
+
     policy_list = []
 
     def build_rule_structure(
@@ -477,13 +782,14 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
                 rule_node,
                 policy_target=policy_target,
                 policy_assignee=policy_assignee,
-                policy_action=policy_action
+                policy_action=policy_action,
+                index=index
             )
         }
 
         # ---- DUTIES (permission → duty) ----
         duties = []
-        for duty in odrl_graph.objects(rule_node, ODRL.duty):
+        for duty in objects["duty"].get(rule_node, []):
             duties.append(build_rule_structure(duty,
                     policy_target=policy_target,
                     policy_assignee=policy_assignee,
@@ -494,7 +800,7 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
 
         # ---- CONSEQUENCES (duty or obligation → consequence) ----
         consequences = []
-        for consequence in odrl_graph.objects(rule_node, ODRL.consequence):
+        for consequence in objects["consequence"].get(rule_node, []):
             consequences.append(build_rule_structure(consequence,
                 policy_target=policy_target,
                 policy_assignee=policy_assignee,
@@ -505,7 +811,7 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
 
         # ---- REMEDIES (prohibition → remedy) ----
         remedies = []
-        for remedy in odrl_graph.objects(rule_node, ODRL.remedy):
+        for remedy in objects["remedy"].get(rule_node, []):
             remedies.append(build_rule_structure(remedy,
                 policy_target=policy_target,
                 policy_assignee=policy_assignee,
@@ -518,11 +824,11 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
 
     # ----------------------------------------------------
 
-    # Find all policies in the graph
-    for policy in set(
-        s for p in policy_predicates
-        for s in odrl_graph.subjects(predicate=p)
-    ):
+    # Find all policies in the graph, unless given
+    if policies is None:
+        policies = objects_of_policy_predicates(objects)
+
+    for policy in policies:
 
         permissions = []
         prohibitions = []
@@ -531,22 +837,22 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
         # Policy-level defaults
 
         policy_target = next(
-            (str(value) for value in odrl_graph.objects(policy, ODRL.target)),
+            (str(value) for value in objects["target"].get(policy, [])),
             None
         )
 
         policy_assignee = next(
-            (str(value) for value in odrl_graph.objects(policy, ODRL.assignee)),
+            (str(value) for value in objects["assignee"].get(policy, [])),
             None
         )
 
         policy_action = next(
-            (str(value) for value in odrl_graph.objects(policy, ODRL.action)),
+            (str(value) for value in objects["action"].get(policy, [])),
             None
         )
 
         # ---- PERMISSIONS ----
-        for perm in odrl_graph.objects(policy, ODRL.permission):
+        for perm in objects["permission"].get(policy, []):
             permissions.append(
                 build_rule_structure(perm,
                     policy_target=policy_target,
@@ -555,7 +861,7 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
             )
 
         # ---- PROHIBITIONS ----
-        for prohib in odrl_graph.objects(policy, ODRL.prohibition):
+        for prohib in objects["prohibition"].get(policy, []):
             prohibitions.append(
                 build_rule_structure(prohib,
                     policy_target=policy_target,
@@ -564,7 +870,7 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
             )
 
         # ---- OBLIGATIONS ----
-        for oblig in odrl_graph.objects(policy, ODRL.obligation):
+        for oblig in objects["obligation"].get(policy, []):
             obligations.append(
                 build_rule_structure(oblig,
                     policy_target=policy_target,
@@ -582,6 +888,394 @@ def extract_rule_list_from_policy(odrl_graph: rdflib.Graph):
     return policy_list
 
 
+def extract_rules_and_features_from_policy(odrl_graph: rdflib.Graph, processes=None):
+    """
+    Rule list and features list of a graph, as returned by extract_rule_list_from_policy and
+    extract_features_list_from_policy, read from a single index of the graph. With processes, the
+    policies are extracted in a process pool (see extract_policies_in_parallel) and listed by IRI.
+    """
+    index = build_policy_index(odrl_graph)
+    if processes is not None:
+        return extract_policies_in_parallel(index, processes)
+    return extract_rule_list_from_policy(odrl_graph, index), extract_features_list_from_policy(odrl_graph, index)
+
+
+# ----------------------------------------
+# PARALLEL EXTRACTION
+# ----------------------------------------
+# Graphs that gather thousands of policies (e.g. a catalogue) are split into contiguous groups of
+# policies, extracted in a process pool and merged in the order of the policy IRIs, whatever the
+# number of processes. The extraction of a group only reads the part of the index reachable from
+# its policies through their rules, duties, remedies, consequences, constraints, refinements,
+# components and RDF lists.
+#
+# The workers receive the index once, when they start (without copying it where processes are
+# forked), so only policy IRIs and the extracted rules cross process boundaries.
+
+# Below this number of policies per process, the work is not worth the cost of a process
+PARALLEL_MIN_POLICIES_PER_CHUNK = 200
+
+# Index of the graph being extracted, in each worker process
+_worker_index = None
+
+
+def _start_extraction_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _extract_policy_chunk(policies, index=None):
+    if index is None:
+        index = _worker_index
+    return (
+        extract_rule_list_from_policy(None, index, policies),
+        extract_features_list_from_policy(None, index, policies)
+    )
+
+
+def extract_policies_in_parallel(index, processes=None):
+    """
+    Rule list and features list of the policies of a policy index, extracted on up to processes
+    groups of policies in a process pool. Policies are listed by IRI.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    policies = sorted(objects_of_policy_predicates(index["objects"]), key=str)
+    chunks = max(1, min(processes, len(policies) // PARALLEL_MIN_POLICIES_PER_CHUNK))
+
+    if chunks == 1:
+        return _extract_policy_chunk(policies, index)
+
+    bounds = [len(policies) * i // chunks for i in range(chunks + 1)]
+    tasks = [policies[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+    with ProcessPoolExecutor(max_workers=chunks, initializer=_start_extraction_worker, initargs=(index,)) as pool:
+        results = list(pool.map(_extract_policy_chunk, tasks))
+
+    rule_list = [policy for chunk_policies, _ in results for policy in chunk_policies]
+    features = {feature["iri"]: feature for _, chunk_features in results for feature in chunk_features}
+
+    return rule_list, sorted(features.values(), key=lambda f: f["iri"])
+
+
+# ----------------------------------------
+# JSON-LD FAST PATH
+# ----------------------------------------
+# Most policies sent to the API are JSON-LD documents in the shape of the ODRL examples: the ODRL
+# context, uid, permission, target, action, constraint... rdflib runs the whole JSON-LD expansion
+# to parse them before the index is even built. For such documents the index is built straight
+# from the decoded JSON, from the triples rdflib would add and in the order it would add them, so
+# the extraction returns the same rules and features. Anything outside that shape (other keywords,
+# nested contexts, relative IRIs, terms the ODRL context does not define...) is left to rdflib.
+#
+# The ODRL context is read from ODRL/odrl.jsonld. It is not the file published by the W3C: it was
+# rebuilt from the terms of the ODRL 2.2 vocabulary (ODRL/ODRL22.ttl), in the layout of the W3C
+# context. rdflib is answered with the same file when it requests the context (ODRLContextHandler),
+# so that both paths expand a policy with one context.
+
+ODRL_CONTEXT_URLS = ("http://www.w3.org/ns/odrl.jsonld", "https://www.w3.org/ns/odrl.jsonld")
+ODRL_CONTEXT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ODRL", "odrl.jsonld")
+
+with open(ODRL_CONTEXT_FILE, "r") as f:
+    ODRL_JSONLD_CONTEXT = json.load(f)["@context"]
+
+
+class ODRLContextHandler(urllib.request.BaseHandler):
+    """
+    Answers the requests for the ODRL context with ODRL/odrl.jsonld, so that rdflib expands the
+    JSON-LD policies with the same context as the fast path, and without fetching it.
+    """
+    handler_order = 100
+
+    def http_open(self, request):
+        if request.full_url not in ODRL_CONTEXT_URLS:
+            return None
+        headers = email.message.Message()
+        headers["Content-Type"] = "application/ld+json"
+        with open(ODRL_CONTEXT_FILE, "rb") as f:
+            response = urllib.response.addinfourl(io.BytesIO(f.read()), headers, request.full_url, 200)
+        response.msg = "OK"
+        return response
+
+    https_open = http_open
+
+
+urllib.request.install_opener(urllib.request.build_opener(ODRLContextHandler))
+
+
+def jsonld_context_terms(context):
+    """
+    Prefixes, keyword aliases and terms of a context such as the ODRL one. A term maps to its IRI
+    and the type its values are coerced to ("id", "vocab" or None), or to None when its definition
+    is not one the fast path can read.
+    """
+    prefixes = {name: iri for name, iri in context.items()
+                if isinstance(iri, str) and iri.endswith(("/", "#"))}
+    aliases = {name: keyword for name, keyword in context.items() if keyword in ("@id", "@type")}
+    terms = {}
+
+    for name, definition in context.items():
+        if name in prefixes or name in aliases:
+            continue
+        if isinstance(definition, str):
+            definition = {"@id": definition}
+        terms[name] = None
+        if (isinstance(definition, dict) and definition.keys() <= {"@id", "@type"}
+                and definition.get("@type") in (None, "@id", "@vocab")):
+            prefix, _, local = str(definition.get("@id", "")).partition(":")
+            if prefix in prefixes:
+                kind = definition.get("@type")
+                terms[name] = (prefixes[prefix] + local, kind and kind[1:])
+
+    return prefixes, aliases, terms
+
+
+ODRL_JSONLD_PREFIXES, ODRL_JSONLD_ALIASES, ODRL_JSONLD_TERMS = jsonld_context_terms(ODRL_JSONLD_CONTEXT)
+
+# Local names of the indexed predicates, by IRI
+INDEXED_PREDICATE_NAMES = {str(predicate): name for name, predicate in INDEXED_PREDICATES.items()}
+
+VALUE_OBJECT_KEYS = frozenset(("@value", "@type", "@language"))
+
+
+class UnsupportedJSONLD(Exception):
+    """
+    A JSON-LD document that the fast path cannot read like rdflib does.
+    """
+
+
+def jsonld_prefixes(context):
+    """
+    Prefixes of a document context, and whether it includes the ODRL context. Raises
+    UnsupportedJSONLD for anything but the ODRL context and inline prefix definitions.
+    """
+    prefixes = {}
+    odrl_terms = False
+
+    for source in context if isinstance(context, list) else [context]:
+        if source in ODRL_CONTEXT_URLS:
+            prefixes.update(ODRL_JSONLD_PREFIXES)
+            odrl_terms = True
+        elif isinstance(source, dict):
+            for name, iri in source.items():
+                if (name.startswith("@") or ":" in name or not isinstance(iri, str) or not iri.endswith(("/", "#"))
+                        or ODRL_JSONLD_CONTEXT.get(name, iri) != iri):
+                    raise UnsupportedJSONLD(f"context entry {name}")
+                prefixes[name] = iri
+        else:
+            raise UnsupportedJSONLD("context")
+
+    return prefixes, odrl_terms
+
+
+def jsonld_policy_index(document):
+    """
+    Policy index (as built by build_policy_index) of a decoded JSON-LD document, without parsing
+    it into a graph. Raises UnsupportedJSONLD when the document is not in the supported shape.
+    """
+    if not isinstance(document, dict) or "@context" not in document:
+        raise UnsupportedJSONLD("no top-level context")
+
+    prefixes, odrl_terms = jsonld_prefixes(document["@context"])
+    aliases = ODRL_JSONLD_ALIASES if odrl_terms else {}
+    terms = ODRL_JSONLD_TERMS if odrl_terms else {}
+    id_keys = ("@id", *(name for name, keyword in aliases.items() if keyword == "@id"))
+    type_keys = ("@type", *(name for name, keyword in aliases.items() if keyword == "@type"))
+
+    # triples of the indexed predicates, as (subject, name, object) in a dict used as ordered set
+    triples = {}
+
+    def expand(value):
+        """
+        IRI of an absolute or compact IRI, as JSON-LD expands it without a base.
+        """
+        if not isinstance(value, str) or " " in value or ":" not in value:
+            raise UnsupportedJSONLD(f"IRI {value!r}")
+        prefix, local = value.split(":", 1)
+        if local.startswith("//"):
+            return value
+        if prefix in prefixes:
+            return prefixes[prefix] + local
+        raise UnsupportedJSONLD(f"prefix of {value!r}")
+
+    def to_id(value):
+        if isinstance(value, str) and value.startswith("_:") and len(value) > 2:
+            return rdflib.BNode(value[2:])
+        return rdflib.URIRef(expand(value))
+
+    def flatten(values):
+        for value in values if isinstance(values, list) else [values]:
+            if isinstance(value, list):
+                yield from flatten(value)
+            elif isinstance(value, dict) and "@set" in value:
+                raise UnsupportedJSONLD("@set")
+            else:
+                yield value
+
+    def check_ignored(values):
+        """
+        Values of a key outside the indexed predicates (e.g. assigner), whose nodes must not add
+        indexed triples.
+        """
+        for value in flatten(values):
+            if isinstance(value, dict) and not (value.keys() <= VALUE_OBJECT_KEYS or value.keys() <= set(id_keys)):
+                if "@list" in value:
+                    raise UnsupportedJSONLD("list under a key that is not indexed")
+                size = len(triples)
+                add_node(value)
+                if len(triples) != size:
+                    raise UnsupportedJSONLD("rules under a key that is not indexed")
+
+    def to_object(value, kind, in_list=False):
+        """
+        Node or literal of a value, for a term of the given kind ("id", "vocab" or None).
+        """
+        if isinstance(value, dict):
+            if "@list" in value:
+                if in_list or value.keys() != {"@list"}:
+                    raise UnsupportedJSONLD("list")
+                return add_list(value["@list"], kind)
+
+            if "@value" in value or "@language" in value:
+                literal = value.get("@value")
+                if not value.keys() <= VALUE_OBJECT_KEYS or isinstance(literal, (dict, list)):
+                    raise UnsupportedJSONLD("value object")
+                language = value.get("@language")
+                if literal is None:
+                    return None
+                if language:
+                    return None if " " in language else rdflib.Literal(literal, lang=language)
+                if value.get("@type"):
+                    return rdflib.Literal(literal, datatype=expand(value["@type"]))
+                return rdflib.Literal(literal)
+
+            return add_node(value)
+
+        if value is None:
+            return None
+
+        if kind is None:
+            if isinstance(value, float):
+                return rdflib.Literal(value, datatype=XSD.double)
+            return rdflib.Literal(value)
+
+        if not isinstance(value, str):
+            raise UnsupportedJSONLD(f"value {value!r}")
+        if kind == "vocab" and ":" not in value:
+            if terms.get(value) is None:
+                raise UnsupportedJSONLD(f"vocabulary term {value!r}")
+            return rdflib.URIRef(terms[value][0])
+        return to_id(value)
+
+    def add_list(items, kind):
+        """
+        RDF list of items, with the blank nodes and triples of rdflib's JSON-LD parser.
+        """
+        first = rdflib.BNode()
+        node, rest = first, None
+
+        for item in items if isinstance(items, list) else [items]:
+            if item is None:
+                continue
+            if isinstance(item, list):
+                raise UnsupportedJSONLD("list of lists")
+            if rest:
+                triples[(node, "rest", rest)] = None
+                node = rest
+            member = to_object(item, kind, in_list=True)
+            if member is None:
+                continue
+            triples[(node, "first", member)] = None
+            rest = rdflib.BNode()
+
+        if rest:
+            triples[(node, "rest", RDF.nil)] = None
+            return first
+        return RDF.nil
+
+    def add_values(subject, name, values, kind):
+        for value in flatten(values):
+            node = to_object(value, kind)
+            if node is not None:
+                triples[(subject, name, node)] = None
+
+    def add_node(node, top=False):
+        ids = [node[key] for key in id_keys if key in node]
+        if len(ids) > 1:
+            raise UnsupportedJSONLD("several identifiers")
+        subject = to_id(ids[0]) if ids else rdflib.BNode()
+
+        for key, values in node.items():
+            if key in id_keys or (top and key == "@context"):
+                continue
+
+            if key in type_keys:
+                check_ignored(values)
+            elif key.startswith("@"):
+                raise UnsupportedJSONLD(f"key {key}")
+            elif ":" in key:
+                name = INDEXED_PREDICATE_NAMES.get(expand(key))
+                if name is None:
+                    check_ignored(values)
+                else:
+                    add_values(subject, name, values, None)
+            elif terms.get(key) is None:
+                # rdflib drops the keys without a term, or reads them from a definition not known here
+                raise UnsupportedJSONLD(f"term {key}")
+            else:
+                iri, kind = terms[key]
+                name = INDEXED_PREDICATE_NAMES.get(iri)
+                if name is None:
+                    check_ignored(values)
+                else:
+                    add_values(subject, name, values, kind)
+
+        return subject
+
+    if "@graph" in document:
+        if document.keys() != {"@context", "@graph"}:
+            raise UnsupportedJSONLD("@graph with properties")
+        for node in flatten(document["@graph"]):
+            if not isinstance(node, dict) or "@context" in node:
+                raise UnsupportedJSONLD("@graph member")
+            add_node(node)
+    else:
+        add_node(document, top=True)
+
+    # rdflib lists the edges of a predicate by object, in the order the objects were first added
+    by_predicate = {name: {} for name in INDEXED_PREDICATES}
+    for s, name, o in triples:
+        by_predicate[name].setdefault(o, []).append(s)
+
+    objects = {name: {} for name in INDEXED_PREDICATES}
+    subjects = {name: {} for name in INVERSE_PREDICATES}
+    for name, edges in by_predicate.items():
+        inverse = subjects.get(name)
+        for o, edge_subjects in edges.items():
+            for s in edge_subjects:
+                objects[name].setdefault(s, []).append(o)
+            if inverse is not None:
+                inverse[o] = list(edge_subjects)
+
+    return {"objects": objects, "subjects": subjects}
+
+
+def extract_rules_and_features_from_jsonld(data: Union[str, bytes]):
+    """
+    Rule list and features list of a JSON-LD policy, as extract_rules_and_features_from_policy
+    returns them for its graph, read without rdflib. Returns None when the document is not in the
+    shape supported by jsonld_policy_index, so that it is parsed with rdflib instead.
+    """
+    try:
+        document = json.loads(data)
+        index = jsonld_policy_index(document)
+    except (ValueError, UnsupportedJSONLD):
+        return None
+
+    return extract_rule_list_from_policy(None, index), extract_features_list_from_policy(None, index)
+
+
 def extract_rule_list_from_policy_from_file(file_path):
     g = load(file_path)[0]
     return extract_rule_list_from_policy(g)
\ No newline at end of file
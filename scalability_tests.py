@@ -118,13 +118,13 @@ def evaluate_once(policy_graph, dataframe):
     Run one ODRL evaluation and return runtime.
     """
 
+    rules, features = rdf_utils.extract_rules_and_features_from_policy(policy_graph)
+
     feature_map = {
         f["iri"]: f["type"]
-        for f in rdf_utils.extract_features_list_from_policy(policy_graph)
+        for f in features
     }
 
-    rules = rdf_utils.extract_rule_list_from_policy(policy_graph)
-
     start = time.perf_counter()
 
     result_list = ODRL_Evaluator.evaluate_ODRL_on_dataframe(
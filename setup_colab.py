@@ -623,7 +623,7 @@ def show_interface():
                                 print(pretty_print_rules(rules))
 
                                 print("\n Rule Conditions as JSON object\n")
-                                print(json.dumps(rules, indent=4, ensure_ascii=False))
+                                print(json.dumps(rules, indent=4, ensure_ascii=False, default=sorted))
                                 print("\n")
 
                             except Exception as e:
@@ -2,11 +2,24 @@ import rdflib
 import pyshacl
 import test_utils
 import ODRL_Evaluator
+import evaluation_checkpoint
 import validate
 import os
 import uuid
 import time
+import copy
+import json
+import tempfile
+import urllib.request
+import pandas as pd
+import numpy as np
+import ODRL_generator
+import SotW_generator
+import rdf_utils
+import policy_cache
+import external_sort
 from rdf_utils import extract_features_list_from_policy, extract_rule_list_from_policy
+from rdflib.compare import isomorphic
 
 total_eval_time = 0.0
 total_eval_calls = 0
@@ -368,6 +381,1303 @@ def run_folder_evaluation_tests():
         print(f"- Tests: {category} {passed}/{total}")
 
 
+def load_folder_evaluation_cases():
+    """Return (name, policy, FEATURE_TYPE_MAP, SotW dataframe, SotW path) for the folder evaluation tests."""
+    cases = []
+
+    for folder in ["test_cases/evaluation/valid", "test_cases/evaluation/invalid"]:
+
+        if not os.path.exists(folder):
+            continue
+
+        for file in sorted(os.listdir(folder)):
+
+            if not file.endswith(".ttl"):
+                continue
+
+            base = os.path.splitext(file)[0]
+            csv_path = os.path.join(folder, base + ".csv")
+
+            if not os.path.exists(csv_path):
+                continue
+
+            graph = rdflib.Graph().parse(os.path.join(folder, file), format="turtle")
+            policy = extract_rule_list_from_policy(graph)[0]
+            FEATURE_TYPE_MAP = {f["iri"]: f["type"] for f in extract_features_list_from_policy(graph)}
+
+            cases.append((os.path.join(folder, base), policy, FEATURE_TYPE_MAP, pd.read_csv(csv_path), csv_path))
+
+    return cases
+
+
+def run_engine_equivalence_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # The vectorized engine must return exactly what the row by row engine returns
+    for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases():
+
+        evaluation_state = ODRL_Evaluator.initialise_evaluation_state(policy)
+
+        results = [
+            ODRL_Evaluator.evaluate_ODRL_on_dataframe(
+                policy, df.copy(), FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state), engine=engine
+            )
+            for engine in ["rows", "vectorized"]
+        ]
+
+        if results[0] == results[1]:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Vectorized engine result differs from row engine on {name}")
+
+        # Shard even the small test SotWs over several processes
+        min_rows_per_shard = ODRL_Evaluator.PARALLEL_MIN_ROWS_PER_SHARD
+        ODRL_Evaluator.PARALLEL_MIN_ROWS_PER_SHARD = 1
+        try:
+            parallel_result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(
+                policy, df.copy(), FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state), processes=2
+            )
+        finally:
+            ODRL_Evaluator.PARALLEL_MIN_ROWS_PER_SHARD = min_rows_per_shard
+
+        if parallel_result == results[0]:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Multi-process evaluation result differs from row engine on {name}")
+
+    # Unknown engines are rejected with or without processes
+    O = "http://www.w3.org/ns/odrl/2/"
+    policy = {
+        "policy_iri": "http://example.com/policy:engine",
+        "permissions": [{"conditions": [[O + "Action", O + "eq", O + "use"]]}],
+        "prohibitions": [],
+        "obligations": [],
+    }
+    df = pd.DataFrame({O + "Action": [O + "use", O + "print"]})
+    for processes in [None, 2]:
+        try:
+            ODRL_Evaluator.evaluate_ODRL_on_dataframe(policy, df.copy(), {}, engine="bogus", processes=processes)
+            tests_failed += 1
+            test_log.append(f"Unknown engine accepted with processes={processes}")
+        except ValueError:
+            tests_passed += 1
+
+
+def run_incremental_matcher_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # Events fed one at a time to the matching network must give the batch result
+    for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases():
+
+        evaluation_state = ODRL_Evaluator.initialise_evaluation_state(policy)
+        expected = ODRL_Evaluator.evaluate_ODRL_on_dataframe(
+            policy, df.copy(), FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state)
+        )
+
+        # Events arrive in time order
+        if ODRL_Evaluator.DT_COL in df.columns:
+            df[ODRL_Evaluator.DT_COL] = pd.to_datetime(df[ODRL_Evaluator.DT_COL], errors="coerce", utc=True)
+            df = df.sort_values(by=ODRL_Evaluator.DT_COL, ascending=True)
+
+        network = ODRL_Evaluator.build_matching_network(evaluation_state, df.columns, FEATURE_TYPE_MAP)
+        validity = 1
+
+        for idx, event in zip(df.index, df.to_dict("records")):
+            values = ODRL_Evaluator.event_values(network, event)
+            validity = ODRL_Evaluator.match_event(network, evaluation_state, idx, values) and validity
+
+        if ODRL_Evaluator.evaluation_result(evaluation_state, validity) == expected:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Incremental matching differs from batch evaluation on {name}")
+
+
+def run_session_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # A session fed with several batches must give the result of a single batch evaluation
+    for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases():
+
+        evaluation_state = ODRL_Evaluator.initialise_evaluation_state(policy)
+        expected = ODRL_Evaluator.evaluate_ODRL_on_dataframe(
+            policy, df.copy(), FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state)
+        )
+
+        if ODRL_Evaluator.DT_COL in df.columns:
+            df[ODRL_Evaluator.DT_COL] = pd.to_datetime(df[ODRL_Evaluator.DT_COL], errors="coerce", utc=True)
+            df = df.sort_values(by=ODRL_Evaluator.DT_COL, ascending=True)
+
+        half = len(df) // 2
+        session = ODRL_Evaluator.EvaluationSession(policy, FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state))
+        session.evaluate([df.iloc[:half], df.iloc[half:]])
+
+        if session.result() == expected:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Streaming session differs from batch evaluation on {name}")
+
+    # Batches starting with dateTimes of different ISO shapes give the result of a single batch
+    O = "http://www.w3.org/ns/odrl/2/"
+    DT = ODRL_Evaluator.DT_COL
+    base = pd.Timestamp("2026-01-11", tz="UTC")
+    times = [base + pd.Timedelta(hours=i) for i in range(120)]
+    df = pd.DataFrame({
+        DT: [t.strftime("%Y-%m-%d" if t.hour == 0 else ["%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%SZ"][i % 5 % 2])
+             for i, t in enumerate(times)],
+        O + "purpose": ["research" if i % 4 == 0 else "marketing" for i in range(120)],
+    })
+    policy = {
+        "policy_iri": "http://example.com/policy:batches",
+        "permissions": [{"conditions": [[DT, O + "lt", (base + pd.Timedelta(days=4)).isoformat()]]}],
+        "prohibitions": [{"conditions": [[DT, O + "gteq", (base + pd.Timedelta(hours=12)).isoformat()],
+                                         [O + "purpose", O + "eq", "research"]]}],
+        "obligations": [],
+    }
+    expected = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), {})
+
+    for batch_rows in [1, 7, 50]:
+        session = ODRL_Evaluator.EvaluationSession(copy.deepcopy(policy), {})
+        session.evaluate([df.iloc[start:start + batch_rows] for start in range(0, len(df), batch_rows)])
+
+        if session.result() == expected:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Streaming session with batches of {batch_rows} rows differs on mixed dateTime shapes")
+
+
+def run_out_of_core_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # A tiny memory budget forces the external sort to merge many runs
+    for name, policy, FEATURE_TYPE_MAP, df, csv_path in load_folder_evaluation_cases():
+
+        evaluation_state = ODRL_Evaluator.initialise_evaluation_state(policy)
+        expected = ODRL_Evaluator.evaluate_ODRL_on_dataframe(
+            policy, df, FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state)
+        )
+        result = ODRL_Evaluator.evaluate_ODRL_on_csv_out_of_core(
+            policy, csv_path, FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state), memory_budget_mb=0.0001
+        )
+
+        vectorized = ODRL_Evaluator.evaluate_ODRL_on_csv_out_of_core(
+            policy, csv_path, FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state), memory_budget_mb=0.0001,
+            engine="vectorized"
+        )
+
+        if result == expected and vectorized == expected:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Out-of-core evaluation differs from in-memory evaluation on {name}")
+
+    # Unknown engines are rejected before the policy and the file are read
+    try:
+        ODRL_Evaluator.evaluate_ODRL_on_csv_out_of_core(None, "missing.csv", {}, engine="bogus")
+        tests_failed += 1
+        test_log.append("Unknown engine accepted by the out-of-core evaluation")
+    except ValueError:
+        tests_passed += 1
+    except Exception as e:
+        tests_failed += 1
+        test_log.append(f"Out-of-core evaluation failed with {e!r} before rejecting an unknown engine")
+
+    # dateTimes of several ISO shapes and columns whose values change type, over several runs
+    O = "http://www.w3.org/ns/odrl/2/"
+    DT = ODRL_Evaluator.DT_COL
+    base = pd.Timestamp("2026-01-11", tz="UTC")
+    shapes = [
+        lambda t: t.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        lambda t: t.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        lambda t: t.strftime("%Y-%m-%d"),
+    ]
+    times = [base + pd.Timedelta(minutes=(37 * i) % 2000) for i in range(2000)]
+    df = pd.DataFrame({
+        DT: [shapes[(i // 300) % 3](t) for i, t in enumerate(times)],
+        O + "purpose": [str(i % 7) if i < 1700 else "research" for i in range(2000)],
+        O + "count": [i % 5 if i < 1200 else (i % 5) + 0.5 for i in range(2000)],
+    })
+    policy = {
+        "policy_iri": "http://example.com/policy:mixed",
+        "permissions": [{"conditions": [[DT, O + "lt", (base + pd.Timedelta(hours=30)).isoformat()]]}],
+        "prohibitions": [{"conditions": [[DT, O + "gteq", (base + pd.Timedelta(hours=6)).isoformat()],
+                                         [O + "purpose", O + "eq", "research"]]}],
+        "obligations": [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "mixed.csv")
+        df.to_csv(csv_path, index=False)
+
+        memory_budget_mb = 0.02
+        _, number_of_runs = external_sort.estimate_run_size(csv_path, memory_budget_mb)
+        chunks = list(external_sort.iter_csv_by_time(csv_path, DT, memory_budget_mb))
+
+        expected = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), pd.read_csv(csv_path), {})
+        result = ODRL_Evaluator.evaluate_ODRL_on_csv_out_of_core(
+            copy.deepcopy(policy), csv_path, {}, memory_budget_mb=memory_budget_mb
+        )
+
+    checks = [
+        (number_of_runs > 3, f"The mixed CSV was sorted in {number_of_runs} runs"),
+        (not any(chunk[DT].isna().any() for chunk in chunks), "dateTimes of a mixed CSV were not parsed"),
+        (len({str(chunk.dtypes.to_dict()) for chunk in chunks}) == 1, "Columns of a mixed CSV changed dtype between chunks"),
+        (result == expected and expected[3], "Out-of-core evaluation differs from in-memory evaluation on a mixed CSV"),
+    ]
+    for condition, message in checks:
+        if condition:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(message)
+
+
+def run_multi_policy_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # Evaluating all the policies of a graph in one pass must give the result of each policy alone
+    graph = ODRL_generator.generate_ODRL(policy_number=4, p_rule_n=3, f_rule_n=2, o_rule_n=1,
+                                         duties_per_p_n=1, p_with_duties_n=1, constraint_number_max=2)
+    policies = extract_rule_list_from_policy(graph)
+    FEATURE_TYPE_MAP = {f["iri"]: f["type"] for f in extract_features_list_from_policy(graph)}
+    df, _ = SotW_generator.generate_pd_state_of_the_world_from_policies(graph, number_of_records=50, valid=False)
+
+    evaluation_states = {p["policy_iri"]: ODRL_Evaluator.initialise_evaluation_state(p) for p in policies}
+
+    for engine in ["rows", "vectorized"]:
+        results = ODRL_Evaluator.evaluate_policies_on_dataframe(
+            policies, df.copy(), FEATURE_TYPE_MAP, copy.deepcopy(evaluation_states), engine=engine
+        )
+
+        for policy in policies:
+            iri = policy["policy_iri"]
+            expected = ODRL_Evaluator.evaluate_ODRL_on_dataframe(
+                policy, df.copy(), FEATURE_TYPE_MAP, copy.deepcopy(evaluation_states[iri])
+            )
+
+            if results[iri] == expected:
+                tests_passed += 1
+            else:
+                tests_failed += 1
+                test_log.append(f"Multi-policy evaluation ({engine}) differs from single policy evaluation on {iri}")
+
+
+def run_rule_index_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    ODRL = "http://www.w3.org/ns/odrl/2/"
+    policy = {
+        "policy_iri": "http://example.com/policy",
+        "permissions": [
+            {"conditions": [[ODRL + "Party", ODRL + "eq", "http://example.com/alice"], [ODRL + "Action", ODRL + "eq", ODRL + "read"]]},
+            {"conditions": [[ODRL + "Party", ODRL + "eq", "http://example.com/bob"]]},
+            {"conditions": [[ODRL + "Party", ODRL + "neq", "http://example.com/bob"]]},
+        ],
+        "prohibitions": [],
+        "obligations": []
+    }
+    df = pd.DataFrame({
+        ODRL + "Party": ["http://example.com/alice", "http://example.com/carol"],
+        ODRL + "Action": [ODRL + "read", ODRL + "read"],
+    })
+
+    evaluation_state = ODRL_Evaluator.initialise_evaluation_state(policy)
+    plan = ODRL_Evaluator.compile_evaluation_state(evaluation_state, df.columns, {})
+    rule_index = ODRL_Evaluator.build_rule_index(plan, {})
+
+    # alice can only match the first rule and the rule without eq conditions, carol only the latter
+    expected = [[0, 2], [2]]
+    rules = [p["state"] for p in plan["permissions"]]
+
+    for values, expected_rules in zip(df.to_numpy(), expected):
+        found = [rules.index(node["state"]) for _, node in ODRL_Evaluator.candidate_rules(rule_index, values)]
+
+        if found == expected_rules:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Rule index returned candidates {found} instead of {expected_rules}")
+
+
+def run_typed_column_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    ODRL = "http://www.w3.org/ns/odrl/2/"
+    column = "http://example.com/amount"
+    df = pd.DataFrame({
+        column: [5, 5.0, "5", " 7 ", "abc", "", None, float("nan"), "nan", True, "2024-01-01", 10],
+        ODRL + "dateTime": ["2024-01-01T10:00:00Z", "2024-01-02", "not a date", None, "", "2023-12-31T23:00:00-02:00",
+                            "2024-01-01", "2024", "5", "2024-01-03", "2024-01-01T10:00:00Z", "2022"],
+    })
+    comparisons = [
+        (column, "eq", 5), (column, "eq", "5"), (column, "neq", 5), (column, "eq", "abc"), (column, "neq", "abc"),
+        (column, "eq", "nan"), (column, "neq", "nan"), (column, "gt", 4), (column, "lteq", "7"),
+        (column, "eq", True), (column, "gt", "abc"), (column, "gteq", "2023-06-01"),
+        (ODRL + "dateTime", "gt", "2024-01-01"), (ODRL + "dateTime", "eq", "2024-01-01T10:00:00Z"),
+        (ODRL + "dateTime", "lt", "not a date"),
+    ]
+
+    context = ODRL_Evaluator._column_context(df, {}, ODRL_Evaluator.OPS_MAP)
+
+    # the typed column masks agree with the cell by cell predicates
+    for left, op, right in comparisons:
+        comparison = ODRL_Evaluator.compile_comparison(ODRL + op, right, left, ODRL_Evaluator.OPS_MAP, {})
+        mask = ODRL_Evaluator.comparison_mask(comparison, context, left)
+        predicate = comparison["predicate"] or (lambda value: False)
+        expected = [bool(predicate(value)) for value in df[left]]
+
+        if mask.tolist() == expected:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Typed column mask of {op} {right!r} on {left} is {mask.tolist()} instead of {expected}")
+
+
+def run_iri_encoding_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    ODRL = "http://www.w3.org/ns/odrl/2/"
+    EX = "http://example.com/"
+    FEATURE_TYPE_MAP = {ODRL + "Party": "http://www.w3.org/ns/shacl#IRI", ODRL + "Asset": "http://www.w3.org/ns/shacl#IRI"}
+    df = pd.DataFrame({
+        ODRL + "Party": [EX + "alice", EX + "bob", "", None, "5", EX + "alice"],
+        ODRL + "Asset": [EX + "data", EX + "alice", EX + "data", EX + "report", EX + "data", None],
+    })
+    policy = {
+        "policy_iri": EX + "policy",
+        "permissions": [
+            {"conditions": [[ODRL + "Party", ODRL + "eq", EX + "alice"], [ODRL + "Asset", ODRL + "neq", EX + "report"]]},
+            {"conditions": [[ODRL + "Party", ODRL + "eq", 5]]},
+            {"conditions": [[ODRL + "Asset", ODRL + "eq", EX + "alice"]]},
+        ],
+        "prohibitions": [
+            {"conditions": [[ODRL + "Party", ODRL + "neq", EX + "carol"], [ODRL + "Asset", ODRL + "eq", EX + "report"]]},
+        ],
+        "obligations": []
+    }
+
+    # both IRI columns index the same vocabulary
+    encoded = ODRL_Evaluator.encode_iri_columns(df, FEATURE_TYPE_MAP)
+    dtypes = [encoded[column].dtype for column in df.columns]
+
+    if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes) and dtypes[0] == dtypes[1]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"IRI columns were encoded as {dtypes}")
+
+    # the encoded columns give the same results as the plain ones
+    expected = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), FEATURE_TYPE_MAP)
+    found = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), FEATURE_TYPE_MAP, engine="vectorized")
+
+    if list(found[1:]) == list(expected[1:]):
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"Encoded IRI columns gave {found[1:]} instead of {expected[1:]}")
+
+
+def run_shared_constraint_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    ODRL = "http://www.w3.org/ns/odrl/2/"
+    EX = "http://example.com/"
+    window = [ODRL + "and", [[ODRL + "dateTime", ODRL + "gteq", "2024-01-01"], [ODRL + "dateTime", ODRL + "lt", "2024-01-03"]]]
+    party = [ODRL + "Party", ODRL + "eq", EX + "alice"]
+    policy = {
+        "policy_iri": EX + "policy",
+        "permissions": [
+            {"conditions": [party, window]},
+            {"conditions": [party, copy.deepcopy(window)]},
+            {"conditions": [[ODRL + "or", [copy.deepcopy(window), [ODRL + "Party", ODRL + "eq", EX + "bob"]]]]},
+            {"conditions": [party, window, [ODRL + "count", ODRL + "lt", 2]]},
+        ],
+        "prohibitions": [
+            {"conditions": [copy.deepcopy(party), copy.deepcopy(window)]},
+        ],
+        "obligations": []
+    }
+    df = pd.DataFrame({
+        ODRL + "dateTime": ["2024-01-01T10:00:00Z", "2024-01-02T10:00:00Z", "2024-01-05T10:00:00Z", "2024-01-02T12:00:00Z"],
+        ODRL + "Party": [EX + "alice", EX + "bob", EX + "alice", EX + "alice"],
+    })
+
+    # the window and the condition list of the first two rules and the prohibition are shared, the
+    # rule with odrl:count is not
+    evaluation_state = ODRL_Evaluator.initialise_evaluation_state(policy)
+    occurrences = ODRL_Evaluator.shared_occurrences(evaluation_state)
+    shared = sorted(count for count in occurrences.values() if count > 1)
+
+    if shared == [3, 5]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"Shared constraint occurrences are {shared} instead of [3, 5]")
+
+    # sharing does not change the results
+    for engine in ("rows", "vectorized"):
+        result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), {}, engine=engine)
+        counts = [p["matches_count"] for p in result[0]["permissions"]] + [f["matches_count"] for f in result[0]["prohibitions"]]
+
+        if counts == [2, 2, 3, 2, 2] and result[3] == [0, 3]:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Shared constraints with the {engine} engine gave matches {counts} and prohibition violations {result[3]}")
+
+
+def run_deduplication_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # an access log repeating the rows of the folder cases with new timestamps
+    for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases()[:10]:
+        log = pd.concat([df] * 5, ignore_index=True)
+        if ODRL_Evaluator.DT_COL in log.columns:
+            log[ODRL_Evaluator.DT_COL] = pd.date_range("2026-01-01", periods=len(log), freq="min", tz="UTC")
+
+        evaluation_state = ODRL_Evaluator.initialise_evaluation_state(policy)
+
+        results = [
+            ODRL_Evaluator.evaluate_ODRL_on_dataframe(
+                policy, log.copy(), FEATURE_TYPE_MAP, copy.deepcopy(evaluation_state), engine=engine
+            )
+            for engine in ["rows", "deduplicated"]
+        ]
+
+        if results[0] == results[1]:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Deduplicated engine differs from the row engine on {name}")
+
+
+def run_condition_ordering_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # a condition that always holds listed before one that rarely holds, at the same cost
+    calls = {"always": 0, "rarely": 0}
+
+    def always(values):
+        calls["always"] += 1
+        return True
+
+    def rarely(values):
+        calls["rarely"] += 1
+        return values[0] % 10 == 0
+
+    conjunction = ODRL_Evaluator.ordered_conditions([always, rarely], [1, 1], False)
+    disjunction = ODRL_Evaluator.ordered_conditions([rarely, always], [1, 1], True)
+
+    results = [conjunction([i]) for i in range(5000)]
+
+    if results == [i % 10 == 0 for i in range(5000)]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append("Reordered conjunction gave a different result")
+
+    # once the rarely holding condition comes first, the other one is only checked when it holds
+    if calls["always"] < 1500:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"Conjunction checked the condition that always holds {calls['always']} times out of 5000")
+
+    calls["rarely"] = 0
+    results = [disjunction([i]) for i in range(5000)]
+
+    if all(results) and calls["rarely"] < 1500:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"Disjunction checked the condition that rarely holds {calls['rarely']} times out of 5000")
+
+
+def run_fail_fast_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # The fail-fast check agrees with the full evaluation and stops at the first violating row
+    for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases():
+        result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), FEATURE_TYPE_MAP)
+        validity, witness = ODRL_Evaluator.evaluate_ODRL_validity_on_dataframe(copy.deepcopy(policy), df.copy(), FEATURE_TYPE_MAP)
+
+        violating_rows = set(result[2]) | set(result[3])
+        ordered = df.copy()
+        if ODRL_Evaluator.DT_COL in ordered.columns:
+            ordered[ODRL_Evaluator.DT_COL] = pd.to_datetime(ordered[ODRL_Evaluator.DT_COL], errors="coerce", utc=True)
+            ordered = ordered.sort_values(by=ODRL_Evaluator.DT_COL)
+        first_row = next((idx for idx in ordered.index if idx in violating_rows), None)
+
+        if validity != result[1]:
+            tests_failed += 1
+            test_log.append(f"Fail-fast validity {validity} differs from {result[1]} on {name}")
+        elif (witness is None) != (validity == 1) or (witness is not None and witness["row"] != first_row):
+            tests_failed += 1
+            test_log.append(f"Fail-fast witness {witness} on {name} does not point to the first violating row {first_row}")
+        else:
+            tests_passed += 1
+
+
+def run_pdp_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # Decisions leave the state untouched, and recording every row gives the evaluation of the SotW
+    for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases():
+        ordered = df.copy()
+        if ODRL_Evaluator.DT_COL in ordered.columns:
+            times = pd.to_datetime(ordered[ODRL_Evaluator.DT_COL], errors="coerce", utc=True)
+            ordered = ordered.iloc[times.argsort(kind="mergesort")].reset_index(drop=True)
+
+        result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), ordered.copy(), FEATURE_TYPE_MAP)
+        pdp = ODRL_Evaluator.PolicyDecisionPoint(copy.deepcopy(policy), FEATURE_TYPE_MAP, columns=list(ordered.columns))
+
+        mismatches = 0
+        for request in ordered.to_dict("records"):
+            decision = pdp.decide(request)
+            if decision != pdp.decide(request, update_state=True):
+                mismatches += 1
+
+        pdp_result = ODRL_Evaluator.evaluation_result(pdp.evaluation_state)
+
+        if mismatches:
+            tests_failed += 1
+            test_log.append(f"PolicyDecisionPoint decided {mismatches} requests of {name} differently when recording them")
+        elif pdp_result[1] != result[1] or pdp_result[2] != result[2] or pdp_result[3] != result[3]:
+            tests_failed += 1
+            test_log.append(f"PolicyDecisionPoint state after the requests of {name} differs from the SotW evaluation")
+        else:
+            tests_passed += 1
+
+    # A decision without update_state does not change the evaluation state
+    pdp = ODRL_Evaluator.PolicyDecisionPoint.from_file("example_policies/example_valid3.ttl")
+    state_before = json.dumps(pdp.evaluation_state, sort_keys=True, default=str)
+    pdp.decide({ODRL_Evaluator.DT_COL: "2024-01-01T00:00:00Z"})
+    if json.dumps(pdp.evaluation_state, sort_keys=True, default=str) == state_before:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append("PolicyDecisionPoint.decide updated the evaluation state without update_state")
+
+    # Missing cells are told apart without pandas, as pd.isna would
+    cells = [None, float("nan"), np.nan, pd.NaT, pd.NA, np.datetime64("NaT"), "", "a", 0, 1.5, False,
+             pd.Timestamp("2026-01-01", tz="UTC"), np.datetime64("2026-01-01")]
+    if [ODRL_Evaluator.is_missing_cell(cell) for cell in cells] == [bool(pd.isna(cell)) or cell == "" for cell in cells]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append("is_missing_cell differs from pd.isna")
+
+    # Requests in any time order are only checked against the rules of their period, without pd.isna
+    O = "http://www.w3.org/ns/odrl/2/"
+    DT = ODRL_Evaluator.DT_COL
+    policy = {
+        "policy_iri": "http://example.com/policy:periods",
+        "permissions": [
+            {"conditions": [[O + "Action", O + "eq", O + "use"], [DT, O + "gteq", f"2026-0{month}-01T00:00:00Z"],
+                            [DT, O + "lt", f"2026-0{month + 1}-01T00:00:00Z"], [O + "purpose", O + "eq", "research"]]}
+            for month in range(1, 7)
+        ],
+        "prohibitions": [],
+        "obligations": [],
+    }
+    pdp = ODRL_Evaluator.PolicyDecisionPoint(policy, {DT: "http://www.w3.org/2001/XMLSchema#dateTime"})
+    checked = []
+    for kind, node in pdp.network["rule_index"]["nodes"]:
+        node["match"] = (lambda match, start: lambda values: checked.append(start[:7]) or match(values))(
+            node["match"], node["state"]["conditions"][1][2])
+
+    requests = [("2026-05-10T00:00:00Z", "research"), ("2026-02-20T00:00:00Z", "research"),
+                ("2026-08-01T00:00:00Z", "research"), ("2026-02-10T00:00:00Z", "teaching")]
+    isna = pd.isna
+    isna_calls = []
+    pd.isna = lambda value: isna_calls.append(value) or isna(value)
+    try:
+        decisions = [pdp.decide({DT: t, O + "Action": O + "use", O + "purpose": purpose}) for t, purpose in requests]
+    finally:
+        pd.isna = isna
+
+    if decisions == ["permit", "permit", "deny", "deny"] and checked == ["2026-05", "2026-02", "2026-02"] and not isna_calls:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"PolicyDecisionPoint decided {decisions} checking the rules {checked}, "
+                        f"with {len(isna_calls)} calls to pd.isna")
+
+
+def run_compact_state_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases():
+        # Rule ids and the policy hash do not depend on the order in which the rules were extracted
+        reordered = copy.deepcopy(policy)
+        for key in ["permissions", "prohibitions", "obligations"]:
+            reordered[key] = list(reversed(reordered.get(key, [])))
+        state = ODRL_Evaluator.initialise_evaluation_state(policy)
+        reordered_state = ODRL_Evaluator.initialise_evaluation_state(reordered)
+        ids = sorted(rule["rule_id"] for rule in ODRL_Evaluator.rule_states_in_order(state))
+        reordered_ids = sorted(rule["rule_id"] for rule in ODRL_Evaluator.rule_states_in_order(reordered_state))
+
+        if ids != reordered_ids or ODRL_Evaluator.policy_hash(state) != ODRL_Evaluator.policy_hash(reordered_state):
+            tests_failed += 1
+            test_log.append(f"Rule ids of {name} depend on the order of the rules")
+        else:
+            tests_passed += 1
+
+        if len(df) < 2:
+            continue
+
+        # Resuming from the compact state serialised as JSON gives the same result as from the full state
+        parts = [df.iloc[:len(df) // 2], df.iloc[len(df) // 2:]]
+        full_state = None
+        compact_state = None
+        for part in parts:
+            full_result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), part.copy(), FEATURE_TYPE_MAP, full_state)
+            compact_result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), part.copy(), FEATURE_TYPE_MAP, compact_state)
+            full_state = json.loads(json.dumps(full_result[0], default=ODRL_Evaluator.state_json_default))
+            compact_state = json.dumps(ODRL_Evaluator.compact_evaluation_state(compact_result[0]), default=str)
+
+        if (
+                full_result[1:4] != compact_result[1:4]
+                or [len(r) for r in full_result[4:]] != [len(r) for r in compact_result[4:]]
+                or ODRL_Evaluator.compact_evaluation_state(full_result[0])["rules"].keys()
+                != ODRL_Evaluator.compact_evaluation_state(compact_result[0])["rules"].keys()
+        ):
+            tests_failed += 1
+            test_log.append(f"Evaluation of {name} resumed from the compact state differs from the full state")
+        else:
+            tests_passed += 1
+
+
+def run_checkpoint_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name, policy, FEATURE_TYPE_MAP, df, _ in load_folder_evaluation_cases():
+            if len(df) < 2:
+                continue
+
+            state_file = os.path.join(folder, os.path.basename(name) + ".ckpt")
+            half = len(df) // 2
+
+            # Checkpoint after every row, then resume a new session from the file
+            session = ODRL_Evaluator.EvaluationSession(copy.deepcopy(policy), FEATURE_TYPE_MAP)
+            for start in range(half):
+                session.evaluate(df.iloc[start:start + 1].copy())
+                session.checkpoint(state_file)
+
+            resumed = ODRL_Evaluator.EvaluationSession(
+                copy.deepcopy(policy), FEATURE_TYPE_MAP, ODRL_Evaluator.read_state_file(state_file)
+            )
+            session.evaluate(df.iloc[half:].copy())
+            resumed.evaluate(df.iloc[half:].copy())
+
+            expected = ODRL_Evaluator.compact_evaluation_state(session.evaluation_state, iso_times=False)
+            actual = ODRL_Evaluator.compact_evaluation_state(resumed.evaluation_state, iso_times=False)
+
+            if expected != actual or session.result()[1] != resumed.result()[1]:
+                tests_failed += 1
+                test_log.append(f"Evaluation of {name} resumed from a binary checkpoint differs from the uninterrupted one")
+            else:
+                tests_passed += 1
+
+            # A delta record torn by a crash is ignored, the checkpoint before it is read back
+            session.checkpoint(state_file)
+            before = evaluation_checkpoint.read_checkpoint(state_file)
+            session.evaluate(df.iloc[:1].copy())
+            session.checkpoint(state_file)
+
+            with open(state_file, "rb") as f:
+                data = f.read()
+            with open(state_file, "wb") as f:
+                f.write(data[:-2])
+
+            if evaluation_checkpoint.read_checkpoint(state_file) == before:
+                tests_passed += 1
+            else:
+                tests_failed += 1
+                test_log.append(f"Torn checkpoint record of {name} was not ignored")
+
+
+def run_window_count_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    O = "http://www.w3.org/ns/odrl/2/"
+
+    # Within the window of an hour the limit holds, in total it does not
+    graph = rdflib.Graph().parse("test_cases/evaluation/valid/count_window1.ttl", format="turtle")
+    policy = extract_rule_list_from_policy(graph)[0]
+    FEATURE_TYPE_MAP = {f["iri"]: f["type"] for f in extract_features_list_from_policy(graph)}
+    df = pd.read_csv("test_cases/evaluation/valid/count_window1.csv")
+
+    cumulative = copy.deepcopy(policy)
+    for p in cumulative["permissions"]:
+        p["conditions"] = [[O + "count", op, right] if ODRL_Evaluator.is_count_operand(left) else [left, op, right]
+                           for left, op, right in p["conditions"]]
+
+    windowed = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), FEATURE_TYPE_MAP)
+    total = ODRL_Evaluator.evaluate_ODRL_on_dataframe(cumulative, df.copy(), FEATURE_TYPE_MAP)
+
+    if windowed[1] == 1 and total[1] == 0:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append("Count constraint with a duration unit was not evaluated over a sliding window")
+
+    # Matches older than the window no longer count
+    policy = {
+        "policy_iri": "http://example.com/policy:window",
+        "permissions": [{"conditions": [[O + "Action", O + "eq", O + "use"], [O + "count PT1H", O + "lt", "2"]]}],
+        "prohibitions": [],
+        "obligations": [],
+    }
+    pdp = ODRL_Evaluator.PolicyDecisionPoint(policy, {ODRL_Evaluator.DT_COL: "http://www.w3.org/2001/XMLSchema#dateTime"})
+    times = ["2024-01-01T10:00:00Z", "2024-01-01T10:20:00Z", "2024-01-01T10:40:00Z", "2024-01-01T11:30:00Z"]
+    decisions = [pdp.decide({ODRL_Evaluator.DT_COL: t, O + "Action": O + "use"}, update_state=True) for t in times]
+
+    if decisions == ["permit", "permit", "deny", "permit"]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"Sliding window count decisions {decisions} are not permit, permit, deny, permit")
+
+    # A match at the trailing edge of the window is counted until the bucket holding it leaves the
+    # window, i.e. up to one bucket (1/64 of the window) early
+    policy["permissions"][0]["conditions"][1] = [O + "count PT64S", O + "lt", "1"]
+    pdp = ODRL_Evaluator.PolicyDecisionPoint(policy, {ODRL_Evaluator.DT_COL: "http://www.w3.org/2001/XMLSchema#dateTime"})
+    pdp.decide({ODRL_Evaluator.DT_COL: "2024-01-01T10:00:00.500Z", O + "Action": O + "use"}, update_state=True)
+    times = ["2024-01-01T10:01:03.900Z", "2024-01-01T10:01:04.200Z", "2024-01-01T10:01:04.600Z"]
+    decisions = [pdp.decide({ODRL_Evaluator.DT_COL: t, O + "Action": O + "use"}) for t in times]
+
+    if decisions == ["deny", "permit", "permit"]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"Decisions {decisions} at the edge of a sliding window are not deny, permit, permit")
+
+
+def run_set_operator_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    O = "http://www.w3.org/ns/odrl/2/"
+
+    # RDF lists as right operands are extracted as sets
+    graph = rdflib.Graph().parse("test_cases/evaluation/valid/set_operator1.ttl", format="turtle")
+    conditions = extract_rule_list_from_policy(graph)[0]["permissions"][0]["conditions"]
+    purposes = [right for left, op, right in conditions if op == O + "isAnyOf"]
+
+    if purposes == [frozenset({"http://example.com/purpose:research", "http://example.com/purpose:education",
+                               "http://example.com/purpose:archiving"})]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append(f"RDF list right operand of isAnyOf was extracted as {purposes}")
+
+    # Cells with several values, numbers compared as numbers and missing cells, in every engine
+    df = pd.DataFrame({"tags": ["a b", "b", "a b c", "1.0", "", None, "c", "1 b a"]})
+    expected = {
+        "isAnyOf": [True, True, True, True, False, False, False, True],
+        "isNoneOf": [False, False, False, False, False, False, True, False],
+        "hasPart": [False, False, False, False, False, False, False, True],
+        "isPartOf": [True, True, False, True, False, False, False, True],
+        "isAllOf": [False, False, False, False, False, False, False, True],
+    }
+    right = frozenset({"a", "b", "1"})
+
+    for name, allowed in expected.items():
+        policy = {
+            "policy_iri": "http://example.com/policy:sets",
+            "permissions": [{"conditions": [["tags", O + name, right]]}],
+            "prohibitions": [],
+            "obligations": [],
+        }
+        violating = [i for i, ok in enumerate(allowed) if not ok]
+
+        for engine in ODRL_Evaluator.ENGINES:
+            result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), {}, engine=engine)
+            if sorted(result[2]) == violating:
+                tests_passed += 1
+            else:
+                tests_failed += 1
+                test_log.append(f"{name} with the {engine} engine gave violating rows {result[2]}, expected {violating}")
+
+    # Counts are numbers, a set operator on odrl:count never holds
+    policy = {
+        "policy_iri": "http://example.com/policy:sets",
+        "permissions": [{"conditions": [[O + "count", O + "hasPart", "0"]]}],
+        "prohibitions": [],
+        "obligations": [],
+    }
+    for engine in ODRL_Evaluator.ENGINES:
+        result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), {}, engine=engine)
+        if sorted(result[2]) == list(range(len(df))):
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Set operator on odrl:count held with the {engine} engine")
+
+    # The rule ids of set operands do not depend on the order in which the set prints
+    rule = {"conditions": [["tags", O + "isAnyOf", frozenset(["b", "a", "c"])]]}
+    reordered = {"conditions": [["tags", O + "isAnyOf", ["c", "a", "b"]]]}
+
+    if ODRL_Evaluator.rule_content_hash("permission", rule) == ODRL_Evaluator.rule_content_hash("permission", reordered):
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append("Rule id of a set operand depends on the order of its values")
+
+
+def run_time_index_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    O = "http://www.w3.org/ns/odrl/2/"
+    DT = ODRL_Evaluator.DT_COL
+
+    # A SotW already in time order is not sorted again, rows without a dateTime go last
+    times = pd.to_datetime(pd.Series(["2024-01-01T10:00:00Z", "2024-01-01T11:00:00Z", None]), utc=True)
+    ordered = pd.DataFrame({DT: times})
+    shuffled = ordered.iloc[[2, 1, 0]]
+
+    if ODRL_Evaluator.sort_by_time(ordered) is ordered and list(ODRL_Evaluator.sort_by_time(shuffled).index) == [0, 1, 2]:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append("sort_by_time sorted a SotW already in time order, or did not sort a shuffled one")
+
+    # Time bounded rules give the same result with the time index as without it
+    base = pd.Timestamp("2024-01-01", tz="UTC")
+    rows = [str(base + pd.Timedelta(minutes=7 * i)) for i in range(200)] + [None, "garbage"]
+    df = pd.DataFrame({DT: rows, O + "Action": [O + ("read" if i % 3 else "use") for i in range(len(rows))]})
+    bounds = [base + pd.Timedelta(minutes=m) for m in (0, 70, 350, 700, 1400)]
+    policy = {
+        "policy_iri": "http://example.com/policy:times",
+        "permissions": [
+            {"conditions": [[DT, O + "gteq", bounds[0].isoformat()], [DT, O + "lt", bounds[2].isoformat()]]},
+            {"conditions": [[DT, O + "gt", bounds[1].isoformat()], [DT, O + "lteq", bounds[3].isoformat()],
+                            [O + "Action", O + "eq", O + "read"]]},
+            {"conditions": [[DT, O + "eq", bounds[4].isoformat()]]},
+            {"conditions": [[O + "Action", O + "eq", O + "use"], [DT, O + "gt", bounds[3].isoformat()]]},
+        ],
+        "prohibitions": [{"conditions": [[DT, O + "gteq", bounds[2].isoformat()], [DT, O + "lt", bounds[3].isoformat()]]}],
+        "obligations": [],
+    }
+
+    network = ODRL_Evaluator.build_matching_network(
+        ODRL_Evaluator.initialise_evaluation_state(policy), df.columns, {}
+    )
+    expected = None
+
+    for engine in ODRL_Evaluator.ENGINES:
+        result = ODRL_Evaluator.evaluate_ODRL_on_dataframe(copy.deepcopy(policy), df.copy(), {}, engine=engine)
+        outcome = (result[1], sorted(result[2]), sorted(result[3]))
+        expected = expected or outcome
+
+        if outcome == expected and network["rule_index"]["time_index"] is not None:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Time bounded rules with the {engine} engine gave {outcome}, expected {expected}")
+
+    # Same result row by row, without the time index
+    state = ODRL_Evaluator.initialise_evaluation_state(copy.deepcopy(policy))
+    network = ODRL_Evaluator.build_matching_network(state, df.columns, {})
+    network["rule_index"]["time_index"] = None
+    ordered = df.assign(**{DT: pd.to_datetime(df[DT], errors="coerce", utc=True)})
+    ordered = ODRL_Evaluator.sort_by_time(ordered)
+    validity = min([1] + [ODRL_Evaluator.match_event(network, state, idx, values)
+                          for idx, values in zip(ordered.index, ordered.to_numpy())])
+
+    if (validity, sorted(state["rows_violating_permissions"]), sorted(state["rows_violating_prohibitions"])) == expected:
+        tests_passed += 1
+    else:
+        tests_failed += 1
+        test_log.append("Time bounded rules gave a different result without the time index")
+
+
+def run_format_detection_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    with open("example_policies/example_valid2.ttl", "rb") as f:
+        turtle = f.read()
+    graph = rdflib.Graph().parse(data=turtle, format="turtle")
+
+    documents = [
+        (turtle, None, "turtle"),
+        (b"# a comment\n\n" + turtle, None, "turtle"),
+        (graph.serialize(format="nt").encode("utf-8"), None, "turtle"),
+        (graph.serialize(format="nt").encode("utf-8"), "policy.nt", "nt"),
+        (graph.serialize(format="xml").encode("utf-8"), "policy.ttl", "xml"),
+        (graph.serialize(format="json-ld").encode("utf-8"), None, "json-ld"),
+        (b"\xef\xbb\xbf" + turtle, None, "turtle"),
+        (turtle.decode("utf-8").encode("utf-16"), None, "turtle"),
+        (b"not rdf", "policy.ttl", "turtle"),
+        (b"not rdf", None, None),
+    ]
+
+    for data, file_path, expected in documents:
+        detected = rdf_utils.detect_rdf_format(data[:rdf_utils.SNIFF_BYTES], file_path)
+        if detected == expected:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(f"Format of {data[:20]!r} ({file_path}) detected as {detected}, expected {expected}")
+
+    # Documents with a byte order mark are parsed in the detected format
+    with tempfile.TemporaryDirectory() as directory:
+        for name, data in [("utf8_bom.ttl", b"\xef\xbb\xbf" + turtle), ("utf16.ttl", turtle.decode("utf-8").encode("utf-16"))]:
+            path = os.path.join(directory, name)
+            with open(path, "wb") as f:
+                f.write(data)
+
+            loaded = rdf_utils.load(path)
+            parsed = rdf_utils.parse_string_to_graph(data)
+
+            if (
+                    loaded is not None and parsed is not None
+                    and isomorphic(loaded[0], graph) and isomorphic(parsed[0], graph)
+            ):
+                tests_passed += 1
+            else:
+                tests_failed += 1
+                test_log.append(f"Policy saved as {name} was not loaded")
+
+
+def run_joint_extraction_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    policy = """
+    @prefix odrl: <http://www.w3.org/ns/odrl/2/> .
+    @prefix ex: <http://example.com/> .
+
+    ex:policy a odrl:Set ;
+      odrl:target ex:asset ;
+      odrl:permission [
+        odrl:assignee ex:alice ;
+        odrl:action [ rdf:value odrl:print ; odrl:refinement [ odrl:leftOperand odrl:resolution ; odrl:operator odrl:lteq ; odrl:rightOperand 1200 ] ] ;
+        odrl:constraint [ odrl:and (
+          [ odrl:leftOperand ex:age ; odrl:operator odrl:gt ; odrl:rightOperand 18 ]
+          [ odrl:leftOperand odrl:purpose ; odrl:operator odrl:isAnyOf ; odrl:rightOperand ( ex:research ex:education ) ]
+        ) ] ;
+        odrl:duty [ odrl:action odrl:compensate ; odrl:consequence [ odrl:action odrl:inform ] ]
+      ] ;
+      odrl:prohibition [ odrl:action odrl:delete ; odrl:constraint [ odrl:or _:loop ] ] .
+
+    _:loop rdf:first [ odrl:leftOperand ex:media ; odrl:operator odrl:eq ; odrl:rightOperand "online" ] ;
+      rdf:rest _:loop .
+    """
+    graph = rdflib.Graph().parse(
+        data="@prefix rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#> .\n" + policy, format="turtle"
+    )
+
+    policies, features = rdf_utils.extract_rules_and_features_from_policy(graph)
+    odrl = "http://www.w3.org/ns/odrl/2/"
+    permission = policies[0]["permissions"][0]
+    permission_node = graph.value(rdflib.URIRef("http://example.com/policy"), rdf_utils.ODRL.permission)
+    prohibition_node = graph.value(rdflib.URIRef("http://example.com/policy"), rdf_utils.ODRL.prohibition)
+    lazy_index = rdf_utils.graph_policy_index(graph)
+
+    expected_conditions = [
+        [odrl + "Party", odrl + "eq", "http://example.com/alice"],
+        [odrl + "Action", odrl + "eq", odrl + "print"],
+        [odrl + "Action " + odrl + "resolution", odrl + "lteq", "1200"],
+        [odrl + "Asset", odrl + "eq", "http://example.com/asset"],
+        [odrl + "and", [
+            ["http://example.com/age", odrl + "gt", "18"],
+            [odrl + "purpose", odrl + "isAnyOf", frozenset({"http://example.com/research", "http://example.com/education"})],
+        ]],
+    ]
+    checks = [
+        (permission["conditions"] == expected_conditions, f"Unexpected conditions {permission['conditions']}"),
+        (permission["duties"][0]["consequences"][0]["conditions"][0] == [odrl + "Action", odrl + "eq", odrl + "inform"],
+         "Consequence of a duty not extracted"),
+        # the logic constraint on a list whose rdf:rest loops back has no operands
+        ([odrl + "or", []] in policies[0]["prohibitions"][0]["conditions"], "Recursive RDF list not ignored"),
+        ([f["iri"] for f in features] == sorted(
+            [f["iri"] for f in rdf_utils.base_features]
+            + [odrl + "Action " + odrl + "resolution", "http://example.com/age", odrl + "purpose", "http://example.com/media"]
+        ), f"Unexpected features {features}"),
+        ((policies, features) == (extract_rule_list_from_policy(graph), extract_features_list_from_policy(graph)),
+         "Joint extraction differs from the separate extractions"),
+        # a single rule extracted without an index only reads the part of the graph reachable from it
+        (rdf_utils.extract_rule_list(graph, permission_node, policy_target="http://example.com/asset",
+                                     index=lazy_index) == expected_conditions,
+         "Rule extracted from the graph differs from the joint extraction"),
+        (not any(prohibition_node in edges.edges for edges in lazy_index["objects"].values()),
+         "Extraction of a single rule read the edges of another rule"),
+    ]
+
+    for passed, message in checks:
+        if passed:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(message)
+
+
+def run_parallel_extraction_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    # the policies of the evaluation tests gathered in one graph
+    graph = rdflib.Graph()
+    for folder in ["test_cases/evaluation/valid", "test_cases/evaluation/invalid"]:
+        for file_name in sorted(os.listdir(folder)):
+            if file_name.endswith(".ttl"):
+                graph += rdf_utils.load(os.path.join(folder, file_name))[0]
+
+    policies, features = rdf_utils.extract_rules_and_features_from_policy(graph)
+    expected = (sorted(policies, key=lambda p: p["policy_iri"]), features)
+
+    min_policies = rdf_utils.PARALLEL_MIN_POLICIES_PER_CHUNK
+    rdf_utils.PARALLEL_MIN_POLICIES_PER_CHUNK = 1
+    try:
+        for processes in [1, 3]:
+            if rdf_utils.extract_rules_and_features_from_policy(graph, processes=processes) == expected:
+                tests_passed += 1
+            else:
+                tests_failed += 1
+                test_log.append(f"Extraction with {processes} processes differs from the single process one")
+    finally:
+        rdf_utils.PARALLEL_MIN_POLICIES_PER_CHUNK = min_policies
+
+
+def run_policy_cache_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    def check(condition, message):
+        global tests_passed
+        global tests_failed
+        if condition:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(message)
+
+    with open("example_policies/example_valid2.ttl", "r") as f:
+        turtle = f.read()
+
+    cache = policy_cache.PolicyCache()
+    first = cache.from_string(turtle)
+    second = cache.from_string(turtle.encode("utf-8"))
+    check(first is second and cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1,
+          f"Policy text was not served from the cache: {cache.stats()}")
+    check(first["policies"] == extract_rule_list_from_policy(first["graph"]),
+          "Cached rules differ from the rules of the cached graph")
+
+    # Policies that cannot be parsed are not cached
+    try:
+        cache.from_string("not rdf")
+        check(False, "A policy that cannot be parsed was cached")
+    except ValueError:
+        check(cache.stats()["entries"] == 1, "A policy that cannot be parsed was cached")
+
+    # The least recently used policies are evicted when the cache is full
+    small = policy_cache.PolicyCache(max_bytes=int(first["size"] * 2.5))
+    texts = [turtle + f"\n# copy {i}\n" for i in range(3)]
+    for text in texts:
+        small.from_string(text)
+    small.from_string(texts[1])
+    small.from_string(turtle)
+    check(small.stats()["evictions"] == 2 and small.stats()["entries"] == 2,
+          f"Unexpected evictions: {small.stats()}")
+    small.from_string(texts[1])
+    check(small.stats()["hits"] == 2, f"The most recently used policy was evicted: {small.stats()}")
+
+    # A policy file is parsed again when it changes
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "policy.ttl")
+        with open(path, "w") as f:
+            f.write(turtle)
+        cache = policy_cache.PolicyCache()
+        first = cache.from_file(path)
+        check(cache.from_file(path) is first, "Unchanged policy file was parsed again")
+
+        with open(path, "w") as f:
+            f.write(turtle.replace("example_valid2", "example_valid2_changed") + "\n")
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+        check(cache.from_file(path) is not first and cache.stats()["misses"] == 2,
+              "Changed policy file was served from the cache")
+
+    # Evaluations of a cached policy do not change the cached rules
+    with open("test_cases/evaluation/valid/set_operator1.ttl", "r") as f:
+        policy_text = f.read()
+    with open("test_cases/evaluation/valid/set_operator1.csv", "r") as f:
+        sotw_csv = f.read()
+
+    results = [ODRL_Evaluator.evaluate_ODRL_from_strings(policy_text, sotw_csv)[1] for _ in range(2)]
+    check(results == [1, 1], f"Evaluations of a cached policy gave {results}")
+    check(policy_cache.cached_policy_from_string(policy_text)["policies"]
+          == extract_rule_list_from_policy(rdf_utils.parse_string_to_graph(policy_text)[0]),
+          "Evaluations changed the cached rules")
+
+    # Changing the rules of an evaluation state built from a cached entry leaves the entry as it was
+    cache = policy_cache.PolicyCache()
+    entry = cache.from_string(policy_text)
+    expected = copy.deepcopy(entry["policies"])
+    evaluation_state = ODRL_Evaluator.load_evaluation_state(None, entry["policies"])
+    for rule in evaluation_state["permissions"] + evaluation_state["prohibitions"] + evaluation_state["obligations"]:
+        rule["conditions"].append(["http://example.com/feature", "http://www.w3.org/ns/odrl/2/eq", "changed"])
+        rule["conditions"][0][2] = "changed"
+    check(cache.from_string(policy_text)["policies"] == expected and cache.stats()["hits"] == 1,
+          "Changing the rules of an evaluation state changed the cached rules")
+
+
+def run_jsonld_fast_path_tests():
+    global tests_passed
+    global tests_failed
+    global test_log
+
+    def check(condition, message):
+        global tests_passed
+        global tests_failed
+        if condition:
+            tests_passed += 1
+        else:
+            tests_failed += 1
+            test_log.append(message)
+
+    def with_context(text, context):
+        # the document with the ODRL context replaced by the given one
+        document = json.loads(text)
+        sources = document["@context"] if isinstance(document["@context"], list) else [document["@context"]]
+        document["@context"] = [context if source in rdf_utils.ODRL_CONTEXT_URLS else source for source in sources]
+        return json.dumps(document)
+
+    def comparable(extracted):
+        # blank node policies are named differently by each parse
+        policies, features = extracted
+        policies = [dict(p, policy_iri=p["policy_iri"] if ":" in p["policy_iri"] else "_") for p in policies]
+        return sorted(policies, key=lambda p: json.dumps(p, sort_keys=True, default=sorted)), features
+
+    def extracted_by_rdflib(text):
+        graph = rdflib.Graph().parse(data=text, format="json-ld")
+        return comparable(rdf_utils.extract_rules_and_features_from_policy(graph))
+
+    # rdflib reads the ODRL context from the same file as the fast path
+    with urllib.request.urlopen(rdf_utils.ODRL_CONTEXT_URLS[0]) as response, open(rdf_utils.ODRL_CONTEXT_FILE, "rb") as f:
+        check(response.read() == f.read(), "rdflib does not read the ODRL context from ODRL/odrl.jsonld")
+
+    # Every JSON-LD policy of the test cases, and policies with the coerced terms of the context
+    documents = {}
+    for folder, _, file_names in sorted(os.walk("test_cases")):
+        for file_name in sorted(file_names):
+            if file_name.endswith(".jsonld"):
+                with open(os.path.join(folder, file_name), "r") as f:
+                    documents[os.path.join(folder, file_name)] = f.read()
+
+    coerced = {
+        "unit": {"leftOperand": "payAmount", "operator": "eq",
+                 "rightOperand": {"@value": "10.00", "@type": "xsd:decimal"}, "unit": "http://dbpedia.org/resource/Euro"},
+        "dataType": {"leftOperand": "dateTime", "operator": "lt", "rightOperand": "2026-01-01", "dataType": "xsd:date"},
+        "rightOperand IRI": {"leftOperand": "purpose", "operator": "eq", "rightOperand": "http://example.com/research"},
+        "rightOperand node": {"leftOperand": "purpose", "operator": "isAnyOf",
+                              "rightOperand": [{"@id": "http://example.com/research"}, "ex:teaching"]},
+    }
+    for name, constraint in coerced.items():
+        documents[name] = json.dumps({
+            "@context": ["http://www.w3.org/ns/odrl.jsonld", {"ex": "http://example.com/"}],
+            "@type": "Set", "uid": "http://example.com/policy",
+            "permission": [{"target": {"@type": "AssetCollection", "source": "http://example.com/assets"},
+                            "assignee": {"@type": "PartyCollection", "source": "ex:parties"},
+                            "action": {"rdf:value": {"@id": "odrl:use"}, "refinement": [constraint]},
+                            "constraint": [constraint]}],
+        })
+
+    # Same rules and features as rdflib
+    read = {}
+    for name, text in documents.items():
+        extracted = rdf_utils.extract_rules_and_features_from_jsonld(text)
+        if extracted is None:
+            continue
+        read[name] = comparable(extracted)
+        check(read[name] == extracted_by_rdflib(text), f"JSON-LD fast path differs from rdflib on {name}")
+    check(len(read) >= 30 and all(name in read for name in coerced),
+          f"Only {sorted(read)} were read without rdflib")
+
+    # Same rules and features as rdflib with the W3C ODRL context, when it can be fetched
+    try:
+        with urllib.request.build_opener().open(rdf_utils.ODRL_CONTEXT_URLS[1], timeout=30) as response:
+            w3c_context = json.load(response)["@context"]
+    except Exception as e:
+        check(False, f"The W3C ODRL context could not be fetched to compare the JSON-LD fast path with it: {e}")
+    else:
+        for name, extracted in read.items():
+            check(extracted == extracted_by_rdflib(with_context(documents[name], w3c_context)),
+                  f"JSON-LD fast path differs from rdflib with the W3C ODRL context on {name}")
+
+    # Documents outside the standard shape are left to rdflib
+    for document in [
+        '[{"@id": "http://example.com/policy"}]',
+        '{"@context": "http://example.com/context.jsonld", "uid": "http://example.com/policy"}',
+        '{"@context": "http://www.w3.org/ns/odrl.jsonld", "uid": "policy", "permission": {"action": "use"}}',
+        '{"@context": "http://www.w3.org/ns/odrl.jsonld", "uid": "http://example.com/policy", '
+        '"permission": {"action": "use", "constraint": {"leftOperand": "hasStartTime", "operator": "eq", "rightOperand": 1}}}',
+        '{"@context": ["http://www.w3.org/ns/odrl.jsonld", {"permission": "http://example.com/"}], "uid": "http://example.com/policy"}',
+        '{"@context": "http://www.w3.org/ns/odrl.jsonld", "uid": "http://example.com/policy", "@reverse": {}}',
+        '{"@context": "http://www.w3.org/ns/odrl.jsonld", "uid": "http://example.com/policy", "summary": "Policy"}',
+        '{"@context": "http://www.w3.org/ns/odrl.jsonld", "uid": "http://example.com/policy", '
+        '"permission": {"target": "http://example.com/asset", "action": "runningTime"}}',
+        '{"uid": "http://example.com/policy", "@context": {"ex": "http://example.com/"}, "ex:a": 1, "permission": []}',
+        "@prefix odrl: <http://www.w3.org/ns/odrl/2/> .",
+    ]:
+        check(rdf_utils.extract_rules_and_features_from_jsonld(document) is None,
+              f"Non-standard JSON-LD was read without rdflib: {document}")
+
+    # The cache reads standard JSON-LD policies without rdflib
+    with open("test_cases/validation/valid_ODRL/odrl21.jsonld", "r") as f:
+        text = f.read()
+    entry = policy_cache.PolicyCache().from_string(text)
+    check(entry["graph"] is None and entry["format"] == "json-ld"
+          and entry["policies"] == rdf_utils.extract_rules_and_features_from_jsonld(text)[0],
+          "Standard JSON-LD policy was parsed with rdflib by the cache")
+
+
 def runTests(test_repetitions = 0):
     global tests_passed
     global tests_failed
@@ -425,6 +1735,75 @@ def runTests(test_repetitions = 0):
     # Folder-based evaluation tests
     run_folder_evaluation_tests()
 
+    # Row and vectorized engines agree
+    run_engine_equivalence_tests()
+
+    # Rule discrimination index
+    run_rule_index_tests()
+
+    # Columns converted once per type
+    run_typed_column_tests()
+
+    # Dictionary encoded IRI columns
+    run_iri_encoding_tests()
+
+    # Identical constraints evaluated once
+    run_shared_constraint_tests()
+
+    # Rules matched once per distinct row
+    run_deduplication_tests()
+
+    # Conditions checked in adaptive order
+    run_condition_ordering_tests()
+
+    # Validity only, stopping at the first violation
+    run_fail_fast_tests()
+
+    # Single access requests
+    run_pdp_tests()
+
+    # Compact evaluation state with content derived rule ids
+    run_compact_state_tests()
+
+    # Binary checkpoints with delta records
+    run_checkpoint_tests()
+
+    # odrl:count within a sliding time window
+    run_window_count_tests()
+
+    # isAnyOf, isNoneOf, hasPart, isPartOf and isAllOf
+    run_set_operator_tests()
+
+    # dateTime ranges of sorted rows
+    run_time_index_tests()
+
+    # RDF serialization detected before parsing
+    run_format_detection_tests()
+
+    # Rules and features extracted from one index of the graph
+    run_joint_extraction_tests()
+
+    # Policies of a graph extracted in a process pool
+    run_parallel_extraction_tests()
+
+    # Parsed policies served from the cache
+    run_policy_cache_tests()
+
+    # JSON-LD policies read without rdflib
+    run_jsonld_fast_path_tests()
+
+    # Event by event matching network
+    run_incremental_matcher_tests()
+
+    # In-memory streaming sessions
+    run_session_tests()
+
+    # SotW files larger than memory
+    run_out_of_core_tests()
+
+    # All the policies of a graph in one pass
+    run_multi_policy_tests()
+
     # PRINT SUMMARY
 
     print(f"\nTOTAL TESTS PASSED {tests_passed}/{tests_passed + tests_failed}")